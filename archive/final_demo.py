@@ -1,9 +1,15 @@
 
 import mlx.core as mx
-from mlx_lm import load, generate
+from mlx_lm import load
 import socket
 import time
 import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dist_utils import gather_results
+from generation import GenerationMetrics, generate_tokens
+from work_queue import open_work_queue
 
 def main():
     # Initialize distributed
@@ -45,42 +51,39 @@ def main():
         "What makes this distributed setup special?"
     ]
 
-    my_prompt = creative_prompts[rank % len(creative_prompts)]
+    server, queue = open_work_queue(creative_prompts, rank)
 
     if rank == 0:
         print(f"\n🎨 Generating creative responses...")
 
-    # Generate with timing
-    start = time.time()
-    response = generate(
-        model, 
-        tokenizer, 
-        my_prompt, 
-        max_tokens=80
-    )
-    gen_time = time.time() - start
-
-    # Calculate performance metrics
-    tokens = len(tokenizer.encode(response))
-    speed = tokens / gen_time if gen_time > 0 else 0
-
-    # Display results in synchronized order
-    for i in range(size):
-        mx.eval(mx.distributed.all_sum(mx.array([1.0])))  # Sync
-
-        if rank == i:
-            print(f"\n🌟 Process {rank} on {hostname}")
-            print(f"❓ Prompt: {my_prompt}")
-            print(f"🤖 Response: {response.strip()}")
-            print(f"⚡ Performance: {speed:.1f} tok/s ({gen_time:.2f}s, {tokens} tokens)")
-            print("-" * 50)
-
-    # Final synchronization and celebration
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    # Pull prompts from the shared queue until it is empty
+    results = []
+    for index, my_prompt in queue:
+        token_ids, metrics = generate_tokens(
+            model, 
+            tokenizer, 
+            my_prompt, 
+            max_tokens=80
+        )
+        results.append((index, token_ids, metrics.to_list()))
+    queue.close()
+
+    # One gather brings every process's tokens to rank 0 for display
+    gathered = gather_results(results, hostname)
+
+    if rank == 0:
+        for node, (node_host, node_results) in enumerate(gathered):
+            for index, token_ids, values in node_results:
+                print(f"\n🌟 Process {node} on {node_host}")
+                print(f"❓ Prompt: {creative_prompts[index]}")
+                print(f"🤖 Response: {tokenizer.decode(token_ids).strip()}")
+                print(f"⚡ Performance: {GenerationMetrics.from_list(values).summary()}")
+                print("-" * 50)
 
     if rank == 0:
+        server.close()
         print(f"\n🎉 SUCCESS! Distributed MLX inference complete!")
-        print(f"📈 Generated {size} unique responses across your Mac cluster")
+        print(f"📈 Generated {len(creative_prompts)} unique responses across your Mac cluster")
         print("✨ This demonstrates true distributed AI on Apple Silicon!")
         print("=" * 55)
 
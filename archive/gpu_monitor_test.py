@@ -1,20 +1,19 @@
 
 import mlx.core as mx
-from mlx_lm import load, generate
 import socket
-import time
-import subprocess
 import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dist_utils import barrier, gather_results
+from generation import GenerationMetrics, generate_tokens
+from memory_monitor import MemorySampler, gather_memory, memory_snapshot, print_memory_report
+from model_loader import load_host_shared
 
 def get_gpu_memory():
-    """Get current GPU memory usage"""
-    try:
-        # Use MLX's memory info
-        allocated = mx.metal.get_memory_info()["allocated"]
-        peak = mx.metal.get_memory_info()["peak"]
-        return allocated, peak
-    except:
-        return 0, 0
+    """(active, peak) bytes from memory_snapshot: MLX's counters, or peak RSS for both without them"""
+    _, active_mb, peak_mb, _ = memory_snapshot()
+    return active_mb * 1024 * 1024, peak_mb * 1024 * 1024
 
 def main():
     # Initialize distributed
@@ -32,29 +31,32 @@ def main():
         print(f"📊 Monitoring {size} processes")
 
     # Check initial GPU memory
-    initial_mem, initial_peak = get_gpu_memory()
+    initial_mem, _ = get_gpu_memory()
     print(f"[Rank {rank}@{hostname}] Initial GPU: {initial_mem/1024/1024:.1f}MB allocated")
 
     # Sync point
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("start")
 
     if rank == 0:
         print("\n📦 Loading model on all nodes (watch GPU usage)...")
 
-    # Load model and monitor memory
-    start_time = time.time()
-    model, tokenizer = load("mlx-community/Llama-3.2-1B-Instruct-4bit")
-    load_time = time.time() - start_time
+    # Load model (downloaded once per host); the sampler records the series
+    sampler = MemorySampler().start()
+    with sampler.phase("load"):
+        model, tokenizer, load_info = load_host_shared(hostname, rank)
+    load_time = load_info["load_time"]
 
     # Check post-load GPU memory
-    post_load_mem, post_load_peak = get_gpu_memory()
+    post_load_mem, _ = get_gpu_memory()
     model_mem = post_load_mem - initial_mem
 
-    print(f"[Rank {rank}@{hostname}] Model loaded in {load_time:.2f}s")
+    print(f"[Rank {rank}@{hostname}] Model loaded in {load_time:.2f}s as host {load_info['role']} "
+          f"({load_info['wait_time']:.2f}s of it waiting for the host leader, "
+          f"{load_info['disk_reads']} disk block reads)")
     print(f"[Rank {rank}@{hostname}] GPU Memory: {post_load_mem/1024/1024:.1f}MB (+{model_mem/1024/1024:.1f}MB for model)")
 
     # Sync after loading
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("load")
 
     # Generate inference and monitor GPU during generation
     prompt = f"What is the role of process {rank} in distributed computing?"
@@ -64,43 +66,35 @@ def main():
         print("Monitor GPU usage during generation:")
 
     # Sync before generation
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("generate")
 
     # Generate with memory monitoring
-    pre_gen_mem, _ = get_gpu_memory()
-    start_time = time.time()
-
-    response = generate(
+    token_ids, metrics = generate_tokens(
         model, 
         tokenizer, 
         prompt, 
         max_tokens=50
     )
 
-    gen_time = time.time() - start_time
     post_gen_mem, peak_mem = get_gpu_memory()
 
-    # Calculate metrics
-    tokens = len(tokenizer.encode(response))
-    speed = tokens / gen_time if gen_time > 0 else 0
-    gen_mem_used = post_gen_mem - pre_gen_mem
-
-    # Display results in order
-    for i in range(size):
-        mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    # Gather results and GPU numbers on rank 0 for display
+    values = [post_gen_mem / 1024 / 1024, peak_mem / 1024 / 1024] + metrics.to_list()
+    gathered = gather_results([(rank, token_ids, values)], hostname)
+    memory = gather_memory(sampler.stop(), hostname, rank)
 
-        if rank == i:
-            print(f"\n🤖 Process {rank} on {hostname}:")
-            print(f"  📝 Prompt: {prompt}")
-            print(f"  💬 Response: {response.strip()}")
-            print(f"  🖥️  GPU Memory: {post_gen_mem/1024/1024:.1f}MB (peak: {peak_mem/1024/1024:.1f}MB)")
-            print(f"  ⚡ Performance: {speed:.1f} tok/s ({gen_time:.2f}s)")
-            print("  " + "-" * 45)
-
-    # Final sync and GPU summary
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    if rank == 0:
+        for node, (node_host, node_results) in enumerate(gathered):
+            for _, node_tokens, (mem_mb, peak_mb, *values) in node_results:
+                print(f"\n🤖 Process {node} on {node_host}:")
+                print(f"  📝 Prompt: What is the role of process {node} in distributed computing?")
+                print(f"  💬 Response: {tokenizer.decode(node_tokens).strip()}")
+                print(f"  🖥️  GPU Memory: {mem_mb:.1f}MB (peak: {peak_mb:.1f}MB)")
+                print(f"  ⚡ Performance: {GenerationMetrics.from_list(values).summary()}")
+                print("  " + "-" * 45)
 
     if rank == 0:
+        print_memory_report(memory)
         print(f"\n✅ GPU monitoring complete!")
         print(f"🎯 All {size} processes used GPU memory for model and inference")
 
@@ -0,0 +1,248 @@
+import argparse
+import glob
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from preflight import HOSTS_FILE, load_hosts
+
+# Launch-configuration autotuner.
+#
+# Tries every combination of processes per host, backend (mpi, ring) and
+# --connections-per-ip (ring only) on a short benchmark.py workload and
+# keeps the fastest. Trials run in rounds: the first round is short
+# (few reps), failing or timed-out launches are dropped (and a ring
+# launch that fails drops the larger connection counts for that layout),
+# and only configurations within --prune of the best, at most --keep of
+# them, are re-measured with the full --reps.
+#
+# The winner is written to PROFILE; run_terminal.sh reads it through
+# `autotune.py show --args` and falls back to its defaults without one.
+#
+#   python autotune.py                                   # hosts.json, real model
+#   python autotune.py --hosts localhost --model tiny --cpu --procs-per-host 1,2,4
+#   python autotune.py --dry-run                         # list configurations
+#   python autotune.py show
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROFILE = os.path.join(ROOT, "launch_profile.json")
+
+
+def cluster_hosts(path=HOSTS_FILE):
+    return [entry["ssh"].rsplit("@", 1)[-1] for entry in load_hosts(path)]
+
+
+def resolve(hosts):
+    # The ring backend wants addresses, not mDNS names
+    return [socket.gethostbyname(h) for h in hosts]
+
+
+def config_space(procs_per_host, backends, connections):
+    configs = []
+    for backend, per_host in itertools.product(backends, procs_per_host):
+        for conns in (connections if backend == "ring" else [None]):
+            configs.append({"backend": backend, "procs_per_host": per_host, "connections_per_ip": conns})
+    return configs
+
+
+def launch_args(config, hosts):
+    # mlx.launch's -n (--repeat-hosts) repeats each host: processes per host
+    names = resolve(hosts) if config["backend"] == "ring" and hosts != ["localhost"] else hosts
+    args = ["--backend", config["backend"], "--hosts", ",".join(names),
+            "-n", str(config["procs_per_host"])]
+    if config["connections_per_ip"]:
+        args += ["--connections-per-ip", str(config["connections_per_ip"])]
+    return args
+
+
+def label(config):
+    text = f"{config['backend']:<4} {config['procs_per_host']}/host"
+    if config["connections_per_ip"]:
+        text += f" x{config['connections_per_ip']} conn"
+    return text
+
+
+def run_trial(config, hosts, workload, reps, launcher, timeout):
+    # {"ok", "procs", "tok_s", "p50_s", "elapsed_s"} or {"ok": False, "error", ...}
+    out = tempfile.mkdtemp(prefix="autotune-")
+    command = [launcher, *launch_args(config, hosts), os.path.join(ROOT, "benchmark.py"),
+               *workload, "--reps", str(reps), "--out", out]
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=timeout, cwd=ROOT)
+        elapsed = time.perf_counter() - start
+        summaries = glob.glob(os.path.join(out, "n*", "summary.json"))
+        if result.returncode != 0 or not summaries:
+            tail = (result.stderr or result.stdout).strip().splitlines()[-1:] or [f"exit {result.returncode}"]
+            return {"ok": False, "error": tail[0][:200], "elapsed_s": elapsed}
+        with open(summaries[0]) as f:
+            summary = json.load(f)
+        rows = summary["summary"]
+        return {
+            "ok": True,
+            "procs": summary["procs"],
+            "tok_s": sum(r["cluster_decode_tps"] for r in rows) / len(rows),
+            "p50_s": sum(r["latency_s"]["p50"] for r in rows) / len(rows),
+            "elapsed_s": elapsed,
+        }
+    except subprocess.TimeoutExpired:
+        return {"ok": False, "error": f"timed out after {timeout}s", "elapsed_s": timeout}
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+
+
+def score(result, objective):
+    # Higher is better
+    if not result["ok"]:
+        return float("-inf")
+    return result["tok_s"] if objective == "throughput" else -result["p50_s"]
+
+
+def tune(configs, hosts, workload, launcher, objective="throughput", quick_reps=2, reps=5,
+         prune=0.8, keep=3, timeout=300):
+    trials = []
+    survivors = []
+    ring_broken = set()  # procs_per_host values whose first ring launch failed
+    print(f"🔧 Round 1: {len(configs)} configurations, {quick_reps} reps each")
+    for config in configs:
+        ring = config["backend"] == "ring"
+        if ring and config["procs_per_host"] in ring_broken:
+            result = {"ok": False, "error": "skipped: ring launch failed with fewer connections"}
+        else:
+            result = run_trial(config, hosts, workload, quick_reps, launcher, timeout)
+            # More connections per IP will not fix a ring that cannot start
+            if ring and not result["ok"]:
+                ring_broken.add(config["procs_per_host"])
+        trials.append({**config, "round": 1, **result})
+        report_trial(config, result)
+        if result["ok"]:
+            survivors.append((config, result))
+    if not survivors:
+        return None, trials
+
+    # Prune: keep only configurations close to the best quick score
+    survivors.sort(key=lambda cr: score(cr[1], objective), reverse=True)
+    best = score(survivors[0][1], objective)
+    threshold = best * prune if objective == "throughput" else best / prune
+    finalists = [c for c, r in survivors if score(r, objective) >= threshold][:keep]
+    print(f"\n✂️  Pruned {len(configs) - len(finalists)} configurations; "
+          f"round 2: {len(finalists)} with {reps} reps each")
+
+    results = []
+    for config in finalists:
+        result = run_trial(config, hosts, workload, reps, launcher, timeout)
+        trials.append({**config, "round": 2, **result})
+        report_trial(config, result)
+        results.append((config, result))
+    config, result = max(results, key=lambda cr: score(cr[1], objective))
+    if not result["ok"]:
+        return None, trials
+    return {**config, **result}, trials
+
+
+def report_trial(config, result):
+    if result["ok"]:
+        print(f"   {label(config):<24} {result['tok_s']:>8.1f} tok/s  p50 {result['p50_s']:.3f}s  "
+              f"({result['procs']} ranks, {result['elapsed_s']:.0f}s)")
+    else:
+        print(f"   {label(config):<24} ❌ {result['error']}")
+
+
+def save_profile(best, hosts, trials, objective, path=PROFILE):
+    profile = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "objective": objective,
+        "hosts": hosts,
+        "backend": best["backend"],
+        "procs_per_host": best["procs_per_host"],
+        "connections_per_ip": best["connections_per_ip"],
+        "procs": best["procs"],
+        "launch_args": launch_args(best, hosts),
+        "tok_s": best["tok_s"],
+        "p50_s": best["p50_s"],
+        "trials": trials,
+    }
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+    return profile
+
+
+def load_profile(path=PROFILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick processes per host, backend and connections by measurement")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("show", help="Print the saved profile")
+    p.add_argument("--args", action="store_true", help="Only the mlx.launch arguments")
+    p.add_argument("--profile", default=PROFILE)
+
+    parser.add_argument("--hosts", default=None, help="Comma-separated hosts (default: hosts.json)")
+    parser.add_argument("--procs-per-host", default="1,2")
+    parser.add_argument("--backends", default="mpi,ring")
+    parser.add_argument("--connections", default="1,2,4,8", help="--connections-per-ip values for ring")
+    parser.add_argument("--objective", choices=["throughput", "latency"], default="throughput")
+    parser.add_argument("--model", default=None, help="Benchmark model (default: benchmark.py's)")
+    parser.add_argument("--cpu", action="store_true")
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--quick-reps", type=int, default=2)
+    parser.add_argument("--reps", type=int, default=5)
+    parser.add_argument("--prune", type=float, default=0.8,
+                        help="Drop configurations below this fraction of the best quick score")
+    parser.add_argument("--keep", type=int, default=3, help="At most this many go to round 2")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds per trial")
+    parser.add_argument("--launcher", default="mlx.launch")
+    parser.add_argument("--profile", default=PROFILE)
+    parser.add_argument("--dry-run", action="store_true", help="List the configurations and exit")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        profile = load_profile(args.profile)
+        if profile is None:
+            sys.exit(1)
+        if args.args:
+            print(" ".join(profile["launch_args"]))
+        else:
+            print(f"🎛️  {label(profile)}: {profile['procs']} ranks on {', '.join(profile['hosts'])}, "
+                  f"{profile['tok_s']:.1f} tok/s, p50 {profile['p50_s']:.3f}s (tuned {profile['created']})")
+            print(f"   mlx.launch {' '.join(profile['launch_args'])} <script>")
+        return
+
+    hosts = args.hosts.split(",") if args.hosts else cluster_hosts()
+    configs = config_space([int(n) for n in args.procs_per_host.split(",")], args.backends.split(","),
+                           [int(n) for n in args.connections.split(",")])
+    workload = ["--prompt-len", "32", "--batch-size", "1", "--max-tokens", str(args.max_tokens), "--warmup", "1"]
+    if args.model:
+        workload += ["--model", args.model]
+    if args.cpu:
+        workload += ["--cpu"]
+    if args.dry_run:
+        for config in configs:
+            world = len(hosts) * config["procs_per_host"]
+            print(f"   {label(config):<24} {world:>3} ranks  mlx.launch {' '.join(launch_args(config, hosts))}")
+        return
+
+    launcher = shutil.which(args.launcher) or args.launcher
+    best, trials = tune(configs, hosts, workload, launcher, args.objective, args.quick_reps, args.reps,
+                        args.prune, args.keep, args.timeout)
+    if best is None:
+        print("\n❌ No configuration completed; profile not written")
+        sys.exit(1)
+    save_profile(best, hosts, trials, args.objective, args.profile)
+    print(f"\n🏆 {label(best)}: {best['tok_s']:.1f} tok/s, p50 {best['p50_s']:.3f}s")
+    print(f"📁 Profile written to {args.profile}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import mlx.core as mx
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+from dist_utils import all_gather_text, barrier, barrier_report, print_barrier_report
+from generation import batch_generate
+from model_loader import MODEL, load_host_shared
+
+# Benchmark harness.
+#
+# Every (prompt length, batch size, max_tokens) combination runs
+# --warmup untimed generations and then --reps timed ones, with all
+# ranks starting each repetition together. Each rank writes its raw
+# samples to OUT/n<procs>/rank<r>.json, and rank 0 writes a cluster
+# summary.json with latency percentiles pooled over ranks and the
+# aggregate decode throughput.
+#
+# --model tiny builds a small randomly initialized Llama, so scaling
+# curves can be reproduced on one CPU-only machine:
+#
+#   python benchmark.py --model tiny --cpu --batch-size 1,4,8
+#   python benchmark.py --model tiny --cpu --procs 1,2,4   # relaunches via mlx.launch
+#
+# Stop tokens are ignored, so every run generates exactly max_tokens.
+
+BASE_TEXT = "Distributed inference splits work across several Apple Silicon machines. "
+
+
+def tiny_model(seed=0):
+    from mlx_lm.models import llama
+
+    mx.random.seed(seed)
+    args = llama.ModelArgs(
+        model_type="llama",
+        hidden_size=128,
+        num_hidden_layers=4,
+        intermediate_size=256,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        rms_norm_eps=1e-5,
+        vocab_size=512,
+        tie_word_embeddings=True,
+    )
+    model = llama.Model(args)
+    mx.eval(model.parameters())
+    return model
+
+
+def load_benchmark_model(name, hostname, rank):
+    # Returns (model, tokenizer, load_time); tokenizer is None for "tiny"
+    start = time.time()
+    if name == "tiny":
+        model, tokenizer = tiny_model(), None
+    else:
+        model, tokenizer, _ = load_host_shared(hostname, rank, repo=name)
+    return model, tokenizer, time.time() - start
+
+
+def make_prompts(tokenizer, vocab_size, prompt_len, batch_size, rank):
+    # Token-id prompts of exactly prompt_len, different on every rank
+    if tokenizer is None:
+        ids = mx.random.randint(0, vocab_size, (batch_size, prompt_len),
+                                key=mx.random.key(rank)).tolist()
+        return ids
+    base = tokenizer.encode(f"Node {rank}: " + BASE_TEXT * (prompt_len // 8 + 1))
+    return [base[:prompt_len]] * batch_size
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def latency_stats(values):
+    return {f"p{q}": percentile(values, q) for q in (50, 95, 99)}
+
+
+def run_config(model, tokenizer, prompt_len, batch_size, max_tokens, warmup, reps, rank):
+    # Returns (record, metrics) for one sweep point on this rank
+    prompts = make_prompts(tokenizer, model.args.vocab_size, prompt_len, batch_size, rank)
+    for _ in range(warmup):
+        batch_generate(model, tokenizer, prompts, max_tokens=max_tokens, stop_tokens=set())
+
+    metrics = []
+    for _ in range(reps):
+        barrier("rep")  # start together
+        _, run = batch_generate(model, tokenizer, prompts, max_tokens=max_tokens, stop_tokens=set())
+        metrics.append(run)
+
+    samples = [{
+        "latency_s": m.total_s,
+        "ttft_s": m.ttft_s,
+        "decode_tps": m.decode_tps,
+        "prefill_tps": m.prefill_tps,
+        "generation_tokens": m.generation_tokens,
+        "peak_memory_mb": m.peak_memory_mb,
+    } for m in metrics]
+    record = {
+        "prompt_len": prompt_len,
+        "batch_size": batch_size,
+        "max_tokens": max_tokens,
+        "latency_s": latency_stats([s["latency_s"] for s in samples]),
+        "ttft_s": latency_stats([s["ttft_s"] for s in samples]),
+        "decode_tps": sum(s["decode_tps"] for s in samples) / len(samples),
+        "samples": samples,
+    }
+    return record, metrics
+
+
+def summarize(rank_results):
+    # Pool every rank's samples per sweep point
+    summary = []
+    for configs in zip(*(r["configs"] for r in rank_results)):
+        samples = [s for c in configs for s in c["samples"]]
+        summary.append({
+            "prompt_len": configs[0]["prompt_len"],
+            "batch_size": configs[0]["batch_size"],
+            "max_tokens": configs[0]["max_tokens"],
+            "latency_s": latency_stats([s["latency_s"] for s in samples]),
+            "ttft_s": latency_stats([s["ttft_s"] for s in samples]),
+            "cluster_decode_tps": sum(c["decode_tps"] for c in configs),
+        })
+    return summary
+
+
+def print_summary(summary, procs):
+    print(f"\n{'procs':>5} {'prompt':>6} {'batch':>5} {'tokens':>6} "
+          f"{'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'ttft p50':>9} {'tok/s':>9}")
+    for row in summary:
+        lat = row["latency_s"]
+        print(f"{procs:>5} {row['prompt_len']:>6} {row['batch_size']:>5} {row['max_tokens']:>6} "
+              f"{lat['p50']:>8.3f} {lat['p95']:>8.3f} {lat['p99']:>8.3f} "
+              f"{row['ttft_s']['p50']:>9.3f} {row['cluster_decode_tps']:>9.1f}")
+
+
+def int_list(text):
+    return [int(x) for x in text.split(",")]
+
+
+def without_option(argv, name):
+    # argv minus "name value" and "name=value"
+    child = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == name:
+            skip = True
+        elif not arg.startswith(name + "="):
+            child.append(arg)
+    return child
+
+
+def sweep_procs(args):
+    # Relaunch this script once per process count and collect the summaries
+    launcher = shutil.which(args.launcher) or args.launcher
+    child = without_option(sys.argv[1:], "--procs")
+
+    scaling = []
+    for procs in int_list(args.procs):
+        command = [sys.executable, __file__] + child
+        if procs > 1:
+            command = [launcher, "--hosts", args.hosts, "-n", str(procs), __file__] + child
+        print(f"🚀 {' '.join(command)}")
+        subprocess.run(command, check=True)
+        with open(os.path.join(args.out, f"n{procs}", "summary.json")) as f:
+            scaling.append(json.load(f))
+
+    with open(os.path.join(args.out, "scaling.json"), "w") as f:
+        json.dump(scaling, f, indent=2)
+    for result in scaling:
+        print_summary(result["summary"], result["procs"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MLX inference benchmark")
+    parser.add_argument("--model", default=MODEL,
+                        help="Model repo or path, or 'tiny' for a random CPU-sized model")
+    parser.add_argument("--max-tokens", type=int_list, default=[50])
+    parser.add_argument("--prompt-len", type=int_list, default=[32])
+    parser.add_argument("--batch-size", type=int_list, default=[1])
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--reps", type=int, default=5)
+    parser.add_argument("--out", default="bench_results")
+    parser.add_argument("--cpu", action="store_true")
+    parser.add_argument("--procs", default=None,
+                        help="Comma-separated process counts to sweep (relaunches this script)")
+    parser.add_argument("--launcher", default="mlx.launch")
+    parser.add_argument("--hosts", default="localhost")
+    args = parser.parse_args()
+
+    if args.procs:
+        sweep_procs(args)
+        return
+
+    world = mx.distributed.init()
+    rank = world.rank()
+    size = world.size()
+    hostname = socket.gethostname()
+
+    mx.set_default_device(mx.cpu if args.cpu else mx.gpu)
+
+    model, tokenizer, load_time = load_benchmark_model(args.model, hostname, rank)
+    barrier("load")
+
+    configs = []
+    for prompt_len in args.prompt_len:
+        for batch_size in args.batch_size:
+            for max_tokens in args.max_tokens:
+                record, _ = run_config(model, tokenizer, prompt_len, batch_size, max_tokens,
+                                       args.warmup, args.reps, rank)
+                configs.append(record)
+
+    result = {
+        "rank": rank,
+        "host": hostname,
+        "procs": size,
+        "model": args.model,
+        "device": "cpu" if args.cpu else "gpu",
+        "load_time_s": load_time,
+        "warmup": args.warmup,
+        "reps": args.reps,
+        "configs": configs,
+    }
+    out_dir = os.path.join(args.out, f"n{size}")
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, f"rank{rank}.json"), "w") as f:
+        json.dump(result, f, indent=2)
+
+    # Cluster summary on rank 0
+    rank_results = [json.loads(r) for r in all_gather_text(json.dumps(result))]
+    sync = barrier_report(hostname)
+    if rank == 0:
+        summary = {
+            "procs": size,
+            "model": args.model,
+            "hosts": [r["host"] for r in rank_results],
+            "summary": summarize(rank_results),
+            "sync": sync,
+        }
+        with open(os.path.join(out_dir, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        print_summary(summary["summary"], size)
+        print_barrier_report(sync)
+        print(f"\n📁 Results written to {out_dir}/")
+
+if __name__ == "__main__":
+    main()
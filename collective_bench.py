@@ -0,0 +1,247 @@
+import mlx.core as mx
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+from benchmark import percentile, without_option
+from hierarchical import hierarchical_group
+
+# Collective-communication microbenchmark.
+#
+# Sweeps message sizes (powers of --factor from --min-bytes to
+# --max-bytes) for all_sum, all_gather and a send/recv ping-pong between
+# ranks 0 and 1. --ops hier_sum adds the hierarchical all-reduce (see
+# hierarchical.py, MPI only) with hosts taken from real hostnames,
+# --hostfile or --simulate 3x2. Every size gets --warmup untimed calls (the first call
+# also pays connection setup) and --reps timed ones, each started behind
+# a barrier. A repetition's time is the slowest rank's time.
+#
+# Bandwidths follow the nccl-tests conventions:
+#   algbw = bytes / time
+#   busbw = algbw * 2(n-1)/n  (all_sum, hier_sum)
+#           algbw * (n-1)/n   (all_gather, bytes = gathered output)
+#           algbw             (send/recv, time = one-way = round trip / 2)
+# busbw is comparable with the link speed regardless of process count.
+#
+#   mlx.launch --backend ring --hosts mbp.local,mm1.local -n 2 --connections-per-ip 4 collective_bench.py
+#   python collective_bench.py --procs 2,4 --backend ring   # localhost sweep
+#   mlx.launch --backend mpi --hostfile mlx_hostfile.txt collective_bench.py --ops all_sum,hier_sum \
+#       --hostfile mlx_hostfile.txt
+
+OPS = ["all_sum", "hier_sum", "all_gather", "sendrecv"]
+DEFAULT_OPS = ["all_sum", "all_gather", "sendrecv"]  # hier_sum is MPI-only, ask for it
+
+
+def parse_size(text):
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    text = text.upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def format_size(nbytes):
+    for unit, scale in (("G", 1 << 30), ("M", 1 << 20), ("K", 1 << 10)):
+        if nbytes >= scale:
+            return f"{nbytes / scale:g}{unit}"
+    return f"{nbytes}B"
+
+
+def message_sizes(min_bytes, max_bytes, factor):
+    sizes = []
+    nbytes = max(4, min_bytes)
+    while nbytes <= max_bytes:
+        sizes.append(nbytes)
+        nbytes *= factor
+    return sizes
+
+
+def launched_backend(requested):
+    # Name the backend "any" resolves to, from what the launcher exported
+    if requested != "any":
+        return requested
+    if "MLX_IBV_DEVICES" in os.environ:
+        return "jaccl"
+    if "MLX_HOSTFILE" in os.environ:
+        return "ring"
+    if any(k in os.environ for k in ("OMPI_COMM_WORLD_RANK", "PMI_RANK", "PMIX_RANK")):
+        return "mpi"
+    return "any"
+
+
+def barrier(group=None):
+    mx.eval(mx.distributed.all_sum(mx.array([1.0]), group=group))
+
+
+def make_op(op, data, rank, size, group=None, hier=None):
+    # Returns a callable performing one timed operation on this rank
+    if op == "hier_sum":
+        return lambda: mx.eval(hier.all_sum(data))
+    if op == "all_sum":
+        return lambda: mx.eval(mx.distributed.all_sum(data, group=group))
+    if op == "all_gather":
+        return lambda: mx.eval(mx.distributed.all_gather(data, group=group))
+
+    def ping_pong():
+        if rank == 0:
+            mx.eval(mx.distributed.send(data, 1, group=group))
+            mx.eval(mx.distributed.recv_like(data, 1, group=group))
+        elif rank == 1:
+            mx.eval(mx.distributed.recv_like(data, 0, group=group))
+            mx.eval(mx.distributed.send(data, 0, group=group))
+    return ping_pong
+
+
+def bandwidths(op, nbytes, seconds, size):
+    # Returns (algbw, busbw) in GB/s
+    if op == "all_gather":
+        nbytes *= size
+    algbw = nbytes / seconds / 1e9 if seconds > 0 else 0.0
+    factor = {"all_sum": 2 * (size - 1) / size, "hier_sum": 2 * (size - 1) / size,
+              "all_gather": (size - 1) / size}.get(op, 1.0)
+    return algbw, algbw * factor
+
+
+def time_op(fn, warmup, reps):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(reps):
+        barrier()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    # A collective is only as fast as its slowest rank
+    return mx.max(mx.distributed.all_gather(mx.array([times])), axis=0).tolist()
+
+
+def check_hier(hier, rank):
+    # hier_sum must agree with the flat all_sum
+    data = mx.arange(1024, dtype=mx.float32) * (rank + 1)
+    return mx.allclose(hier.all_sum(data), mx.distributed.all_sum(data)).item()
+
+
+def run(ops, sizes, warmup, reps, rank, size, hier=None):
+    results = []
+    for op in ops:
+        if op == "sendrecv" and size < 2:
+            continue
+        for nbytes in sizes:
+            data = mx.random.uniform(shape=(nbytes // 4,))
+            mx.eval(data)
+            times = time_op(make_op(op, data, rank, size, hier=hier), warmup, reps)
+            if op == "sendrecv":
+                times = [t / 2 for t in times]  # one-way
+            p50 = percentile(times, 50)
+            algbw, busbw = bandwidths(op, nbytes, p50, size)
+            results.append({
+                "op": op,
+                "bytes": nbytes,
+                "latency_us": p50 * 1e6,
+                "min_us": min(times) * 1e6,
+                "p95_us": percentile(times, 95) * 1e6,
+                "algbw_gbs": algbw,
+                "busbw_gbs": busbw,
+            })
+    return results
+
+
+def print_table(results, size, backend):
+    for op in OPS:
+        rows = [r for r in results if r["op"] == op]
+        if not rows:
+            continue
+        print(f"\n📡 {op} — {size} processes, backend {backend}")
+        print(f"{'size':>8} {'p50 us':>11} {'min us':>11} {'p95 us':>11} {'algbw GB/s':>11} {'busbw GB/s':>11}")
+        for r in rows:
+            print(f"{format_size(r['bytes']):>8} {r['latency_us']:>11.1f} {r['min_us']:>11.1f} "
+                  f"{r['p95_us']:>11.1f} {r['algbw_gbs']:>11.3f} {r['busbw_gbs']:>11.3f}")
+
+
+def sweep_procs(args):
+    # Relaunch on localhost once per process count
+    launcher = shutil.which(args.launcher) or args.launcher
+    child = without_option(sys.argv[1:], "--procs")
+    for procs in [int(n) for n in args.procs.split(",")]:
+        command = [launcher, "--hosts", args.hosts, "-n", str(procs)]
+        if args.backend != "any":
+            command += ["--backend", args.backend]
+        command += [__file__] + child
+        print(f"🚀 {' '.join(command)}")
+        subprocess.run(command, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MLX collective microbenchmark")
+    parser.add_argument("--ops", default=",".join(DEFAULT_OPS), help=f"Any of {','.join(OPS)}")
+    parser.add_argument("--min-bytes", type=parse_size, default=parse_size("8"))
+    parser.add_argument("--max-bytes", type=parse_size, default=parse_size("256M"))
+    parser.add_argument("--factor", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--reps", type=int, default=20)
+    parser.add_argument("--backend", default="any", help="any, mpi or ring")
+    parser.add_argument("--cpu", action="store_true")
+    parser.add_argument("--hostfile", default=None, help="Group ranks into hosts for hier_sum (one line per rank)")
+    parser.add_argument("--simulate", default=None, metavar="HxL",
+                        help="Treat blocks of L consecutive ranks as one host for hier_sum, e.g. 3x2")
+    parser.add_argument("--json", default=None, help="Write results to this file (rank 0)")
+    parser.add_argument("--procs", default=None,
+                        help="Comma-separated process counts to sweep on --hosts")
+    parser.add_argument("--launcher", default="mlx.launch")
+    parser.add_argument("--hosts", default="localhost")
+    args = parser.parse_args()
+
+    if args.procs:
+        sweep_procs(args)
+        return
+
+    backend = launched_backend(args.backend)
+    world = mx.distributed.init(backend=backend)
+    rank = world.rank()
+    size = world.size()
+    if size == 1:
+        backend = "none"  # singleton group, no backend started
+    hostname = socket.gethostname()
+
+    mx.set_default_device(mx.cpu if args.cpu else mx.gpu)
+
+    sizes = message_sizes(args.min_bytes, args.max_bytes, args.factor)
+    if rank == 0:
+        print(f"🔬 Collective benchmark: {size} processes ({backend}), {len(sizes)} sizes "
+              f"({format_size(sizes[0])} - {format_size(sizes[-1])}), "
+              f"{args.warmup} warmup + {args.reps} reps")
+
+    ops = args.ops.split(",")
+    hier = None
+    if "hier_sum" in ops:
+        try:
+            hier = hierarchical_group(hostname, args.hostfile, args.simulate, world)
+        except RuntimeError as e:
+            # Every rank fails the same split, so every rank drops the op
+            ops.remove("hier_sum")
+            if rank == 0:
+                print(f"⏭️  Skipping hier_sum: {e}")
+    if hier is not None:
+        ok = mx.distributed.all_sum(mx.array([0 if check_hier(hier, rank) else 1])).item() == 0
+        if rank == 0:
+            print(f"🌳 hier_sum: {hier.num_hosts} hosts, leaders {hier.leaders}, "
+                  f"{'matches' if ok else '❌ DOES NOT MATCH'} all_sum")
+
+    barrier()
+    results = run(ops, sizes, args.warmup, args.reps, rank, size, hier)
+
+    if rank == 0:
+        print_table(results, size, backend)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"procs": size, "backend": backend, "host": hostname,
+                           "hosts": hier.num_hosts if hier else None, "results": results}, f, indent=2)
+            print(f"\n📁 Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
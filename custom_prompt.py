@@ -1,9 +1,12 @@
 
 import mlx.core as mx
-from mlx_lm import load, generate
+from mlx_lm import load
 import socket
 import time
 
+from dist_utils import barrier, gather_results
+from generation import GenerationMetrics, generate_tokens
+
 def main():
     world = mx.distributed.init()
     rank = world.rank()
@@ -24,7 +27,7 @@ def main():
     load_time = time.time() - start_time
     print(f"[Rank {rank}@{hostname}] Model loaded in {load_time:.2f}s")
 
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("load")
 
     # Use the custom prompt
     prompt = "Write a creative story about a robot learning to paint."
@@ -34,8 +37,7 @@ def main():
         print("🎨 Generating creative response...")
 
     # Generate response with more tokens for creative content
-    start_time = time.time()
-    response = generate(
+    token_ids, metrics = generate_tokens(
         model, 
         tokenizer, 
         prompt, 
@@ -43,26 +45,20 @@ def main():
         repetition_penalty=1.1,
         repetition_context_size=20
     )
-    gen_time = time.time() - start_time
-
-    # Calculate metrics
-    tokens = len(tokenizer.encode(response))
-    speed = tokens / gen_time if gen_time > 0 else 0
 
-    # Display results
-    for i in range(size):
-        mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    # Collect all responses and metrics on rank 0 and display them there
+    gathered = gather_results([(0, token_ids, metrics.to_list())], hostname)
 
-        if rank == i:
-            print(f"\n🎭 Response from Node {rank} ({hostname}):")
-            print(f"============================================================")
-            print(response.strip())
-            print(f"============================================================")
-            print(f"📊 Stats: {tokens} tokens in {gen_time:.2f}s ({speed:.1f} tok/s)")
-            if rank < size - 1:
-                print()
-
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    if rank == 0:
+        for node, (node_host, node_results) in enumerate(gathered):
+            for _, node_tokens, values in node_results:
+                print(f"\n🎭 Response from Node {node} ({node_host}):")
+                print(f"============================================================")
+                print(tokenizer.decode(node_tokens).strip())
+                print(f"============================================================")
+                print(f"📊 Stats: ⚡ {GenerationMetrics.from_list(values).summary()}")
+                if node < size - 1:
+                    print()
 
     if rank == 0:
         print(f"\n✅ Custom prompting complete!")
@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import glob
+import hashlib
+import io
+import json
+import os
+import shlex
+import sys
+import tarfile
+import time
+from importlib import metadata
+
+from preflight import HOSTS_FILE, LocalTransport, SSHTransport, load_hosts
+
+# Content-addressed delta deployment.
+#
+# Every artifact is hashed locally (sha256 of its content) and compared
+# with the manifest left on each node by the previous deploy. Only the
+# files whose hashes differ are packed into one tar stream and unpacked
+# remotely, together with the new manifest, in a single SSH round trip.
+# All hosts are handled concurrently over the preflight transport, so
+# the ControlMaster connections are shared.
+#
+# --env compares the versions of the core packages on each node with
+# the local ones and pip-installs only the ones that differ, instead of
+# rebuilding the conda env.
+#
+#   python deploy.py                 # push changed scripts to every host
+#   python deploy.py --env --dry-run
+#
+# A hosts.json entry may set "dir" to override the target directory.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ARTIFACTS = ("*.py", "*.sh", "hosts.json", "mlx_hostfile.txt")
+MANIFEST = ".deploy_manifest.json"
+PACKAGES = ("mlx", "mlx-lm", "numpy", "transformers")
+PIP = 'for p in "$HOME/anaconda3/envs/mlx-distributed/bin/pip" "$HOME/miniconda3/envs/mlx-distributed/bin/pip"; ' \
+      'do if [ -x "$p" ]; then PIP="$p"; break; fi; done; PIP=${PIP:-pip3}'
+
+
+def default_remote_dir():
+    # Mirror the local checkout under the remote home, so paths given to
+    # mlx.launch resolve the same way on every node
+    home = os.path.expanduser("~")
+    path = os.path.relpath(ROOT, home) if ROOT.startswith(home) else os.path.basename(ROOT)
+    return f"~/{path}"
+
+
+def local_manifest(root=ROOT, patterns=ARTIFACTS):
+    manifest = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(root, pattern))):
+            with open(path, "rb") as f:
+                manifest[os.path.relpath(path, root)] = hashlib.sha256(f.read()).hexdigest()
+    return manifest
+
+
+def pack(root, names, manifest):
+    # gzip'd tar of the changed files plus the full new manifest
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name in names:
+            tar.add(os.path.join(root, name), arcname=name)
+        data = json.dumps(manifest, indent=1, sort_keys=True).encode()
+        info = tarfile.TarInfo(MANIFEST)
+        info.size = len(data)
+        info.mtime = time.time()
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def _remote_path(path):
+    # Quote for the remote shell but keep ~ expanding to the remote home
+    if path.startswith("~/"):
+        return '"$HOME"/' + shlex.quote(path[2:])
+    return shlex.quote(path)
+
+
+async def deploy_host(entry, transport, local, remote_dir, dry_run=False, timeout=60, root=ROOT):
+    target = entry["ssh"]
+    result = {"target": target, "changed": [], "bytes": 0, "error": "", "elapsed_s": 0.0}
+    start = time.perf_counter()
+    directory = _remote_path(entry.get("dir", remote_dir))
+
+    code, out, err = await transport.run(target, f"cat {directory}/{MANIFEST} 2>/dev/null || echo '{{}}'",
+                                         timeout=timeout)
+    if code != 0:
+        result["error"] = f"manifest: {err.strip() or f'exit {code}'}"[:200]
+        return result
+    try:
+        remote = json.loads(out or "{}")
+    except ValueError:
+        remote = {}
+
+    result["changed"] = [name for name, digest in local.items() if remote.get(name) != digest]
+    if result["changed"] and not dry_run:
+        payload = pack(root, result["changed"], local)
+        result["bytes"] = len(payload)
+        code, _, err = await transport.run(target, f"mkdir -p {directory} && tar -xzf - -C {directory}",
+                                           payload, timeout)
+        if code != 0:
+            result["error"] = f"push: {err.strip() or f'exit {code}'}"[:200]
+    result["elapsed_s"] = time.perf_counter() - start
+    return result
+
+
+def local_versions(packages=PACKAGES):
+    versions = {}
+    for package in packages:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    return versions
+
+
+async def sync_env(entry, transport, versions, dry_run=False, timeout=600):
+    # pip install only the packages whose remote version differs
+    target = entry["ssh"]
+    result = {"target": target, "installed": [], "error": ""}
+    code, out, err = await transport.run(target, f"{PIP}; $PIP list --format=json 2>/dev/null", timeout=60)
+    try:
+        remote = {p["name"].lower(): p["version"] for p in json.loads(out)}
+    except ValueError:
+        result["error"] = f"pip list: {err.strip() or f'exit {code}'}"[:200]
+        return result
+
+    pins = [f"{name}=={version}" for name, version in versions.items()
+            if remote.get(name.lower()) != version]
+    result["installed"] = pins
+    if pins and not dry_run:
+        code, _, err = await transport.run(target, f"{PIP}; $PIP install -q {' '.join(pins)}", timeout=timeout)
+        if code != 0:
+            result["error"] = f"pip install: {err.strip().splitlines()[-1] if err.strip() else code}"[:200]
+    return result
+
+
+async def deploy(hosts, transport=None, remote_dir=None, dry_run=False, env=False, root=ROOT):
+    transport = transport or SSHTransport()
+    remote_dir = remote_dir or default_remote_dir()
+    local = local_manifest(root)
+    results = await asyncio.gather(*(deploy_host(entry, transport, local, remote_dir, dry_run, root=root)
+                                     for entry in hosts))
+    env_results = []
+    if env:
+        versions = local_versions()
+        env_results = await asyncio.gather(*(sync_env(entry, transport, versions, dry_run)
+                                             for entry in hosts))
+    return local, results, env_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Push changed scripts (and packages) to every node")
+    parser.add_argument("--hosts", default=HOSTS_FILE)
+    parser.add_argument("--remote-dir", default=None,
+                        help=f"Target directory on each node (default {default_remote_dir()})")
+    parser.add_argument("--env", action="store_true",
+                        help="Also align mlx/mlx-lm/numpy/transformers versions with this machine")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--local", action="store_true",
+                        help="Deploy into --remote-dir on this machine for every entry (no SSH)")
+    args = parser.parse_args()
+    if args.local and not args.remote_dir:
+        # The default target is this checkout's own path: the manifest would land in the repo
+        parser.error("--local needs --remote-dir")
+
+    start = time.perf_counter()
+    local, results, env_results = asyncio.run(deploy(
+        load_hosts(args.hosts),
+        transport=LocalTransport() if args.local else SSHTransport(),
+        remote_dir=args.remote_dir,
+        dry_run=args.dry_run,
+        env=args.env,
+    ))
+    elapsed = time.perf_counter() - start
+
+    verb = "would push" if args.dry_run else "pushed"
+    for r in results:
+        if r["error"]:
+            print(f"❌ {r['target']}: {r['error']}")
+        elif r["changed"]:
+            print(f"📦 {r['target']}: {verb} {len(r['changed'])}/{len(local)} files "
+                  f"({r['bytes'] / 1024:.1f} KB) in {r['elapsed_s']:.2f}s: {', '.join(r['changed'])}")
+        else:
+            print(f"✅ {r['target']}: up to date ({len(local)} files)")
+    for r in env_results:
+        if r["error"]:
+            print(f"❌ {r['target']} env: {r['error']}")
+        elif r["installed"]:
+            print(f"🐍 {r['target']} env: {'would install' if args.dry_run else 'installed'} {' '.join(r['installed'])}")
+        else:
+            print(f"✅ {r['target']} env: packages match")
+
+    failed = any(r["error"] for r in results + list(env_results))
+    print(f"\n{'⚠️ ' if failed else '🎯'} Deploy finished in {elapsed:.2f}s")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import mlx.core as mx
+import time
+
+from tracing import add_span, traced
+
+
+@traced("collective")
+def broadcast_text(text, rank, root=0):
+    # MLX has no broadcast collective, so the root contributes the payload
+    # and every other rank contributes zeros to an all_sum.
+    # A None text on the root is sent as length -1 and returned as None.
+    if rank == root:
+        data = b"" if text is None else text.encode("utf-8")
+        length = -1 if text is None else len(data)
+    else:
+        data = b""
+        length = 0
+
+    length = mx.distributed.all_sum(mx.array([length], dtype=mx.int32)).item()
+    if length < 0:
+        return None
+    if length == 0:
+        return ""
+
+    if rank == root:
+        payload = mx.array(list(data), dtype=mx.int32)
+    else:
+        payload = mx.zeros((length,), dtype=mx.int32)
+    payload = mx.distributed.all_sum(payload)
+    return bytes(payload.tolist()).decode("utf-8")
+
+
+def _pack(hostname, records):
+    name = list(hostname.encode("utf-8"))
+    values = [len(name), *name, len(records)]
+    for index, token_ids, metrics in records:
+        values += [index, len(metrics), *metrics, len(token_ids), *token_ids]
+    return values
+
+
+def _unpack(values):
+    pos = 0
+
+    def take(n):
+        nonlocal pos
+        chunk = values[pos:pos + n]
+        pos += n
+        return chunk
+
+    name_len = int(take(1)[0])
+    hostname = bytes(int(v) for v in take(name_len)).decode("utf-8")
+    records = []
+    for _ in range(int(take(1)[0])):
+        index = int(take(1)[0])
+        metrics = take(int(take(1)[0]))
+        token_ids = [int(v) for v in take(int(take(1)[0]))]
+        records.append((index, token_ids, metrics))
+    return hostname, records
+
+
+@traced("collective")
+def gather_results(records, hostname):
+    # Collect every rank's results on all ranks with a fixed number of
+    # collectives (one for the sizes, one for the payload), instead of a
+    # barrier per rank. Each record is (index, token_ids, metrics) where
+    # metrics is a list of floats. Everything is packed into one float32
+    # vector; token ids below 2**24 round-trip exactly.
+    # Returns [(hostname, records), ...] in rank order.
+    payload = _pack(hostname, records)
+    lengths = mx.distributed.all_gather(mx.array([len(payload)], dtype=mx.int32)).tolist()
+    width = max(lengths)
+    padded = mx.array(payload + [0] * (width - len(payload)), dtype=mx.float32)
+    gathered = mx.distributed.all_gather(padded).reshape(len(lengths), width).tolist()
+    return [_unpack(row[:n]) for row, n in zip(gathered, lengths)]
+
+
+@traced("collective")
+def all_gather_text(text):
+    # Every rank's string, in rank order, on every rank
+    data = list(text.encode("utf-8"))
+    lengths = mx.distributed.all_gather(mx.array([len(data)], dtype=mx.int32)).tolist()
+    width = max(max(lengths), 1)
+    padded = mx.array(data + [0] * (width - len(data)), dtype=mx.int32)
+    rows = mx.distributed.all_gather(padded).reshape(len(lengths), width).tolist()
+    return [bytes(row[:n]).decode("utf-8") for row, n in zip(rows, lengths)]
+
+
+def host_layout(hostname, rank):
+    # Group ranks by host: returns (hostnames, local_rank, local_size,
+    # leader) where leader is the lowest rank on this host.
+    hostnames = all_gather_text(hostname)
+    peers = [r for r, h in enumerate(hostnames) if h == hostname]
+    return hostnames, peers.index(rank), len(peers), peers[0]
+
+
+# Named barriers with wait-time bookkeeping.
+#
+# barrier(name) records, for this rank, how long it worked since its
+# previous barrier and how long it then waited for the others. The rank
+# that waited least arrived last: it is the straggler everyone else was
+# waiting on. barrier_report() gathers every rank's records with one
+# collective at the end of a run, so the barriers themselves stay a
+# single tiny all_sum. Only world barriers (group=None) are recorded.
+
+_SYNC_TOKEN = {}
+_barriers = []
+_last_sync = [time.perf_counter()]
+
+
+def barrier(name="barrier", group=None):
+    # Returns the seconds this rank waited
+    token = _SYNC_TOKEN.get(id(group))
+    if token is None:
+        token = _SYNC_TOKEN[id(group)] = mx.array([1.0])
+    arrived = time.perf_counter()
+    mx.eval(mx.distributed.all_sum(token, group=group))
+    done = time.perf_counter()
+    if group is None:
+        _barriers.append((name, arrived - _last_sync[0], done - arrived))
+        _last_sync[0] = done
+    add_span(f"barrier {name}", arrived, done, "sync")
+    return done - arrived
+
+
+def barrier_report(hostname):
+    # Must be called on all ranks together, after the same barriers.
+    # Returns one dict per barrier name (repeated barriers are summed):
+    # per-rank work/wait seconds and the straggler (rank and host that
+    # arrived last, i.e. waited least).
+    hostnames = all_gather_text(hostname)
+    values = [v for _, work, wait in _barriers for v in (work, wait)]
+    rows = mx.distributed.all_gather(mx.array([values or [0.0, 0.0]], dtype=mx.float32)).tolist()
+    report = {}
+    for i, (name, _, _) in enumerate(_barriers):
+        entry = report.setdefault(name, {"name": name, "count": 0,
+                                         "work_s": [0.0] * len(rows), "wait_s": [0.0] * len(rows)})
+        entry["count"] += 1
+        for r, row in enumerate(rows):
+            entry["work_s"][r] += row[2 * i]
+            entry["wait_s"][r] += row[2 * i + 1]
+    for entry in report.values():
+        straggler = min(range(len(rows)), key=entry["wait_s"].__getitem__)
+        entry["straggler"] = straggler
+        entry["straggler_host"] = hostnames[straggler]
+        entry["max_wait_s"] = max(entry["wait_s"])
+    return list(report.values())
+
+
+def print_barrier_report(report, min_wait=0.0):
+    # One line per barrier where someone waited at least min_wait seconds
+    rows = [r for r in report if r["max_wait_s"] >= min_wait]
+    if not rows:
+        return
+    print("\n⏳ Sync points (straggler = last rank to arrive)")
+    print(f"   {'barrier':<28} {'max wait':>9} {'straggler':<22} {'its work':>9}")
+    for r in rows:
+        who = f"rank {r['straggler']} ({r['straggler_host']})"
+        name = r["name"] if r["count"] == 1 else f"{r['name']} (x{r['count']})"
+        print(f"   {name:<28} {r['max_wait_s']:>8.2f}s {who:<22} {r['work_s'][r['straggler']]:>8.2f}s")
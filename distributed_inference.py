@@ -1,10 +1,69 @@
-
 import mlx.core as mx
-from mlx_lm import load, generate
+import argparse
+import json
+import os
 import socket
-import time
+import sys
+
+from dist_utils import barrier, barrier_report, print_barrier_report
+from generation import GenerationMetrics, batch_generate
+from memory_monitor import MemorySampler, gather_memory, print_memory_report
+from model_loader import load_host_shared
+from tensor_parallel import shard_model
+from tracing import enable, estimate_clock_offsets, gather_trace, print_clock_report, write_trace
+from work_queue import open_work_queue
+
+def print_responses(results, prompts, tokenizer):
+    # results: {index: (rank, host, token_ids, metrics list)}
+    for index in sorted(results):
+        node, node_host, token_ids, values = results[index]
+        print(f"\n🖥️  Node {node} ({node_host}) - prompt #{index}:")
+        print(f"❓ Prompt: {prompts[index]}")
+        print(f"🤖 Response: {tokenizer.decode(token_ids).strip()}")
+        print(f"⚡ Performance: {GenerationMetrics.from_list(values).summary()}")
+        print("-" * 50)
+
+def report_lost(server, lost):
+    # Lost ranks, reassigned or timed-out prompts, and prompts given up on
+    for event in server.events:
+        where = f"prompt #{event['index']} " if event["index"] is not None else ""
+        print(f"♻️  {where}rank {event['rank']}: {event['event']}")
+    for index, reason in sorted(server.failed.items()):
+        print(f"❌ prompt #{index}: {reason}")
+    if lost:
+        print(f"⚠️  Lost ranks {lost}; kept {len(server.results)}/{server.total} results")
+
+def wait_for_results(server, timeout):
+    # The barrier only says every rank sent its results, not that rank 0 read them
+    if not server.wait(timeout):
+        missing = server.total - len(server.results) - len(server.failed)
+        print(f"⚠️  {missing} results still missing after {timeout:g}s")
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Prompts generated together per rank")
+    parser.add_argument("--tensor-parallel", action="store_true",
+                        help="Shard the model across all ranks instead of one copy per rank")
+    parser.add_argument("--memory-interval", type=float, default=0.05,
+                        help="Seconds between memory samples (0 disables the sampler)")
+    parser.add_argument("--memory-log", default=None, help="Write every rank's memory series here (rank 0)")
+    parser.add_argument("--trace", default=None,
+                        help="Write a Chrome/Perfetto trace of every rank here (rank 0)")
+    parser.add_argument("--trace-clock", choices=["pingpong", "barrier"], default="pingpong",
+                        help="Clock offset estimate; use barrier with the ring backend")
+    parser.add_argument("--heartbeat", type=float, default=2.0,
+                        help="Seconds between queue heartbeats; a rank silent for 3 is lost (0 disables)")
+    parser.add_argument("--request-timeout", type=float, default=300,
+                        help="Hand a prompt to another rank after this many seconds (0 disables)")
+    parser.add_argument("--results-log", default=None,
+                        help="Append each result here as it arrives (rank 0); rerunning skips logged prompts")
+    parser.add_argument("--result-wait", type=float, default=30,
+                        help="Seconds rank 0 waits for results still in flight before reporting")
+    args = parser.parse_args()
+    if args.trace:
+        enable()
+
     # Initialize distributed
     world = mx.distributed.init()
     rank = world.rank()
@@ -19,17 +78,23 @@ def main():
         print(f"📊 Cluster: {size} processes")
         print("=" * 50)
 
-    # Load model on all nodes
+    sampler = MemorySampler(args.memory_interval).start() if args.memory_interval > 0 else None
+
+    # Load model on all nodes; only one rank per host reads from disk
     print(f"[Rank {rank}@{hostname}] Loading model...")
-    start_time = time.time()
-    model, tokenizer = load("mlx-community/Llama-3.2-1B-Instruct-4bit")
-    load_time = time.time() - start_time
-    print(f"[Rank {rank}@{hostname}] Model loaded in {load_time:.2f}s")
+    if sampler:
+        sampler.set_phase("load")
+    model, tokenizer, load_info = load_host_shared(hostname, rank, lazy=args.tensor_parallel)
+    if args.tensor_parallel:
+        shard_model(model, world)
+    if sampler:
+        sampler.set_phase("idle")
+    print(f"[Rank {rank}@{hostname}] Model loaded in {load_info['load_time']:.2f}s ({load_info['role']})")
 
     # Synchronize after loading
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("load")
 
-    # Different prompts for each node
+    # Shared prompt queue; each rank pulls the next prompt when idle
     prompts = [
         "Write a haiku about distributed computing:",
         "Explain the advantages of Apple Silicon for AI:",
@@ -39,40 +104,85 @@ def main():
         "What are the benefits of multi-node computing?"
     ]
 
-    prompt = prompts[rank % len(prompts)]
+    if args.tensor_parallel:
+        # Every rank holds one shard, so all ranks run every batch together
+        server, queue = None, None
+        work = list(enumerate(prompts))
+        batches = [work[i:i + args.batch_size] for i in range(0, len(work), args.batch_size)]
+    else:
+        # Results go back over the side channel as they are produced, so a
+        # lost rank's prompts can move to the survivors
+        server, queue = open_work_queue(prompts, rank, heartbeat=args.heartbeat or None,
+                                        request_timeout=args.request_timeout or None,
+                                        results_log=args.results_log)
+        batches = queue.batches(args.batch_size)
 
     if rank == 0:
-        print(f"
-🎭 Generating responses across all nodes...")
-
-    # Generate response
-    start_time = time.time()
-    response = generate(model, tokenizer, prompt, max_tokens=80)
-    gen_time = time.time() - start_time
-
-    # Calculate performance metrics
-    tokens = len(tokenizer.encode(response))
-    speed = tokens / gen_time if gen_time > 0 else 0
-
-    # Display results in rank order
-    for i in range(size):
-        mx.eval(mx.distributed.all_sum(mx.array([1.0])))  # Sync
-
-        if rank == i:
-            print(f"
-🖥️  Node {rank} ({hostname}):")
-            print(f"❓ Prompt: {prompt}")
-            print(f"🤖 Response: {response.strip()}")
-            print(f"⚡ Performance: {speed:.1f} tokens/sec ({gen_time:.2f}s)")
-            print("-" * 50)
-
-    # Final sync
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+        print(f"\n🎭 Generating {len(prompts)} responses across all nodes...")
+
+    # Generate responses batch by batch until the queue is drained
+    results = []
+    for batch in batches:
+        outputs, metrics = batch_generate(model, tokenizer, [p for _, p in batch], max_tokens=80)
+        if args.tensor_parallel and rank != 0:
+            continue  # identical to rank 0's output
+
+        # Every prompt in a batch reports the batch's aggregate metrics
+        for (index, _), (_, token_ids) in zip(batch, outputs):
+            if queue is not None:
+                queue.complete(index, [rank, hostname, token_ids, metrics.to_list()])
+            else:
+                results.append((index, token_ids, metrics.to_list()))
+    lost = []
+    if queue is not None:
+        lost = queue.lost
+        queue.close()
+
+    if lost:
+        # Collectives would wait forever on the lost ranks: report and leave
+        if rank == 0:
+            wait_for_results(server, args.result_wait)
+            print_responses(server.results, prompts, tokenizer)
+            report_lost(server, lost)
+            server.close()
+        print(f"[Rank {rank}@{hostname}] ⚠️  Skipping final collectives; lost ranks {lost}", flush=True)
+        sys.stdout.flush()
+        os._exit(1 if rank in lost else 0)
+
+    # Without heartbeats the queue holds no leases, so rank 0's loop can end
+    # while other ranks still generate; the barrier waits for their results
+    barrier("generate")
+    if rank == 0:
+        if server is not None:
+            wait_for_results(server, args.result_wait)
+            print_responses(server.results, prompts, tokenizer)
+        else:
+            print_responses({index: (0, hostname, token_ids, values) for index, token_ids, values in results},
+                            prompts, tokenizer)
+    sync = barrier_report(hostname)
+    memory = gather_memory(sampler.stop(), hostname, rank) if sampler else None
+    if args.trace:
+        clock = estimate_clock_offsets(hostname, rank, method=args.trace_clock)
+        trace = gather_trace(hostname, rank, clock)
 
     if rank == 0:
-        print(f"
-✅ Distributed inference complete!")
-        print(f"🎉 Generated {size} responses across Mac cluster")
+        print(f"\n✅ Distributed inference complete!")
+        print(f"🎉 Generated {len(prompts)} responses across Mac cluster")
+        if server is not None:
+            server.close()
+            print(f"📦 Prompts per rank: {dict(sorted(server.assigned.items()))}")
+            report_lost(server, lost)
+        print_barrier_report(sync)
+        if memory:
+            print_memory_report(memory)
+            if args.memory_log:
+                with open(args.memory_log, "w") as f:
+                    json.dump(memory, f)
+                print(f"📁 Memory series written to {args.memory_log}")
+        if args.trace:
+            write_trace(args.trace, trace)
+            print_clock_report(clock)
+            print(f"📁 Trace written to {args.trace} (open in ui.perfetto.dev)")
 
 if __name__ == "__main__":
     main()
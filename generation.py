@@ -0,0 +1,269 @@
+import time
+from dataclasses import dataclass, fields
+
+import mlx.core as mx
+from mlx_lm import stream_generate
+from mlx_lm.generate import generate_step
+from mlx_lm.models.cache import make_prompt_cache
+
+from memory_monitor import set_phase
+from tracing import add_span
+
+# Generation paths shared by the inference scripts. Each one returns a
+# GenerationMetrics taken from its own loop, which is the only source for
+# the "⚡ ... tok/s" lines and PERF records; nothing re-encodes output.
+#
+# batch_generate left-pads prompts to a common length and prefills them
+# in a single forward pass into one batched KV cache. Each decode step
+# then runs a (B, 1) matmul instead of B separate batch-1 steps. A boolean
+# mask hides every row's padding, and because RoPE only sees relative
+# positions the shift introduced by left padding does not change output.
+
+
+@dataclass
+class GenerationMetrics:
+    prompt_tokens: int = 0
+    generation_tokens: int = 0
+    prefill_s: float = 0.0
+    decode_s: float = 0.0
+    peak_memory_mb: float = 0.0
+    batch_size: int = 1
+    ttft_s: float = 0.0
+    itl_mean_s: float = 0.0
+    itl_p95_s: float = 0.0
+
+    @property
+    def total_s(self):
+        return self.prefill_s + self.decode_s
+
+    @property
+    def prefill_tps(self):
+        return self.prompt_tokens / self.prefill_s if self.prefill_s > 0 else 0.0
+
+    @property
+    def decode_tps(self):
+        # The first token of each sequence comes out of prefill
+        decoded = max(self.generation_tokens - self.batch_size, 0)
+        return decoded / self.decode_s if self.decode_s > 0 else 0.0
+
+    def summary(self):
+        return (f"{self.decode_tps:.1f} tok/s decode, {self.prefill_tps:.1f} tok/s prefill "
+                f"({self.generation_tokens} tokens, {self.prefill_s:.2f}s + {self.decode_s:.2f}s, "
+                f"peak {self.peak_memory_mb:.0f}MB)")
+
+    def to_list(self):
+        return [float(getattr(self, f.name)) for f in fields(self)]
+
+    @classmethod
+    def from_list(cls, values):
+        kwargs = {}
+        for f, value in zip(fields(cls), values):
+            kwargs[f.name] = int(value) if f.type in (int, "int") else float(value)
+        return cls(**kwargs)
+
+    @classmethod
+    def combine(cls, metrics):
+        # Sum work and time over several runs; peak is the max
+        metrics = list(metrics)
+        return cls(
+            prompt_tokens=sum(m.prompt_tokens for m in metrics),
+            generation_tokens=sum(m.generation_tokens for m in metrics),
+            prefill_s=sum(m.prefill_s for m in metrics),
+            decode_s=sum(m.decode_s for m in metrics),
+            peak_memory_mb=max((m.peak_memory_mb for m in metrics), default=0.0),
+            batch_size=sum(m.batch_size for m in metrics),
+        )
+
+
+def reset_peak_memory():
+    for owner in (mx, getattr(mx, "metal", None)):
+        if hasattr(owner, "reset_peak_memory"):
+            owner.reset_peak_memory()
+            return
+
+
+def peak_memory_mb():
+    for owner in (mx, getattr(mx, "metal", None)):
+        if hasattr(owner, "get_peak_memory"):
+            return owner.get_peak_memory() / 1024 / 1024
+    return 0.0
+
+
+def encode_prompt(tokenizer, prompt):
+    if isinstance(prompt, str):
+        return tokenizer.encode(prompt)
+    return list(prompt)
+
+
+def stop_token_ids(tokenizer):
+    ids = getattr(tokenizer, "eos_token_ids", None)
+    if ids:
+        return set(ids)
+    eos = getattr(tokenizer, "eos_token_id", None)
+    return set() if eos is None else {eos}
+
+
+def padding_mask(pads, length, offset):
+    # (B, 1, L, offset + L): causal, with each row's left padding hidden.
+    # Padding queries may still see their own slot so no row is empty.
+    total = offset + length
+    queries = mx.arange(offset, total)[:, None]
+    keys = mx.arange(total)[None]
+    real = keys[None] >= mx.array(pads)[:, None, None]
+    allowed = (keys <= queries)[None] & (real | (keys == queries)[None])
+    return allowed[:, None]
+
+
+def sample(logits, temp):
+    if temp == 0:
+        return mx.argmax(logits, axis=-1)
+    return mx.random.categorical(logits * (1 / temp))
+
+
+def batch_generate(model, tokenizer, prompts, max_tokens=100, temp=0.0, stop_tokens=None):
+    # Prompts may be strings or token-id lists. Returns one
+    # (text, token_ids) pair per prompt plus aggregate metrics; text is
+    # None when no tokenizer is given.
+    encoded = [encode_prompt(tokenizer, p) for p in prompts]
+    if stop_tokens is None:
+        stop_tokens = stop_token_ids(tokenizer) if tokenizer is not None else set()
+
+    batch = len(encoded)
+    width = max(len(ids) for ids in encoded)
+    pads = [width - len(ids) for ids in encoded]
+    inputs = mx.array([[0] * pad + ids for pad, ids in zip(pads, encoded)])
+
+    cache = make_prompt_cache(model)
+    outputs = [[] for _ in range(batch)]
+    finished = [False] * batch
+    reset_peak_memory()
+
+    # Prefill: one pass over the padded prompt block
+    set_phase("prefill")
+    start = time.perf_counter()
+    logits = model(inputs, mask=padding_mask(pads, width, 0), cache=cache)
+    tokens = sample(logits[:, -1, :], temp)
+    mx.eval(tokens)
+    prefill_s = time.perf_counter() - start
+    add_span("prefill", start, start + prefill_s, batch=batch, tokens=width)
+
+    # Decode: one batched step per token until every row has stopped
+    set_phase("decode")
+    start = time.perf_counter()
+    offset = width
+    for _ in range(max_tokens):
+        for row, token in enumerate(tokens.tolist()):
+            if finished[row]:
+                continue
+            if token in stop_tokens:
+                finished[row] = True
+            else:
+                outputs[row].append(token)
+                finished[row] = len(outputs[row]) >= max_tokens
+        if all(finished):
+            break
+
+        logits = model(tokens[:, None], mask=padding_mask(pads, 1, offset), cache=cache)
+        tokens = sample(logits[:, -1, :], temp)
+        mx.eval(tokens)
+        offset += 1
+    decode_s = time.perf_counter() - start
+    add_span("decode", start, start + decode_s, batch=batch, steps=offset - width)
+
+    metrics = GenerationMetrics(
+        prompt_tokens=sum(len(ids) for ids in encoded),
+        generation_tokens=sum(len(ids) for ids in outputs),
+        prefill_s=prefill_s,
+        decode_s=decode_s,
+        peak_memory_mb=peak_memory_mb(),
+        batch_size=batch,
+        ttft_s=prefill_s,
+    )
+
+    results = []
+    for ids in outputs:
+        text = tokenizer.decode(ids) if tokenizer is not None else None
+        results.append((text, ids))
+    return results, metrics
+
+
+def generate_tokens(model, tokenizer, prompt, max_tokens=100, **kwargs):
+    # Single-prompt generation that keeps the generated token ids, so
+    # callers can ship ids between ranks and never re-encode the text.
+    # Extra kwargs go straight to mlx_lm's generate_step.
+    prompt_ids = encode_prompt(tokenizer, prompt)
+    stop_tokens = stop_token_ids(tokenizer)
+    token_ids = []
+    reset_peak_memory()
+
+    set_phase("prefill")
+    start = time.perf_counter()
+    first_token_time = None
+    for _, (token, _) in zip(range(max_tokens), generate_step(mx.array(prompt_ids), model, **kwargs)):
+        if first_token_time is None:
+            first_token_time = time.perf_counter()
+            set_phase("decode")
+        token = token.item() if isinstance(token, mx.array) else token
+        if token in stop_tokens:
+            break
+        token_ids.append(token)
+    end = time.perf_counter()
+
+    first_token_time = first_token_time or end
+    add_span("prefill", start, first_token_time, tokens=len(prompt_ids))
+    add_span("decode", first_token_time, end, tokens=len(token_ids))
+    metrics = GenerationMetrics(
+        prompt_tokens=len(prompt_ids),
+        generation_tokens=len(token_ids),
+        prefill_s=first_token_time - start,
+        decode_s=end - first_token_time,
+        peak_memory_mb=peak_memory_mb(),
+        ttft_s=first_token_time - start,
+    )
+    return token_ids, metrics
+
+
+def stream_tokens(model, tokenizer, prompt, max_tokens=100, on_text=None, **kwargs):
+    # Streaming generation on top of mlx_lm.stream_generate. on_text is
+    # called with each detokenized segment as soon as it is produced.
+    # Timings come from the loop itself: time to first token (prefill),
+    # gaps between tokens, and the decode span after the first token.
+    segments = []
+    gaps = []
+    first = None
+    last = None
+    final = None
+    reset_peak_memory()
+
+    set_phase("prefill")
+    start = time.perf_counter()
+    for response in stream_generate(model, tokenizer, prompt, max_tokens=max_tokens, **kwargs):
+        now = time.perf_counter()
+        if first is None:
+            first = now
+            set_phase("decode")
+        else:
+            gaps.append(now - last)
+        last = now
+        if response.text:
+            segments.append(response.text)
+            if on_text is not None:
+                on_text(response.text)
+        final = response
+
+    first = first or start
+    last = last or start
+    add_span("prefill", start, first)
+    add_span("decode", first, last, tokens=len(gaps) + 1 if final else 0)
+    gaps.sort()
+    metrics = GenerationMetrics(
+        prompt_tokens=final.prompt_tokens if final else 0,
+        generation_tokens=final.generation_tokens if final else 0,
+        prefill_s=first - start,
+        decode_s=last - first,
+        peak_memory_mb=peak_memory_mb(),
+        ttft_s=first - start,
+        itl_mean_s=sum(gaps) / len(gaps) if gaps else 0.0,
+        itl_p95_s=gaps[int(0.95 * (len(gaps) - 1))] if gaps else 0.0,
+    )
+    return "".join(segments), metrics
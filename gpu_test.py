@@ -2,6 +2,10 @@
 import mlx.core as mx
 import socket
 
+from dist_utils import barrier
+from memory_monitor import memory_snapshot
+from metrics import Metrics, gather_metrics, write_jsonl
+
 def main():
     world = mx.distributed.init()
     rank = world.rank()
@@ -9,20 +13,22 @@ def main():
 
     mx.set_default_device(mx.gpu)
 
+    # One record per rank: mlx_gpu_ok is 1 or 0, failures carry an error label
+    metrics = Metrics(rank, hostname)
     try:
         # Test GPU operation
         test_array = mx.ones((1000, 1000))
         mx.eval(test_array)
 
-        # Get GPU memory info
-        mem_info = mx.metal.get_memory_info()
-        allocated = mem_info["allocated"] / 1024 / 1024  # MB
-
-        print(f"GPU_STATUS|RANK_{rank}|HOST_{hostname}|MEMORY_{allocated:.1f}MB|STATUS_OK")
+        metrics.gauge("mlx_gpu_ok", 1, "GPU ran a test operation", agg="sum")
+        metrics.gauge("mlx_memory_active_mb", memory_snapshot()[1], "Memory in use after the test", "MB")
     except Exception as e:
-        print(f"GPU_STATUS|RANK_{rank}|HOST_{hostname}|ERROR_{str(e)}")
+        metrics.gauge("mlx_gpu_ok", 0, "GPU ran a test operation", agg="sum", error=str(e)[:200])
 
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("exit")
+    records = gather_metrics(metrics)
+    if rank == 0:
+        write_jsonl(records)
 
 if __name__ == "__main__":
     main()
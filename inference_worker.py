@@ -0,0 +1,192 @@
+import mlx.core as mx
+import argparse
+import socket
+import sys
+import threading
+import time
+
+from dist_utils import barrier, barrier_report, broadcast_text, gather_results, print_barrier_report
+from generation import GenerationMetrics, generate_tokens
+from metrics import Metrics, aggregate, record_generation, serve_prometheus
+from model_loader import load_model, model_source
+from prefix_cache import PrefixCache, generate_cached
+
+# Long-lived distributed inference worker.
+#
+# Every rank loads the model once and keeps it resident. Rank 0 reads
+# prompts from stdin (default) or from a local TCP socket and broadcasts
+# each one to all ranks, so a prompt only costs generation time.
+#
+#   mlx.launch ... inference_worker.py               # prompts on stdin
+#   mlx.launch ... inference_worker.py --port 7777   # prompts over a socket
+#   python inference_worker.py --send "Write a haiku" --port 7777
+#
+# Send "/quit" (or close stdin) to shut down all ranks.
+#
+# KV states of prompt prefixes are kept between prompts (--prefix-cache-mb),
+# so prompts sharing a long instruction prefix only prefill what differs.
+
+MODEL = "mlx-community/Llama-3.2-1B-Instruct-4bit"
+QUIT = "/quit"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Persistent MLX inference worker")
+    parser.add_argument("--port", type=int, default=None,
+                        help="Accept prompts on 127.0.0.1:PORT instead of stdin")
+    parser.add_argument("--max-tokens", type=int, default=120)
+    parser.add_argument("--prefix-cache-mb", type=float, default=256,
+                        help="Memory budget for reused prompt-prefix KV states (0 disables)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve every rank's metrics in Prometheus format on rank 0 (/metrics)")
+    parser.add_argument("--send", default=None,
+                        help="Client mode: send one prompt to a running worker and print the reply")
+    return parser.parse_args()
+
+
+def cluster_records(cluster, lock):
+    # Called from the HTTP thread while the main thread adds nodes
+    with lock:
+        nodes = sorted(cluster.items())
+    records = [r for _, node_metrics in nodes for r in node_metrics.records()]
+    return records + aggregate(records)
+
+
+def send_prompt(prompt, port):
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as conn:
+        conn.settimeout(None)
+        conn.sendall(prompt.replace("\n", " ").encode("utf-8") + b"\n")
+        reply = conn.makefile("r", encoding="utf-8")
+        for line in reply:
+            print(line, end="")
+
+
+def stdin_prompts():
+    for line in sys.stdin:
+        yield line.strip(), None
+
+
+def socket_prompts(port):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", port))
+    server.listen()
+    try:
+        while True:
+            conn, _ = server.accept()
+            line = conn.makefile("r", encoding="utf-8").readline()
+            yield line.strip(), conn
+    finally:
+        server.close()
+
+
+def main():
+    args = parse_args()
+
+    if args.send is not None:
+        try:
+            send_prompt(args.send, args.port or 7777)
+        except OSError as e:
+            print(f"❌ No worker listening on port {args.port or 7777}: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    world = mx.distributed.init()
+    rank = world.rank()
+    size = world.size()
+    hostname = socket.gethostname()
+
+    mx.set_default_device(mx.gpu)
+
+    # Load model once; it stays resident for every prompt below
+    print(f"[Rank {rank}@{hostname}] Loading model...")
+    start_time = time.time()
+    model, tokenizer = load_model(model_source(MODEL))
+    load_time = time.time() - start_time
+    print(f"[Rank {rank}@{hostname}] ✅ Model loaded in {load_time:.1f}s (paid once)")
+
+    prefix_cache = PrefixCache(budget_mb=args.prefix_cache_mb) if args.prefix_cache_mb > 0 else None
+
+    barrier("load")
+
+    # Rank 0 records every rank's generations from the per-prompt gather,
+    # so the metrics endpoint costs no extra collectives
+    cluster = {}
+    cluster_lock = threading.Lock()
+    if rank == 0 and args.metrics_port:
+        serve_prometheus(args.metrics_port, lambda: cluster_records(cluster, cluster_lock))
+        print(f"📈 Metrics on http://0.0.0.0:{args.metrics_port}/metrics", flush=True)
+
+    if rank == 0:
+        source = f"127.0.0.1:{args.port}" if args.port else "stdin"
+        print(f"🟢 Worker ready on {size} processes, reading prompts from {source}", flush=True)
+        prompts = socket_prompts(args.port) if args.port else stdin_prompts()
+
+    served = 0
+    while True:
+        conn = None
+        prompt = None
+        if rank == 0:
+            for prompt, conn in prompts:
+                if prompt:
+                    break
+                if conn is not None:
+                    conn.close()
+            else:
+                prompt = QUIT
+            if prompt == QUIT:
+                prompt = None
+
+        prompt = broadcast_text(prompt, rank)
+        if prompt is None:
+            if conn is not None:
+                conn.close()
+            break
+
+        if prefix_cache is not None:
+            token_ids, metrics, _ = generate_cached(model, tokenizer, prompt, prefix_cache,
+                                                    max_tokens=args.max_tokens)
+        else:
+            token_ids, metrics = generate_tokens(model, tokenizer, prompt, max_tokens=args.max_tokens)
+
+        # One gather per prompt; rank 0 decodes, prints and replies
+        gathered = gather_results([(0, token_ids, metrics.to_list())], hostname)
+
+        if rank == 0:
+            reply = []
+            for node, (node_host, node_results) in enumerate(gathered):
+                for _, node_tokens, values in node_results:
+                    with cluster_lock:
+                        node_metrics = cluster.setdefault(node, Metrics(node, node_host))
+                    record_generation(node_metrics, GenerationMetrics.from_list(values))
+                    node_metrics.inc("mlx_prompts_total", 1, "Prompts served")
+                    reply += [
+                        f"\n🖥️  Node {node} ({node_host}):",
+                        f"🎨 {tokenizer.decode(node_tokens).strip()}",
+                        f"⚡ {GenerationMetrics.from_list(values).summary()}",
+                        "-" * 50,
+                    ]
+            if prefix_cache is not None:
+                reply.append(f"♻️  Prefix cache: {prefix_cache.summary()}")
+            reply = "\n".join(reply) + "\n"
+            print(reply, end="", flush=True)
+
+            if conn is not None:
+                try:
+                    conn.sendall(reply.encode("utf-8"))
+                except OSError:
+                    pass
+                conn.close()
+
+        served += 1
+
+    barrier("exit")
+    sync = barrier_report(hostname)
+
+    if rank == 0:
+        print(f"\n✅ Worker stopped after {served} prompts (model loaded once in {load_time:.1f}s)")
+        print_barrier_report(sync)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 
 import mlx.core as mx
-from mlx_lm import load, generate
+from mlx_lm import load
 import socket
 import time
 import sys
 
+from generation import generate_tokens
+
 def main():
     # Get process ID from command line
     process_id = int(sys.argv[1]) if len(sys.argv) > 1 else 0
@@ -37,17 +39,12 @@ def main():
 
     print(f"📝 Process {process_id}: Generating for '{actual_prompt[:50]}...'")
 
-    start_time = time.time()
     try:
-        response = generate(model, tokenizer, actual_prompt, max_tokens=100)
-        gen_time = time.time() - start_time
-
-        tokens = len(tokenizer.encode(response))
-        speed = tokens / gen_time if gen_time > 0 else 0
+        token_ids, metrics = generate_tokens(model, tokenizer, actual_prompt, max_tokens=100)
 
         print(f"\n🎭 === RESPONSE FROM PROCESS {process_id} ===")
-        print(f"📝 {response.strip()}")
-        print(f"⚡ {speed:.1f} tok/s ({gen_time:.2f}s, {tokens} tokens)")
+        print(f"📝 {tokenizer.decode(token_ids).strip()}")
+        print(f"⚡ {metrics.summary()}")
         print("=" * 50)
 
     except Exception as e:
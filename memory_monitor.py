@@ -0,0 +1,148 @@
+import mlx.core as mx
+import json
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from dist_utils import all_gather_text
+
+# Background memory telemetry.
+#
+# A daemon thread samples the allocator every --interval seconds and
+# tags each sample with the current phase (load, prefill, decode, ...).
+# The allocator's peak counter only grows between resets, so a sample
+# taken after a short prefill still sees that prefill's transient peak.
+# The counter is cumulative, so a phase is only charged a peak that moved
+# while it was running. Otherwise its peak is its highest sampled active
+# memory, and decode does not inherit the prefill or load spike. The
+# counter is not reset here, because generation.py resets and reads it
+# for each generation's own peak.
+#
+# Phases are set with sampler.phase("load") around a block, or with
+# set_phase() from code that does not hold the sampler (generation.py
+# marks prefill and decode this way); both are no-ops without a running
+# sampler.
+#
+# Without MLX memory counters (old or CPU-only builds) the sampler falls
+# back to the process's peak RSS and reports source "rss".
+
+MB = 1024 * 1024
+_active = []
+
+
+def memory_snapshot():
+    # (source, active_mb, peak_mb, cache_mb)
+    for owner in (mx, getattr(mx, "metal", None)):
+        if owner is not None and hasattr(owner, "get_active_memory"):
+            cache = owner.get_cache_memory() if hasattr(owner, "get_cache_memory") else 0
+            return "mlx", owner.get_active_memory() / MB, owner.get_peak_memory() / MB, cache / MB
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / MB if sys.platform == "darwin" else rss / 1024
+    return "rss", rss_mb, rss_mb, 0.0
+
+
+def set_phase(name):
+    if _active:
+        _active[-1].set_phase(name)
+
+
+class MemorySampler:
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.samples = []  # (t, phase, active_mb, peak_mb, cache_mb)
+        self.source = memory_snapshot()[0]
+        self.current = "idle"
+        self._start = time.perf_counter()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        _active.append(self)
+        self.sample()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        if self in _active:
+            _active.remove(self)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        _, active, peak, cache = memory_snapshot()
+        with self._lock:
+            self.samples.append((time.perf_counter() - self._start, self.current, active, peak, cache))
+
+    def set_phase(self, name):
+        # Close the previous phase and open the next with a sample each
+        self.sample()
+        with self._lock:
+            self.current = name
+        self.sample()
+
+    @contextmanager
+    def phase(self, name):
+        previous = self.current
+        self.set_phase(name)
+        try:
+            yield
+        finally:
+            self.set_phase(previous)
+
+    def summary(self):
+        # {phase: {"seconds", "samples", "active_mb", "peak_mb", "cache_mb"}} (maxima)
+        phases = {}
+        with self._lock:
+            samples = list(self.samples)
+        previous = None
+        for t, phase, active, peak, cache in samples:
+            entry = phases.setdefault(phase, {"start": t, "end": t, "samples": 0,
+                                              "active_mb": 0.0, "peak_mb": 0.0, "cache_mb": 0.0})
+            entry["end"] = t
+            entry["samples"] += 1
+            entry["active_mb"] = max(entry["active_mb"], active)
+            # A peak counter that moved (grew, or was reset) since the last sample belongs to this phase
+            moved = previous is None or peak != previous
+            entry["peak_mb"] = max(entry["peak_mb"], active, peak if moved else 0.0)
+            entry["cache_mb"] = max(entry["cache_mb"], cache)
+            previous = peak
+        return {name: {"seconds": e.pop("end") - e.pop("start"), **e} for name, e in phases.items()}
+
+    def to_dict(self, hostname, rank):
+        return {"rank": rank, "host": hostname, "source": self.source, "interval_s": self.interval,
+                "summary": self.summary(),
+                "samples": [[round(t, 4), phase, round(a, 2), round(p, 2), round(c, 2)]
+                            for t, phase, a, p, c in self.samples]}
+
+
+def gather_memory(sampler, hostname, rank):
+    # Must be called on all ranks together; every rank's series, in rank order
+    return [json.loads(text) for text in all_gather_text(json.dumps(sampler.to_dict(hostname, rank)))]
+
+
+def print_memory_report(series):
+    print("\n🧠 Memory per phase (MB, maxima over samples)")
+    print(f"{'rank':>4} {'host':<14} {'phase':<10} {'active':>8} {'peak':>8} {'cache':>8} {'seconds':>8}")
+    for s in series:
+        for phase, e in s["summary"].items():
+            print(f"{s['rank']:>4} {s['host']:<14} {phase:<10} {e['active_mb']:>8.1f} {e['peak_mb']:>8.1f} "
+                  f"{e['cache_mb']:>8.1f} {e['seconds']:>8.2f}")
+    sources = {s["source"] for s in series}
+    if sources != {"mlx"}:
+        print("⚠️  Some ranks have no MLX memory counters; their numbers are process peak RSS")
@@ -0,0 +1,191 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dist_utils import all_gather_text
+
+# Structured metrics.
+#
+# Each rank records gauges, counters and histograms in a Metrics object.
+# gather_metrics() merges every rank's series on all ranks with one
+# collective, adding cluster-wide aggregates with rank="all": counters
+# and histograms are summed, gauges use their "agg" (max by default,
+# sum for rates such as tokens/s). The result is exported as:
+#
+#   JSON lines  one record per series, first key "schema", so a consumer
+#               can pick records out of mixed stdout with
+#               line.startswith(RECORD_PREFIX) and json.loads(line)
+#   Prometheus  text exposition format, written to a file (for the
+#               node_exporter textfile collector) or served on /metrics
+#
+# Record schema (SCHEMA):
+#   {"schema", "ts", "name", "type": "gauge"|"counter"|"histogram",
+#    "help", "unit", "labels": {"rank", "host", ...},
+#    "value"                                   gauge, counter
+#    "agg": "max"|"sum"                        gauge
+#    "buckets": [[le, cumulative count], ...], "count", "sum"   histogram}
+
+SCHEMA = "mlx-dist/metrics/v1"
+RECORD_PREFIX = '{"schema": "' + SCHEMA + '"'
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Metrics:
+    def __init__(self, rank, host, **labels):
+        self.labels = {"rank": str(rank), "host": host, **{k: str(v) for k, v in labels.items()}}
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def _get(self, name, kind, help, unit, labels, **init):
+        labels = {**self.labels, **{k: str(v) for k, v in labels.items()}}
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.series:
+                self.series[key] = {"name": name, "type": kind, "help": help, "unit": unit,
+                                    "labels": labels, **init}
+            return self.series[key]
+
+    def gauge(self, name, value, help="", unit="", agg="max", **labels):
+        series = self._get(name, "gauge", help, unit, labels, value=0.0, agg=agg)
+        series["value"] = float(value)
+
+    def inc(self, name, value=1, help="", unit="", **labels):
+        series = self._get(name, "counter", help, unit, labels, value=0.0)
+        with self.lock:
+            series["value"] += value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, help="", unit="seconds", **labels):
+        series = self._get(name, "histogram", help, unit, labels,
+                           buckets=[[le, 0] for le in buckets] + [["+Inf", 0]], count=0, sum=0.0)
+        with self.lock:
+            for bucket in series["buckets"]:
+                if bucket[0] == "+Inf" or value <= bucket[0]:
+                    bucket[1] += 1
+            series["count"] += 1
+            series["sum"] += value
+
+    def records(self):
+        now = time.time()
+        with self.lock:
+            return [{"schema": SCHEMA, "ts": now, **json.loads(json.dumps(s))} for s in self.series.values()]
+
+
+def aggregate(records):
+    # Cluster-wide series (rank="all", host="all") for every metric name
+    merged = {}
+    for r in records:
+        if r["labels"].get("rank") == "all":
+            continue
+        labels = {**r["labels"], "rank": "all", "host": "all"}
+        key = (r["name"], tuple(sorted(labels.items())))
+        if key not in merged:
+            merged[key] = {**json.loads(json.dumps(r)), "labels": labels}
+            continue
+        m = merged[key]
+        if r["type"] == "histogram":
+            for bucket, other in zip(m["buckets"], r["buckets"]):
+                bucket[1] += other[1]
+            m["count"] += r["count"]
+            m["sum"] += r["sum"]
+        elif r["type"] == "gauge" and r.get("agg", "max") == "max":
+            m["value"] = max(m["value"], r["value"])
+        else:
+            m["value"] += r["value"]
+    return list(merged.values())
+
+
+def gather_metrics(metrics):
+    # Must be called on all ranks together. Every rank's records plus the
+    # cluster aggregates, on every rank.
+    records = [r for text in all_gather_text(json.dumps(metrics.records())) for r in json.loads(text)]
+    return records + aggregate(records)
+
+
+def write_jsonl(records, stream=None):
+    # Appends to a path, or writes to a stream (stdout by default)
+    if isinstance(stream, str):
+        with open(stream, "a") as f:
+            write_jsonl(records, f)
+        return
+    stream = stream or sys.stdout
+    for r in records:
+        stream.write(json.dumps(r) + "\n")
+    stream.flush()
+
+
+def read_jsonl(lines):
+    # Records from JSON lines mixed with other output
+    return [json.loads(line) for line in lines if line.startswith(RECORD_PREFIX)]
+
+
+def _prom_labels(labels, extra=None):
+    items = {**labels, **(extra or {})}
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    text = ",".join(f'{k}="{escape(v)}"' for k, v in sorted(items.items()))
+    return "{" + text + "}" if text else ""
+
+
+def to_prometheus(records):
+    lines = []
+    seen = set()
+    for r in sorted(records, key=lambda r: r["name"]):
+        name = r["name"]
+        if name not in seen:
+            seen.add(name)
+            if r.get("help"):
+                lines.append(f"# HELP {name} {r['help']}")
+            lines.append(f"# TYPE {name} {r['type']}")
+        if r["type"] == "histogram":
+            for le, count in r["buckets"]:
+                lines.append(f"{name}_bucket{_prom_labels(r['labels'], {'le': le})} {count}")
+            lines.append(f"{name}_count{_prom_labels(r['labels'])} {r['count']}")
+            lines.append(f"{name}_sum{_prom_labels(r['labels'])} {r['sum']}")
+        else:
+            lines.append(f"{name}{_prom_labels(r['labels'])} {r['value']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path, records):
+    # Atomic replace, so a scraper never reads a half-written file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(to_prometheus(records))
+    os.replace(tmp, path)
+
+
+def serve_prometheus(port, get_records):
+    # /metrics on a background thread; get_records() is called per scrape
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = to_prometheus(get_records()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def record_generation(metrics, m, **labels):
+    # Standard series for one GenerationMetrics
+    metrics.inc("mlx_generated_tokens_total", m.generation_tokens, "Tokens generated", **labels)
+    metrics.inc("mlx_prompt_tokens_total", m.prompt_tokens, "Prompt tokens processed", **labels)
+    metrics.observe("mlx_generation_seconds", m.total_s, help="Prefill + decode time per generation", **labels)
+    metrics.observe("mlx_ttft_seconds", m.ttft_s, help="Time to first token", **labels)
+    metrics.gauge("mlx_decode_tokens_per_second", m.decode_tps, "Decode throughput of the last generation",
+                  "tokens/s", agg="sum", **labels)
+    metrics.gauge("mlx_prefill_tokens_per_second", m.prefill_tps, "Prefill throughput of the last generation",
+                  "tokens/s", agg="sum", **labels)
+    metrics.gauge("mlx_peak_memory_mb", m.peak_memory_mb, "Peak memory of the last generation", "MB", **labels)
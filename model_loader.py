@@ -0,0 +1,77 @@
+import resource
+import time
+
+from mlx_lm import load
+from mlx_lm.utils import get_model_path
+
+from dist_utils import all_gather_text, host_layout
+from packed_model import is_packed, load_packed, packed_dir
+from tracing import traced
+
+# Host-local model resolution.
+#
+# With several ranks per host (mlx_hostfile.txt runs two per Mac), only
+# the lowest rank on each host resolves/downloads the model, so a host
+# fetches it from the Hub once instead of once per rank. The other ranks
+# wait for the local path and then every rank loads it itself. Loading is
+# not shared: each process reads and holds its own copy of the weights.
+
+# A copy converted with `python packed_model.py pack` is preferred when
+# present (unless lazy: packed weights are always read in full).
+
+MODEL = "mlx-community/Llama-3.2-1B-Instruct-4bit"
+
+
+def resolve_model_path(repo):
+    path = get_model_path(repo)
+    return str(path[0] if isinstance(path, tuple) else path)
+
+
+def load_model(path, lazy=False):
+    # path is a local snapshot or a packed directory
+    if not lazy and is_packed(path):
+        return load_packed(path)
+    return load(path, lazy=lazy)
+
+
+def model_source(repo, lazy=False):
+    # Packed copy if there is one, else the (downloaded) snapshot
+    packed = packed_dir(repo)
+    if not lazy and is_packed(packed):
+        return packed
+    return resolve_model_path(repo)
+
+
+def disk_reads():
+    # Block input operations for this process (disk, not page cache)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_inblock
+
+
+@traced("load", "load model")
+def load_host_shared(hostname, rank, repo=MODEL, lazy=False):
+    # Must be called on all ranks together. Returns (model, tokenizer,
+    # info) where info describes this rank's role and load cost. With
+    # lazy=True weights are only read when first evaluated.
+    _, local_rank, local_size, leader = host_layout(hostname, rank)
+    is_leader = rank == leader
+
+    reads_before = disk_reads()
+    start = time.time()
+    path = model_source(repo, lazy) if is_leader else ""
+
+    # Doubles as the barrier: followers wait for the download, then load on their own
+    wait_start = time.time()
+    paths = all_gather_text(path)
+    wait_time = time.time() - wait_start
+
+    model, tokenizer = load_model(paths[leader], lazy=lazy)
+
+    info = {
+        "role": "leader" if is_leader else "follower",
+        "local_rank": local_rank,
+        "local_size": local_size,
+        "load_time": time.time() - start,  # wall clock, including wait_time
+        "wait_time": wait_time,
+        "disk_reads": disk_reads() - reads_before,
+    }
+    return model, tokenizer, info
@@ -0,0 +1,215 @@
+import mlx.core as mx
+import mlx.nn as nn
+import argparse
+import glob
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Packed, memory-mappable model format.
+#
+# `load()` resolves the Hugging Face repo, parses config.json and every
+# safetensors header, sanitizes the weight names and quantizes modules
+# on each start. `pack` does all of that once and writes the final
+# parameters into one weights.bin with every tensor at a page-aligned
+# offset, next to an index (packed.json), the config and the tokenizer
+# files. `load_packed` then builds the model from the config, maps
+# weights.bin and hands each tensor slice straight to MLX: no hub
+# lookup, no header parsing and no sanitize step.
+#
+# MLX arrays own their memory, so each tensor is still copied once out
+# of the mapping (from the page cache when warm); page alignment keeps
+# that copy a straight read of whole pages.
+#
+#   python packed_model.py pack                 # -> ~/.cache/mlx-dist-setup/packed/<repo>
+#   python packed_model.py bench --reps 5       # cold/warm load vs mlx_lm.load
+#
+# model_loader.load_model() prefers the packed copy when one exists.
+
+PACKED_ROOT = os.path.expanduser("~/.cache/mlx-dist-setup/packed")
+INDEX = "packed.json"
+WEIGHTS = "weights.bin"
+VERSION = 1
+ALIGN = 16384  # Apple Silicon page size
+
+
+def packed_dir(repo, root=PACKED_ROOT):
+    return os.path.join(root, repo.strip("/").replace("/", "--"))
+
+
+def is_packed(path):
+    try:
+        with open(os.path.join(path, INDEX)) as f:
+            return json.load(f).get("version") == VERSION
+    except (OSError, ValueError):
+        return False
+
+
+def _dtype_name(dtype):
+    return str(dtype).rsplit(".", 1)[-1]
+
+
+def _storage(name):
+    # numpy has no bfloat16: store it as raw 16-bit words
+    return np.uint16 if name == "bfloat16" else np.dtype(name)
+
+
+def pack(source, out_dir):
+    # source is a local snapshot (see model_loader.resolve_model_path)
+    from mlx.utils import tree_flatten
+    from mlx_lm import load
+
+    model, _ = load(source)
+    os.makedirs(out_dir, exist_ok=True)
+
+    tensors = {}
+    offset = 0
+    with open(os.path.join(out_dir, WEIGHTS), "wb") as f:
+        for name, array in tree_flatten(model.parameters()):
+            dtype = _dtype_name(array.dtype)
+            if dtype == "bfloat16":
+                array = array.view(mx.uint16)
+            data = np.array(array).tobytes()
+            offset = -(-offset // ALIGN) * ALIGN
+            f.seek(offset)
+            f.write(data)
+            tensors[name] = {"dtype": dtype, "shape": list(array.shape), "offset": offset, "nbytes": len(data)}
+            offset += len(data)
+        f.truncate(-(-offset // ALIGN) * ALIGN)
+
+    # Config and tokenizer files travel as they are
+    for path in glob.glob(os.path.join(source, "*")):
+        name = os.path.basename(path)
+        if os.path.isfile(path) and not name.endswith(".safetensors") and name != "model.safetensors.index.json":
+            shutil.copy2(path, os.path.join(out_dir, name))
+
+    # Written last, so an interrupted pack is never taken for a valid one
+    with open(os.path.join(out_dir, INDEX), "w") as f:
+        json.dump({"version": VERSION, "align": ALIGN, "source": str(source), "tensors": tensors}, f)
+    return offset
+
+
+def load_packed(path):
+    # Returns (model, tokenizer) with every weight evaluated
+    from mlx_lm.tokenizer_utils import load_tokenizer
+    from mlx_lm.utils import _get_classes, load_config
+
+    with open(os.path.join(path, INDEX)) as f:
+        index = json.load(f)
+    config = load_config(Path(path))
+    model_class, args_class = _get_classes(config=config)
+    model = model_class(args_class.from_dict(config))
+
+    quantization = config.get("quantization")
+    if quantization:
+        def class_predicate(p, m):
+            if p in quantization:
+                return quantization[p]
+            return hasattr(m, "to_quantized") and f"{p}.scales" in index["tensors"]
+
+        nn.quantize(model, group_size=quantization["group_size"], bits=quantization["bits"],
+                    class_predicate=class_predicate)
+
+    blob = np.memmap(os.path.join(path, WEIGHTS), dtype=np.uint8, mode="r")
+    weights = []
+    for name, t in index["tensors"].items():
+        view = blob[t["offset"]:t["offset"] + t["nbytes"]].view(_storage(t["dtype"])).reshape(t["shape"])
+        array = mx.array(view)
+        if t["dtype"] == "bfloat16":
+            array = array.view(mx.bfloat16)
+        weights.append((name, array))
+    model.load_weights(weights)
+    mx.eval(model.parameters())
+    model.eval()
+    del blob
+
+    tokenizer = load_tokenizer(Path(path), eos_token_ids=config.get("eos_token_id"))
+    return model, tokenizer
+
+
+def _time_load(mode, repo):
+    # One measurement in this (fresh) process, repo resolution included
+    from mlx_lm import load
+    from model_loader import resolve_model_path
+
+    start = time.perf_counter()
+    if mode == "packed":
+        load_packed(packed_dir(repo))
+    else:
+        load(resolve_model_path(repo))
+    return {"mode": mode, "load_s": time.perf_counter() - start}
+
+
+def benchmark(repo, reps=5, purge=False):
+    # Every load runs in a fresh interpreter, so nothing is shared but the
+    # OS page cache. The first run per mode is "cold" (after `purge` when
+    # asked), the rest are "warm".
+    results = {}
+    for mode in ("hf", "packed"):
+        samples = []
+        for rep in range(reps):
+            if rep == 0 and purge:
+                subprocess.run(["sudo", "purge"], check=False)
+            out = subprocess.run([sys.executable, __file__, "_time", "--mode", mode, "--repo", repo],
+                                 capture_output=True, text=True)
+            if out.returncode != 0:
+                raise RuntimeError(f"{mode} load failed: {out.stderr.strip().splitlines()[-1:]}")
+            samples.append(json.loads(out.stdout.strip().splitlines()[-1])["load_s"])
+        results[mode] = {"cold_s": samples[0], "warm_s": statistics.median(samples[1:] or samples),
+                         "samples": samples}
+    return results
+
+
+def main():
+    from model_loader import MODEL
+
+    parser = argparse.ArgumentParser(description="Pack a model for near-instant loading")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("pack", help="Convert a model into the packed format")
+    p.add_argument("--repo", default=MODEL)
+    p.add_argument("--out", default=None, help=f"Output directory (default {packed_dir('<repo>')})")
+
+    p = sub.add_parser("bench", help="Compare cold and warm load times with mlx_lm.load")
+    p.add_argument("--repo", default=MODEL)
+    p.add_argument("--reps", type=int, default=5)
+    p.add_argument("--purge", action="store_true", help="Drop the page cache (sudo purge) before each cold run")
+    p.add_argument("--json", action="store_true")
+
+    p = sub.add_parser("_time")
+    p.add_argument("--mode", choices=["hf", "packed"])
+    p.add_argument("--repo", default=MODEL)
+
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        from model_loader import resolve_model_path
+
+        out = args.out or packed_dir(args.repo)
+        start = time.perf_counter()
+        size = pack(resolve_model_path(args.repo), out)
+        print(f"📦 Packed {args.repo} -> {out} ({size / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s")
+    elif args.command == "bench":
+        if not is_packed(packed_dir(args.repo)):
+            sys.exit(f"❌ No packed copy of {args.repo}; run: python packed_model.py pack --repo {args.repo}")
+        results = benchmark(args.repo, args.reps, args.purge)
+        if args.json:
+            print(json.dumps(results, indent=2))
+            return
+        print(f"{'path':<10} {'cold':>8} {'warm':>8}")
+        for mode, r in results.items():
+            print(f"{mode:<10} {r['cold_s']:>7.2f}s {r['warm_s']:>7.2f}s")
+        print(f"\n⚡ Packed load is {results['hf']['warm_s'] / results['packed']['warm_s']:.1f}x faster warm, "
+              f"{results['hf']['cold_s'] / results['packed']['cold_s']:.1f}x cold")
+    else:
+        print(json.dumps(_time_load(args.mode, args.repo)))
+
+if __name__ == "__main__":
+    main()
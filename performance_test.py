@@ -1,54 +1,76 @@
-
 import mlx.core as mx
-from mlx_lm import load, generate
+import argparse
 import socket
-import time
+
+from benchmark import load_benchmark_model, run_config
+from dist_utils import barrier, barrier_report, print_barrier_report
+from generation import GenerationMetrics
+from memory_monitor import MemorySampler, gather_memory, memory_snapshot, print_memory_report
+from metrics import Metrics, gather_metrics, record_generation, write_jsonl, write_prometheus
+from model_loader import MODEL
+
+# Quick cluster check kept for the notebook: one warmed-up benchmark
+# point per rank. Rank 0 prints every rank's metrics plus cluster
+# aggregates as JSON lines (metrics.py schema; metrics.read_jsonl picks
+# them out of the output) and can write a Prometheus text file. Use
+# benchmark.py for sweeps, percentiles and JSON output.
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Copies of the prompt generated together per run")
+    parser.add_argument("--model", default=MODEL, help="Model repo or path, or 'tiny'")
+    parser.add_argument("--cpu", action="store_true")
+    parser.add_argument("--metrics-file", default=None, help="Also append the JSON lines here (rank 0)")
+    parser.add_argument("--prom-file", default=None, help="Write Prometheus text format here (rank 0)")
+    args = parser.parse_args()
+
     world = mx.distributed.init()
     rank = world.rank()
-    size = world.size()
     hostname = socket.gethostname()
 
-    mx.set_default_device(mx.gpu)
-
-    # Load model and measure time
-    load_start = time.time()
-    model, tokenizer = load("mlx-community/Llama-3.2-1B-Instruct-4bit")
-    load_time = time.time() - load_start
+    mx.set_default_device(mx.cpu if args.cpu else mx.gpu)
 
-    # Get GPU memory after loading
-    try:
-        mem_info = mx.metal.get_memory_info()
-        gpu_memory = mem_info["allocated"] / 1024 / 1024  # MB
-    except:
-        gpu_memory = 0
+    sampler = MemorySampler().start()
+    with sampler.phase("load"):
+        model, tokenizer, load_time = load_benchmark_model(args.model, hostname, rank)
 
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    # Memory held after loading (allocator counters, or peak RSS without them)
+    gpu_memory = memory_snapshot()[1]
 
-    # Performance test - generate multiple responses
-    prompt = f"Explain distributed computing for node {rank}:"
+    barrier("load")
 
-    total_tokens = 0
-    total_time = 0
     runs = 3
+    with sampler.phase("generate"):
+        record, run_metrics = run_config(model, tokenizer, prompt_len=32, batch_size=args.batch_size,
+                                         max_tokens=50, warmup=1, reps=runs, rank=rank)
 
-    for i in range(runs):
-        start = time.time()
-        response = generate(model, tokenizer, prompt, max_tokens=50)
-        gen_time = time.time() - start
-
-        tokens = len(tokenizer.encode(response))
-        total_tokens += tokens
-        total_time += gen_time
-
-        mx.eval(mx.distributed.all_sum(mx.array([1.0])))  # Sync
-
-    avg_speed = total_tokens / total_time if total_time > 0 else 0
-
-    print(f"PERF|RANK_{rank}|HOST_{hostname}|LOAD_{load_time:.2f}s|GPU_{gpu_memory:.1f}MB|SPEED_{avg_speed:.1f}tok/s|RUNS_{runs}")
+    # Decode and prefill throughput come straight from the generation loop
+    metrics = Metrics(rank, hostname, batch=args.batch_size)
+    metrics.gauge("mlx_load_seconds", load_time, "Model load time", "seconds")
+    metrics.gauge("mlx_memory_mb", gpu_memory, "Memory held after loading the model", "MB")
+    metrics.gauge("mlx_latency_p50_seconds", record["latency_s"]["p50"], "Median generation latency", "seconds")
+    for run in run_metrics:
+        record_generation(metrics, run)
+    # Throughput over all runs (the per-run gauge only keeps the last one)
+    total = GenerationMetrics.combine(run_metrics)
+    metrics.gauge("mlx_decode_tokens_per_second_all_runs", total.decode_tps, "Decode throughput over all runs",
+                  "tokens/s", agg="sum")
+    metrics.gauge("mlx_prefill_tokens_per_second_all_runs", total.prefill_tps, "Prefill throughput over all runs",
+                  "tokens/s", agg="sum")
 
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("exit")
+    sync = barrier_report(hostname)
+    memory = gather_memory(sampler.stop(), hostname, rank)
+    records = gather_metrics(metrics)
+    if rank == 0:
+        print_barrier_report(sync)
+        print_memory_report(memory)
+        write_jsonl(records)
+        if args.metrics_file:
+            write_jsonl(records, args.metrics_file)
+        if args.prom_file:
+            write_prometheus(args.prom_file, records)
 
 if __name__ == "__main__":
     main()
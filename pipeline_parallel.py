@@ -0,0 +1,284 @@
+import mlx.core as mx
+from mlx_lm.models.cache import make_prompt_cache
+import argparse
+import socket
+import time
+
+from dist_utils import barrier, barrier_report, print_barrier_report
+from generation import padding_mask, sample, stop_token_ids
+from model_loader import MODEL, load_host_shared
+
+# Pipeline-parallel inference with micro-batching.
+#
+# The transformer layers are cut into contiguous stages, one per rank.
+# Rank 0 embeds tokens and runs the first stage, each stage passes its
+# activations to the next with mx.distributed.send/recv, and the last
+# stage applies the norm and lm_head and sends sampled tokens back to
+# rank 0. Requests are grouped into micro-batches; rank 0 pushes every
+# active micro-batch through before waiting for tokens, so while stage 2
+# works on micro-batch 0, stage 1 already has micro-batch 1.
+#
+# Each stage times compute separately from time spent blocked on recv,
+# and rank 0 prints a per-stage table plus a suggested --layers split
+# proportional to each stage's measured speed.
+#
+#   mlx.launch --hosts mbp.local,mm1.local,mm2.local -n 3 pipeline_parallel.py --layers 6,5,5
+
+DTYPES = [mx.float16, mx.bfloat16, mx.float32]
+HEADER = 5  # micro-batch id, rows, length, cache offset, dtype code; rows == 0: micro-batch finished
+STOP = -1
+
+
+def split_layers(num_layers, size, spec=None):
+    if spec:
+        counts = [int(n) for n in spec.split(",")]
+        if len(counts) != size or sum(counts) != num_layers:
+            raise ValueError(f"--layers {spec} must give {size} counts summing to {num_layers}")
+    else:
+        counts = [num_layers // size + (1 if r < num_layers % size else 0) for r in range(size)]
+    bounds = [sum(counts[:r]) for r in range(size + 1)]
+    return counts, list(zip(bounds[:-1], bounds[1:]))
+
+
+class Stage:
+    def __init__(self, model, rank, size, start, end):
+        self.model = model
+        self.rank = rank
+        self.size = size
+        self.first = rank == 0
+        self.last = rank == size - 1
+        self.layers = model.layers[start:end]
+        self.caches = {}
+        self.compute_s = 0.0
+        self.wait_s = 0.0
+        self.send_s = 0.0
+
+        # Keep only this stage's layers; the rest are never materialized
+        model.model.layers = self.layers
+        keep = [layer.parameters() for layer in self.layers]
+        if self.first or (self.last and not hasattr(model, "lm_head")):
+            keep.append(model.model.embed_tokens.parameters())
+        if self.last:
+            keep.append(model.model.norm.parameters())
+            if hasattr(model, "lm_head"):
+                keep.append(model.lm_head.parameters())
+        mx.eval(keep)
+
+    def timed(self, attr, *arrays):
+        start = time.perf_counter()
+        mx.eval(*arrays)
+        setattr(self, attr, getattr(self, attr) + time.perf_counter() - start)
+
+    def forward(self, h, mb, pads, length, offset):
+        if mb not in self.caches:
+            self.caches[mb] = make_prompt_cache(self.model)
+        mask = padding_mask(pads, length, offset)
+        for layer, cache in zip(self.layers, self.caches[mb]):
+            h = layer(h, mask, cache=cache)
+        return h
+
+    def logits(self, h):
+        h = self.model.model.norm(h[:, -1:, :])
+        if hasattr(self.model, "lm_head"):
+            return self.model.lm_head(h)[:, -1, :]
+        return self.model.model.embed_tokens.as_linear(h)[:, -1, :]
+
+    def send(self, arrays, dst):
+        # One eval per message: MLX does not order several sends in one eval
+        start = time.perf_counter()
+        for a in arrays:
+            mx.eval(mx.distributed.send(a, dst))
+        self.send_s += time.perf_counter() - start
+
+    def recv_activation(self):
+        src = self.rank - 1
+        header = mx.distributed.recv((HEADER,), mx.int32, src)
+        self.timed("wait_s", header)
+        mb, rows, length, offset, dtype = header.tolist()
+        if mb == STOP:
+            return None
+        if rows == 0:
+            return mb, None, 0, 0, None
+        # Received in the order they were sent, one eval each
+        pads = mx.distributed.recv((rows,), mx.int32, src)
+        self.timed("wait_s", pads)
+        h = mx.distributed.recv((rows, length, self.model.args.hidden_size), DTYPES[dtype], src)
+        self.timed("wait_s", h)
+        return mb, pads.tolist(), length, offset, h
+
+    def send_finished(self, mb):
+        # Tells the next stages to drop the micro-batch's KV cache
+        self.send([mx.array([mb, 0, 0, 0, 0], dtype=mx.int32)], self.rank + 1)
+
+    def send_activation(self, mb, pads, length, offset, h):
+        header = mx.array([mb, len(pads), length, offset, DTYPES.index(h.dtype)], dtype=mx.int32)
+        self.send([header, mx.array(pads, dtype=mx.int32), h], self.rank + 1)
+
+
+def run_worker_stage(stage, temp):
+    # Stages 1..N-1: receive, compute, pass on (or sample and return)
+    while True:
+        message = stage.recv_activation()
+        if message is None:
+            if not stage.last:
+                stop = mx.array([STOP, 0, 0, 0, 0], dtype=mx.int32)
+                stage.send([stop], stage.rank + 1)
+            return
+        mb, pads, length, offset, h = message
+        if pads is None:
+            stage.caches.pop(mb, None)
+            if not stage.last:
+                stage.send_finished(mb)
+            continue
+        h = stage.forward(h, mb, pads, length, offset)
+        if stage.last:
+            tokens = sample(stage.logits(h), temp).astype(mx.int32)
+            stage.timed("compute_s", tokens)
+            stage.send([mx.array([mb, len(pads)], dtype=mx.int32), tokens], 0)
+        else:
+            stage.timed("compute_s", h)
+            stage.send_activation(mb, pads, length, offset, h)
+
+
+def run_first_stage(stage, tokenizer, prompts, micro_batch_size, max_tokens, temp):
+    # Rank 0: owns the requests, embeds, runs stage 0 and collects tokens
+    stop_tokens = stop_token_ids(tokenizer)
+    encoded = [tokenizer.encode(p) for p in prompts]
+    outputs = [[] for _ in prompts]
+    active = {}
+    for mb, first in enumerate(range(0, len(prompts), micro_batch_size)):
+        rows = list(range(first, min(first + micro_batch_size, len(prompts))))
+        width = max(len(encoded[r]) for r in rows)
+        pads = [width - len(encoded[r]) for r in rows]
+        inputs = mx.array([[0] * pad + encoded[r] for pad, r in zip(pads, rows)])
+        active[mb] = {"rows": rows, "pads": pads, "inputs": inputs, "offset": 0,
+                      "finished": [False] * len(rows)}
+
+    while active:
+        # Push every active micro-batch into the pipeline
+        for mb, state in active.items():
+            length = state["inputs"].shape[1]
+            h = stage.model.model.embed_tokens(state["inputs"])
+            h = stage.forward(h, mb, state["pads"], length, state["offset"])
+            if stage.last:
+                state["tokens"] = sample(stage.logits(h), temp)
+                stage.timed("compute_s", state["tokens"])
+            else:
+                stage.timed("compute_s", h)
+                stage.send_activation(mb, state["pads"], length, state["offset"], h)
+            state["offset"] += length
+
+        # Then collect one token per row from the last stage
+        for _ in range(len(active)):
+            if stage.last:
+                mb = next(m for m, s in active.items() if "tokens" in s)
+                tokens = active[mb].pop("tokens")
+            else:
+                header = mx.distributed.recv((2,), mx.int32, stage.size - 1)
+                stage.timed("wait_s", header)
+                mb, rows = header.tolist()
+                tokens = mx.distributed.recv((rows,), mx.int32, stage.size - 1)
+                stage.timed("wait_s", tokens)
+
+            state = active[mb]
+            for i, token in enumerate(tokens.tolist()):
+                row = state["rows"][i]
+                if state["finished"][i]:
+                    continue
+                if token in stop_tokens:
+                    state["finished"][i] = True
+                else:
+                    outputs[row].append(token)
+                    state["finished"][i] = len(outputs[row]) >= max_tokens
+            state["inputs"] = tokens.reshape(-1, 1)
+
+        for mb in [m for m, s in active.items() if all(s["finished"])]:
+            del active[mb]
+            stage.caches.pop(mb, None)
+            if stage.size > 1:
+                stage.send_finished(mb)
+
+    if stage.size > 1:
+        stage.send([mx.array([STOP, 0, 0, 0, 0], dtype=mx.int32)], 1)
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline-parallel MLX inference")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--layers", default=None,
+                        help="Comma-separated layer counts per stage, e.g. 6,5,5")
+    parser.add_argument("--micro-batch-size", type=int, default=1)
+    parser.add_argument("--max-tokens", type=int, default=60)
+    parser.add_argument("--temp", type=float, default=0.0)
+    parser.add_argument("--cpu", action="store_true")
+    args = parser.parse_args()
+
+    world = mx.distributed.init()
+    rank = world.rank()
+    size = world.size()
+    hostname = socket.gethostname()
+
+    mx.set_default_device(mx.cpu if args.cpu else mx.gpu)
+
+    prompts = [
+        "Write a haiku about distributed computing:",
+        "Explain the advantages of Apple Silicon for AI:",
+        "What makes MLX special for machine learning?",
+        "Describe the future of distributed AI:",
+        "How does GPU acceleration improve inference?",
+        "What are the benefits of multi-node computing?"
+    ]
+
+    start_time = time.time()
+    model, tokenizer, _ = load_host_shared(hostname, rank, repo=args.model, lazy=True)
+    counts, bounds = split_layers(len(model.layers), size, args.layers)
+    start, end = bounds[rank]
+    stage = Stage(model, rank, size, start, end)
+    load_time = time.time() - start_time
+    print(f"[Rank {rank}@{hostname}] Stage {rank}: layers {start}-{end - 1} loaded in {load_time:.2f}s")
+
+    barrier("load")
+
+    if rank == 0:
+        print(f"\n🚇 Pipeline over {size} stages, {len(prompts)} requests, "
+              f"micro-batch size {args.micro_batch_size}")
+
+    start_time = time.time()
+    if rank == 0:
+        outputs = run_first_stage(stage, tokenizer, prompts, args.micro_batch_size,
+                                  args.max_tokens, args.temp)
+    else:
+        run_worker_stage(stage, args.temp)
+    elapsed = time.time() - start_time
+    barrier("generate")
+    sync = barrier_report(hostname)
+
+    timings = mx.distributed.all_gather(
+        mx.array([[stage.compute_s, stage.wait_s, stage.send_s, counts[rank]]])
+    ).tolist()
+
+    if rank == 0:
+        for prompt, token_ids in zip(prompts, outputs):
+            print(f"\n❓ Prompt: {prompt}")
+            print(f"🤖 Response: {tokenizer.decode(token_ids).strip()}")
+
+        generated = sum(len(t) for t in outputs)
+        print(f"\n⚡ {generated} tokens in {elapsed:.2f}s ({generated / elapsed:.1f} tok/s across the pipeline)")
+        print(f"\n{'stage':>5} {'layers':>6} {'compute s':>10} {'wait s':>8} {'send s':>8} {'busy %':>7}")
+        for r, (compute, wait, send, layers) in enumerate(timings):
+            busy = 100 * compute / elapsed if elapsed > 0 else 0
+            print(f"{r:>5} {int(layers):>6} {compute:>10.2f} {wait:>8.2f} {send:>8.2f} {busy:>7.1f}")
+
+        # Layers per second of compute for each stage -> balanced split
+        speeds = [layers / compute if compute > 0 else 0 for compute, _, _, layers in timings]
+        if all(speeds):
+            total_layers = sum(int(t[3]) for t in timings)
+            shares = [total_layers * s / sum(speeds) for s in speeds]
+            suggested = [max(1, round(x)) for x in shares]
+            suggested[-1] += total_layers - sum(suggested)
+            print(f"\n💡 Suggested split for balanced stages: --layers {','.join(map(str, suggested))}")
+        print_barrier_report(sync)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+from array import array
+from collections import OrderedDict
+from hashlib import blake2b
+
+import mlx.core as mx
+from mlx_lm.models.cache import KVCache, make_prompt_cache
+
+from generation import encode_prompt, generate_tokens
+
+# Shared-prefix KV cache.
+#
+# Prompt token ids are cut into fixed-size blocks, and each block is keyed
+# by a hash chained through every block before it, so a key identifies the
+# whole prefix up to and including that block. A block stores only its
+# own slice of keys/values for every layer. A new prompt walks its block
+# keys from the start, and the KV slices of the longest stored run are
+# concatenated into a fresh prompt cache, so only the remaining tokens
+# are prefilled.
+#
+# Blocks are evicted least-recently-used first once the total KV size
+# exceeds the memory budget. Lookups and inserts touch a prompt's blocks
+# from the last one back to the first, so a prefix block is always more
+# recent than its extensions. Leaves therefore go first and no unreachable
+# children are left behind.
+
+
+def _block_key(parent, block):
+    digest = blake2b(parent, digest_size=16)
+    digest.update(array("q", block).tobytes())
+    return digest.digest()
+
+
+class PrefixCache:
+    def __init__(self, block_size=16, budget_mb=512):
+        self.block_size = block_size
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.blocks = OrderedDict()  # key -> [(keys, values) per layer]
+        self.nbytes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.prompt_tokens = 0
+        self.tokens_saved = 0
+        self.evictions = 0
+
+    def _keys(self, token_ids, limit):
+        keys = []
+        parent = b""
+        for start in range(0, limit - self.block_size + 1, self.block_size):
+            parent = _block_key(parent, token_ids[start:start + self.block_size])
+            keys.append(parent)
+        return keys
+
+    def lookup(self, model, token_ids):
+        # Returns (matched_tokens, prompt_cache). At least one prompt token
+        # is always left to prefill so the model produces logits.
+        self.lookups += 1
+        self.prompt_tokens += len(token_ids)
+        matched = []
+        for key in self._keys(token_ids, len(token_ids) - 1):
+            if key not in self.blocks:
+                break
+            matched.append(key)
+
+        cache = make_prompt_cache(model)
+        if not matched:
+            return 0, cache
+
+        for key in reversed(matched):
+            self.blocks.move_to_end(key)
+        for layer, layer_cache in enumerate(cache):
+            layer_cache.state = (
+                mx.concatenate([self.blocks[k][layer][0] for k in matched], axis=2),
+                mx.concatenate([self.blocks[k][layer][1] for k in matched], axis=2),
+            )
+        count = len(matched) * self.block_size
+        self.hits += 1
+        self.tokens_saved += count
+        return count, cache
+
+    def insert(self, token_ids, cache):
+        # Store every full block of token_ids from a cache that has
+        # processed them (positions beyond the prompt are ignored).
+        if not all(type(c) is KVCache for c in cache):
+            return
+        keys = self._keys(token_ids, min(len(token_ids), cache[0].offset))
+        new = []
+        # Deepest block first, like lookup, so every prefix ends up more
+        # recent than its extensions and eviction only ever removes leaves
+        for index, key in reversed(list(enumerate(keys))):
+            if key in self.blocks:
+                self.blocks.move_to_end(key)
+                continue
+            start = index * self.block_size
+            end = start + self.block_size
+            kv = [(mx.contiguous(c.keys[:, :, start:end, :]), mx.contiguous(c.values[:, :, start:end, :]))
+                  for c in cache]
+            self.blocks[key] = kv
+            self.nbytes += sum(k.nbytes + v.nbytes for k, v in kv)
+            new.append(kv)
+        mx.eval(new)
+        self.evict()
+
+    def evict(self):
+        while self.nbytes > self.budget_bytes and self.blocks:
+            _, kv = self.blocks.popitem(last=False)
+            self.nbytes -= sum(k.nbytes + v.nbytes for k, v in kv)
+            self.evictions += 1
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def summary(self):
+        saved = self.tokens_saved / self.prompt_tokens if self.prompt_tokens else 0.0
+        return (f"{self.hit_rate:.0%} hit rate ({self.hits}/{self.lookups}), "
+                f"{self.tokens_saved} prefill tokens saved ({saved:.0%}), "
+                f"{len(self.blocks)} blocks, {self.nbytes / 1024 / 1024:.1f} MB, "
+                f"{self.evictions} evicted")
+
+
+def generate_cached(model, tokenizer, prompt, prefix_cache, max_tokens=100, **kwargs):
+    # generate_tokens, prefilling only the part of the prompt that is not
+    # already in prefix_cache. Returns (token_ids, metrics, matched_tokens);
+    # metrics.prompt_tokens counts the tokens actually prefilled.
+    prompt_ids = encode_prompt(tokenizer, prompt)
+    matched, cache = prefix_cache.lookup(model, prompt_ids)
+    token_ids, metrics = generate_tokens(model, tokenizer, prompt_ids[matched:],
+                                         max_tokens=max_tokens, prompt_cache=cache, **kwargs)
+    prefix_cache.insert(prompt_ids, cache)
+    return token_ids, metrics, matched
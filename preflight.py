@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+
+# Concurrent cluster preflight.
+#
+# Every host in hosts.json is checked at the same time: DNS resolution,
+# then a single SSH round trip that runs a small Python probe (hostname,
+# MLX version, Metal availability, mlx_lm version) in the cluster's conda
+# env. SSH runs with ControlMaster, so the connection stays open for
+# ControlPersist seconds and later calls through SSHTransport (deploy,
+# warm_pool) reuse it. Plain ssh and mlx.launch do not, unless
+# ~/.ssh/config sets the same ControlPath.
+# Ready hosts are cached in CACHE_PATH for --ttl seconds.
+#
+# The transport is pluggable: SSHTransport for the real cluster
+# (including the DNS check), LocalTransport runs every "host" on this
+# machine for testing and skips name resolution.
+#
+#   python preflight.py               # table, exit 1 if any host is not ready
+#   python preflight.py --json --fresh
+
+HOSTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hosts.json")
+CACHE_PATH = os.path.expanduser("~/.cache/mlx-dist-setup/preflight.json")
+CONTROL_PATH = os.path.expanduser("~/.ssh/mlx-%r@%h:%p")
+PYTHONS = [
+    "~/anaconda3/envs/mlx-distributed/bin/python",
+    "~/miniconda3/envs/mlx-distributed/bin/python",
+]
+
+PROBE = """
+import json, socket, sys
+info = {"hostname": socket.gethostname(), "python": sys.executable}
+errors = []
+try:
+    import mlx.core as mx
+    info["mlx"] = mx.__version__
+    info["metal"] = bool(mx.metal.is_available())
+except Exception as e:
+    errors.append(f"mlx: {e!r}")
+try:
+    import mlx_lm
+    info["mlx_lm"] = mlx_lm.__version__
+except Exception as e:
+    errors.append(f"mlx_lm: {e!r}")
+if errors:
+    info["error"] = "; ".join(errors)
+print(json.dumps(info))
+"""
+
+
+def probe_command(python=None):
+    # Remote shell command: first existing interpreter reads PROBE on stdin
+    candidates = [python] if python else PYTHONS
+    tests = " ".join(f'"{p.replace("~", "$HOME", 1)}"' for p in candidates)
+    return (f'PY=python3; for p in {tests}; do if [ -x "$p" ]; then PY="$p"; break; fi; done; '
+            f'exec "$PY" -')
+
+
+class SSHTransport:
+    def __init__(self, connect_timeout=3, persist=60):
+        self.options = [
+            "-o", "BatchMode=yes",
+            "-o", f"ConnectTimeout={connect_timeout}",
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={CONTROL_PATH}",
+            "-o", f"ControlPersist={persist}",
+        ]
+
+    async def resolve(self, host):
+        # Raises OSError when the name does not resolve
+        await asyncio.get_running_loop().getaddrinfo(host, 22)
+
+    async def run(self, target, command, stdin=b"", timeout=10):
+        return await _communicate(["ssh", *self.options, target, command], stdin, timeout)
+
+
+class LocalTransport:
+    # Runs every host's command on this machine (testing without a cluster)
+    async def resolve(self, host):
+        pass
+
+    async def run(self, target, command, stdin=b"", timeout=10):
+        return await _communicate(["sh", "-c", command], stdin, timeout)
+
+
+async def _communicate(argv, stdin, timeout):
+    # Returns (returncode, stdout, stderr); returncode is None on timeout
+    process = await asyncio.create_subprocess_exec(
+        *argv, stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        out, err = await asyncio.wait_for(process.communicate(stdin), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return None, "", f"timed out after {timeout}s"
+    return process.returncode, out.decode(errors="replace"), err.decode(errors="replace")
+
+
+@dataclass
+class HostReport:
+    target: str
+    host: str
+    resolved: bool = False
+    ssh: bool = False
+    mlx: str = ""
+    mlx_lm: str = ""
+    metal: bool = False
+    remote_hostname: str = ""
+    python: str = ""
+    latency_s: float = 0.0
+    error: str = ""
+    checked_at: float = field(default_factory=time.time)
+    cached: bool = False
+
+    @property
+    def ready(self):
+        return self.ssh and bool(self.mlx) and bool(self.mlx_lm) and self.metal and not self.error
+
+
+async def check_host(entry, transport, timeout):
+    target = entry["ssh"]
+    report = HostReport(target=target, host=target.rsplit("@", 1)[-1])
+    start = time.perf_counter()
+    try:
+        await transport.resolve(report.host)
+        report.resolved = True
+    except OSError as e:
+        report.error = f"DNS: {e}"
+        return report
+
+    code, out, err = await transport.run(target, probe_command(entry.get("python")),
+                                         PROBE.encode(), timeout)
+    report.latency_s = time.perf_counter() - start
+    if code is None or code == 255:
+        report.error = f"ssh: {err.strip() or 'connection failed'}"[:200]
+        return report
+    report.ssh = True
+    try:
+        info = json.loads(out.strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        report.error = f"probe: exit {code}, {err.strip()[:160]}"
+        return report
+    report.remote_hostname = info.get("hostname", "")
+    report.python = info.get("python", "")
+    report.mlx = info.get("mlx", "")
+    report.mlx_lm = info.get("mlx_lm", "")
+    report.metal = info.get("metal", False)
+    report.error = info.get("error", "")
+    return report
+
+
+def load_hosts(path=HOSTS_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path, reports):
+    cache = _load_cache(path)
+    # Only ready hosts are cached; failures are re-checked every time
+    cache.update({r.target: asdict(r) for r in reports if r.ready and not r.cached})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(cache, f, indent=2)
+
+
+async def preflight(hosts, transport=None, ttl=60, timeout=10, cache_path=CACHE_PATH, refresh=False):
+    # Returns one HostReport per hosts.json entry, in order. Entries
+    # checked less than ttl seconds ago come from the cache unless refresh.
+    transport = transport or SSHTransport()
+    cache = _load_cache(cache_path) if ttl > 0 and not refresh else {}
+    now = time.time()
+
+    async def one(entry):
+        cached = cache.get(entry["ssh"])
+        if cached and now - cached["checked_at"] < ttl:
+            return HostReport(**{**cached, "cached": True})
+        return await check_host(entry, transport, timeout)
+
+    reports = await asyncio.gather(*(one(entry) for entry in hosts))
+    if ttl > 0:
+        _save_cache(cache_path, reports)
+    return reports
+
+
+def run_preflight(hosts=None, **kwargs):
+    # Synchronous wrapper for scripts and notebooks
+    return asyncio.run(preflight(hosts if hosts is not None else load_hosts(), **kwargs))
+
+
+def print_report(reports, elapsed):
+    print(f"{'host':<18} {'ready':<6} {'mlx':<8} {'mlx_lm':<8} {'metal':<6} {'time':>6}  note")
+    for r in reports:
+        note = r.error or ("cached" if r.cached else "")
+        print(f"{r.host:<18} {'✅' if r.ready else '❌':<6} {r.mlx or '-':<8} {r.mlx_lm or '-':<8} "
+              f"{'yes' if r.metal else 'no':<6} {r.latency_s:>5.2f}s  {note}")
+    ready = sum(r.ready for r in reports)
+    print(f"\n{'✅' if ready == len(reports) else '⚠️ '} {ready}/{len(reports)} hosts ready "
+          f"(checked in {elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check every cluster host concurrently")
+    parser.add_argument("--hosts", default=HOSTS_FILE)
+    parser.add_argument("--ttl", type=float, default=60, help="Reuse results younger than this (s)")
+    parser.add_argument("--fresh", action="store_true", help="Ignore cached results")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--local", action="store_true",
+                        help="Run every host's probe on this machine (no SSH)")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--quiet", action="store_true", help="Only print when a host is not ready")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    reports = asyncio.run(preflight(
+        load_hosts(args.hosts),
+        transport=LocalTransport() if args.local else SSHTransport(),
+        ttl=0 if args.local else args.ttl,
+        timeout=args.timeout,
+        refresh=args.fresh,
+    ))
+    elapsed = time.perf_counter() - start
+    ready = all(r.ready for r in reports)
+
+    if args.json:
+        print(json.dumps({"ready": ready, "elapsed_s": elapsed,
+                          "hosts": [{**asdict(r), "ready": r.ready} for r in reports]}, indent=2))
+    elif not (args.quiet and ready):
+        print_report(reports, elapsed)
+    sys.exit(0 if ready else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
-
 import mlx.core as mx
-from mlx_lm import load, generate
+from mlx_lm import load
 import socket
 import time
 
+from dist_utils import barrier, gather_results
+from generation import GenerationMetrics, generate_tokens
+
 def main():
     world = mx.distributed.init()
     rank = world.rank()
@@ -14,7 +16,7 @@ def main():
 
     if rank == 0:
         print("🤖 Llama 1B Custom Prompting Started")
-        print(f"📊 Nodes: {{size}}")
+        print(f"📊 Nodes: {size}")
         print("=" * 40)
 
     # Load model
@@ -24,38 +26,34 @@ def main():
         load_time = time.time() - start_time
 
         if rank == 0:
-            print(f"✅ Model loaded in {{load_time:.1f}}s")
+            print(f"✅ Model loaded in {load_time:.1f}s")
     except Exception as e:
-        print(f"❌ Model loading failed on rank {{rank}}: {{e}}")
+        print(f"❌ Model loading failed on rank {rank}: {e}")
         return
 
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("load")
 
     # Generate response
     prompt = "Write a haiku about artificial intelligence"
     if rank == 0:
-        print(f"📝 Generating response for: {{prompt}}")
+        print(f"📝 Generating response for: {prompt}")
 
-    start_time = time.time()
     try:
-        response = generate(model, tokenizer, prompt, max_tokens=100)
-        gen_time = time.time() - start_time
+        token_ids, metrics = generate_tokens(model, tokenizer, prompt, max_tokens=100)
 
-        tokens = len(tokenizer.encode(response))
-        speed = tokens / gen_time if gen_time > 0 else 0
-
-        # Show results from each node
-        for i in range(size):
-            mx.eval(mx.distributed.all_sum(mx.array([1.0])))
-            if rank == i:
-                print(f"\n🎭 Node {{rank}} ({{hostname}}):")
-                print(f"📝 {{response.strip()}}")
-                print(f"⚡ {{speed:.1f}} tok/s ({{gen_time:.2f}}s)")
-                print("-" * 40)
+        # Gather results on rank 0, which decodes and prints them
+        gathered = gather_results([(0, token_ids, metrics.to_list())], hostname)
+        if rank == 0:
+            for node, (node_host, node_results) in enumerate(gathered):
+                for _, node_tokens, values in node_results:
+                    print(f"\n🎭 Node {node} ({node_host}):")
+                    print(f"📝 {tokenizer.decode(node_tokens).strip()}")
+                    print(f"⚡ {GenerationMetrics.from_list(values).summary()}")
+                    print("-" * 40)
     except Exception as e:
-        print(f"❌ Generation failed on rank {{rank}}: {{e}}")
+        print(f"❌ Generation failed on rank {rank}: {e}")
 
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("exit")
 
     if rank == 0:
         print("🏁 Distributed prompting completed")
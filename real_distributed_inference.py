@@ -1,9 +1,13 @@
 
 import mlx.core as mx
-from mlx_lm import load, generate
+from mlx_lm import load
 import socket
 import time
 
+from dist_utils import barrier, gather_results
+from generation import GenerationMetrics, generate_tokens
+from work_queue import open_work_queue
+
 def main():
     world = mx.distributed.init()
     rank = world.rank()
@@ -29,45 +33,44 @@ def main():
         return
 
     # Synchronize after loading
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("load")
 
-    # Different prompt variations for each node
+    # Prompt variations shared through a queue; idle Macs pull the next one
     prompt_variations = [
         "Write a haiku about distributed computing across multiple Macs",
         "Write a haiku about distributed computing across multiple Macs - focus on collaboration",
         "Write a haiku about distributed computing across multiple Macs - emphasize speed and efficiency"
     ]
 
-    prompt = prompt_variations[rank % len(prompt_variations)]
+    server, queue = open_work_queue(prompt_variations, rank)
 
     if rank == 0:
         print("🎭 Generating unique responses on each Mac...")
 
-    # Generate response
-    start_time = time.time()
+    # Generate responses until the queue is drained
     try:
-        response = generate(model, tokenizer, prompt, max_tokens=120)
-        gen_time = time.time() - start_time
-
-        tokens = len(tokenizer.encode(response))
-        speed = tokens / gen_time if gen_time > 0 else 0
+        results = []
+        for index, prompt in queue:
+            token_ids, metrics = generate_tokens(model, tokenizer, prompt, max_tokens=120)
+            results.append((index, token_ids, metrics.to_list()))
+        queue.close()
 
-        # Display results from each node in order
-        for i in range(size):
-            mx.eval(mx.distributed.all_sum(mx.array([1.0])))  # Sync
+        # Gather every Mac's token ids on rank 0, which decodes and prints
+        gathered = gather_results(results, hostname)
 
-            if rank == i:
-                print(f"\n🖥️  Mac {rank} ({hostname}):")
-                print(f"📝 Prompt: {prompt}")
-                print(f"🎨 Response: {response.strip()}")
-                print(f"⚡ Performance: {speed:.1f} tok/s ({gen_time:.2f}s, {tokens} tokens)")
-                print("-" * 60)
-
-        mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+        if rank == 0:
+            for node, (node_host, node_results) in enumerate(gathered):
+                for index, token_ids, values in node_results:
+                    print(f"\n🖥️  Mac {node} ({node_host}):")
+                    print(f"📝 Prompt: {prompt_variations[index]}")
+                    print(f"🎨 Response: {tokenizer.decode(token_ids).strip()}")
+                    print(f"⚡ Performance: {GenerationMetrics.from_list(values).summary()}")
+                    print("-" * 60)
 
         if rank == 0:
+            server.close()
             print("🎉 TRUE DISTRIBUTED INFERENCE COMPLETE!")
-            print(f"✅ {size} Macs generated {size} unique responses simultaneously")
+            print(f"✅ {size} Macs generated {len(prompt_variations)} unique responses")
 
     except Exception as e:
         print(f"[Rank {rank}@{hostname}] ❌ Generation failed: {e}")
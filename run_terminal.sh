@@ -2,6 +2,7 @@
 
 # 🚀 MLX Distributed Inference - Terminal Runner
 # Usage: ./run_terminal.sh [prompt]
+#        ./run_terminal.sh --worker      (start a persistent worker)
 # Example: ./run_terminal.sh "Write a haiku about AI"
 
 echo "🚀 MLX Distributed Inference - Terminal Mode"
@@ -13,6 +14,21 @@ NUM_NODES=3
 USER="zz"
 CONDA_ENV="mlx-distributed"
 MLX_LAUNCH="/Users/$USER/anaconda3/envs/$CONDA_ENV/bin/mlx.launch"
+PYTHON="/Users/$USER/anaconda3/envs/$CONDA_ENV/bin/python"
+WORKER_PORT="${WORKER_PORT:-7777}"
+
+# Launch settings: the autotuned profile if there is one (python autotune.py)
+LAUNCH_ARGS=(--backend mpi --hosts "$CLUSTER_HOSTS" -n "$NUM_NODES")
+if TUNED=$("$PYTHON" autotune.py show --args 2>/dev/null); then
+    read -r -a LAUNCH_ARGS <<< "$TUNED"
+fi
+
+# Start a persistent worker: model is loaded once, prompts arrive on WORKER_PORT
+if [ "$1" == "--worker" ]; then
+    echo "🟢 Starting persistent worker on port $WORKER_PORT"
+    exec "$MLX_LAUNCH" "${LAUNCH_ARGS[@]}" \
+        inference_worker.py --port "$WORKER_PORT"
+fi
 
 # Get prompt from command line or use default
 if [ "$1" ]; then
@@ -26,6 +42,13 @@ echo "🌐 Nodes: $CLUSTER_HOSTS"
 echo "📊 Processes: $NUM_NODES"
 echo ""
 
+# Reuse a running worker if there is one (no launch, no model load)
+if "$PYTHON" inference_worker.py --send "$PROMPT" --port "$WORKER_PORT" 2>/dev/null; then
+    echo ""
+    echo "🎯 Served by persistent worker on port $WORKER_PORT"
+    exit 0
+fi
+
 # Check if MLX launcher exists
 if [ ! -f "$MLX_LAUNCH" ]; then
     echo "❌ MLX launcher not found at: $MLX_LAUNCH"
@@ -33,15 +56,24 @@ if [ ! -f "$MLX_LAUNCH" ]; then
     exit 1
 fi
 
+# Check every node at once (cached for a minute, so repeat runs are instant)
+if ! "$PYTHON" preflight.py --quiet; then
+    echo "❌ Preflight failed; fix the hosts above or rerun with: $PYTHON preflight.py --fresh"
+    exit 1
+fi
+
 # Create a temporary distributed script with the custom prompt
 TEMP_SCRIPT="temp_distributed_$(date +%s).py"
 
 cat > "$TEMP_SCRIPT" << EOF
 import mlx.core as mx
-from mlx_lm import load, generate
+from mlx_lm import load
 import socket
 import time
 
+from dist_utils import barrier, barrier_report, gather_results, print_barrier_report
+from generation import GenerationMetrics, generate_tokens
+
 def main():
     world = mx.distributed.init()
     rank = world.rank()
@@ -67,7 +99,7 @@ def main():
         return
     
     # Synchronize
-    mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+    barrier("load")
     
     # Use the provided prompt
     prompt = "$PROMPT"
@@ -76,28 +108,24 @@ def main():
         print(f"📝 Generating responses for: {prompt}")
     
     # Generate response
-    start_time = time.time()
     try:
-        response = generate(model, tokenizer, prompt, max_tokens=120)
-        gen_time = time.time() - start_time
+        token_ids, metrics = generate_tokens(model, tokenizer, prompt, max_tokens=120)
         
-        tokens = len(tokenizer.encode(response))
-        speed = tokens / gen_time if gen_time > 0 else 0
+        # Gather every node's tokens on rank 0, which decodes and prints
+        gathered = gather_results([(0, token_ids, metrics.to_list())], hostname)
+        sync = barrier_report(hostname)
         
-        # Display results from each node
-        for i in range(size):
-            mx.eval(mx.distributed.all_sum(mx.array([1.0])))
-            
-            if rank == i:
-                print(f"\\n🖥️  Node {rank} ({hostname}):")
-                print(f"🎨 {response.strip()}")
-                print(f"⚡ {speed:.1f} tok/s ({gen_time:.2f}s, {tokens} tokens)")
-                print("-" * 50)
-        
-        mx.eval(mx.distributed.all_sum(mx.array([1.0])))
+        if rank == 0:
+            for node, (node_host, node_results) in enumerate(gathered):
+                for _, node_tokens, values in node_results:
+                    print(f"\\n🖥️  Node {node} ({node_host}):")
+                    print(f"🎨 {tokenizer.decode(node_tokens).strip()}")
+                    print(f"⚡ {GenerationMetrics.from_list(values).summary()}")
+                    print("-" * 50)
         
         if rank == 0:
             print("\\n✅ Distributed inference complete!")
+            print_barrier_report(sync)
             
     except Exception as e:
         print(f"[Rank {rank}@{hostname}] ❌ Generation failed: {e}")
@@ -107,12 +135,12 @@ if __name__ == "__main__":
 EOF
 
 echo "⏳ Starting distributed inference..."
-echo "🚀 Command: mlx.launch --backend mpi --hosts $CLUSTER_HOSTS -n $NUM_NODES"
+echo "🚀 Command: mlx.launch ${LAUNCH_ARGS[*]}"
 echo ""
 
 # Run the distributed inference
 start_time=$(date +%s)
-"$MLX_LAUNCH" --backend mpi --hosts "$CLUSTER_HOSTS" -n "$NUM_NODES" "$TEMP_SCRIPT"
+"$MLX_LAUNCH" "${LAUNCH_ARGS[@]}" "$TEMP_SCRIPT"
 end_time=$(date +%s)
 
 execution_time=$((end_time - start_time))
@@ -0,0 +1,372 @@
+import mlx.core as mx
+from mlx_lm.models.cache import make_prompt_cache
+import argparse
+import json
+import queue
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from generation import padding_mask, stop_token_ids
+from model_loader import MODEL, load_host_shared
+from work_queue import open_work_queue
+
+# OpenAI-compatible serving front-end backed by the whole cluster.
+#
+# Rank 0 runs an HTTP server (/v1/completions, /v1/chat/completions,
+# /v1/models) and puts each request on the rank-0 work queue. Every rank,
+# rank 0 included, runs a continuous batch: at each decode step it pulls
+# as many new requests as it has free slots, prefills them, and merges
+# them into its running batch. Finished sequences leave right after the
+# step that finishes them. Sampled token ids go back over the side
+# channel, and rank 0 detokenizes them into plain or streamed (SSE)
+# responses. While a rank is decoding it asks the queue for work at most
+# every --poll-interval seconds rather than every step; the same reply
+# carries the ids of requests whose streaming client went away, and
+# their rows leave the batch. An idle rank polls with a pause that
+# doubles from 5 ms up to --max-idle-wait.
+#
+#   mlx.launch --hosts mbp.local,mm1.local,mm2.local -n 3 serve.py --http-port 8000
+#   curl localhost:8000/v1/completions -d '{"prompt": "Write a haiku", "stream": true}'
+#
+# The batched KV cache is left-padded like batch_generate's. A newcomer
+# is prefilled on its own, and its keys are then rotated by the number
+# of pad slots in front of it. RoPE angles add, so this gives the same
+# keys as prefilling at that position. When the newcomer is longer than
+# the batch, the existing rows are rotated instead, and when rows leave,
+# columns that every remaining row pads are cut off.
+
+
+def _rotate(rope, keys, shift):
+    # Move already-rotated keys `shift` positions later (or earlier)
+    shape = keys.shape
+    return rope(keys.reshape(-1, 1, shape[-1]), offset=shift).reshape(shape)
+
+
+def _sample(logits, temps):
+    greedy = mx.argmax(logits, axis=-1)
+    if not any(temps):
+        return greedy
+    scale = mx.array([1 / t if t > 0 else 1.0 for t in temps])[:, None]
+    sampled = mx.random.categorical(logits * scale)
+    return mx.where(mx.array(temps) > 0, sampled, greedy)
+
+
+class ContinuousBatch:
+    def __init__(self, model, stop_tokens, max_batch=8):
+        self.model = model
+        self.stop_tokens = stop_tokens
+        self.max_batch = max_batch
+        self.rows = []  # dicts: id, pad, generated, max_tokens, temp
+        self.cache = None
+        self.length = 0
+        self.tokens = None
+
+    @property
+    def free(self):
+        return self.max_batch - len(self.rows)
+
+    def _ropes(self):
+        return [layer.self_attn.rope for layer in self.model.layers]
+
+    def _event(self, row, token):
+        # Returns [id, token or None, finish_reason or None]
+        if token in self.stop_tokens:
+            return [row["id"], None, "stop"]
+        row["generated"] += 1
+        return [row["id"], token, "length" if row["generated"] >= row["max_tokens"] else None]
+
+    def add(self, request_id, prompt_ids, max_tokens=100, temp=0.0):
+        row = {"id": request_id, "pad": 0, "generated": 0, "max_tokens": max_tokens, "temp": temp}
+        cache = make_prompt_cache(self.model)
+        logits = self.model(mx.array(prompt_ids)[None], cache=cache)
+        token = _sample(logits[:, -1, :], [temp])
+        event = self._event(row, token.item())
+        if event[2] is not None:
+            return event
+
+        if self.cache is None:
+            self.cache, self.length, self.tokens = cache, len(prompt_ids), token
+        else:
+            new_shift = max(self.length - len(prompt_ids), 0)
+            old_shift = max(len(prompt_ids) - self.length, 0)
+            for rope, old, new in zip(self._ropes(), self.cache, cache):
+                old_k, old_v = self._shift(rope, *old.state, old_shift)
+                new_k, new_v = self._shift(rope, *new.state, new_shift)
+                old.state = (mx.concatenate([old_k, new_k]), mx.concatenate([old_v, new_v]))
+            for other in self.rows:
+                other["pad"] += old_shift
+            row["pad"] = new_shift
+            self.length = max(self.length, len(prompt_ids))
+            self.tokens = mx.concatenate([self.tokens, token])
+        self.rows.append(row)
+        return event
+
+    def _shift(self, rope, keys, values, shift):
+        if shift == 0:
+            return keys, values
+        pad = [(0, 0), (0, 0), (shift, 0), (0, 0)]
+        return mx.pad(_rotate(rope, keys, shift), pad), mx.pad(values, pad)
+
+    def step(self):
+        # One decode step for every row; returns the per-row events
+        pads = [row["pad"] for row in self.rows]
+        logits = self.model(self.tokens[:, None], mask=padding_mask(pads, 1, self.length), cache=self.cache)
+        self.length += 1
+        self.tokens = _sample(logits[:, -1, :], [row["temp"] for row in self.rows])
+        events = [self._event(row, token) for row, token in zip(self.rows, self.tokens.tolist())]
+        self._remove([i for i, event in enumerate(events) if event[2] is not None])
+        return events
+
+    def cancel(self, request_ids):
+        # Drop rows whose client disconnected; returns how many
+        cancelled = [i for i, row in enumerate(self.rows) if row["id"] in request_ids]
+        self._remove(cancelled)
+        return len(cancelled)
+
+    def _remove(self, finished):
+        if not finished:
+            return
+        keep = [i for i in range(len(self.rows)) if i not in finished]
+        if not keep:
+            self.rows, self.cache, self.length, self.tokens = [], None, 0, None
+            return
+        index = mx.array(keep)
+        trim = min(self.rows[i]["pad"] for i in keep)
+        for rope, layer_cache in zip(self._ropes(), self.cache):
+            keys, values = layer_cache.state
+            keys, values = keys[index, :, trim:, :], values[index, :, trim:, :]
+            if trim:
+                keys = _rotate(rope, keys, -trim)
+            layer_cache.state = (keys, values)
+        self.rows = [self.rows[i] for i in keep]
+        for row in self.rows:
+            row["pad"] -= trim
+        self.length -= trim
+        self.tokens = self.tokens[index]
+
+
+def run_engine(engine, client, rank, idle_sleep=0.005, max_idle_sleep=0.25, poll_interval=0.05):
+    # Every rank: admit, decode one step, report; until the queue closes
+    served = 0
+    next_poll = 0.0
+    idle = idle_sleep
+    while True:
+        items = []
+        now = time.monotonic()
+        if not engine.rows or now >= next_poll:
+            # With no free slot this only collects cancellations
+            try:
+                items = client.get(engine.free)
+            except (ConnectionError, OSError):
+                return served
+            next_poll = now + poll_interval
+            if client.cancelled:
+                engine.cancel(set(client.cancelled))
+        if not items and not engine.rows:
+            # Back off while idle, so a quiet server stops polling every few ms
+            time.sleep(idle)
+            idle = min(idle * 2, max_idle_sleep)
+            continue
+        idle = idle_sleep
+
+        events = [engine.add(index, **request) for index, request in items]
+        if engine.rows:
+            events += engine.step()
+        served += sum(1 for event in events if event[2] is not None)
+        client.notify({"op": "tokens", "rank": rank, "events": events})
+
+
+class Streams:
+    # Routes token events from the side channel to waiting HTTP handlers
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues = {}
+
+    def open(self, put):
+        # Registers the stream under the lock that routes events, so no
+        # event can arrive before its queue exists; returns the request id
+        with self.lock:
+            request_id = put()
+            self.queues[request_id] = queue.Queue()
+            return request_id
+
+    def get(self, request_id):
+        with self.lock:
+            return self.queues[request_id]
+
+    def pop(self, request_id):
+        with self.lock:
+            self.queues.pop(request_id, None)
+
+    def __call__(self, message):
+        # Events for closed streams (cancelled requests) are dropped
+        with self.lock:
+            for request_id, token, reason in message["events"]:
+                if request_id in self.queues:
+                    self.queues[request_id].put((token, reason))
+
+
+def make_handler(server, streams, tokenizer, model_name, default_max_tokens):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, body, status=200):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/v1/models":
+                self.send_json({"object": "list", "data": [{"id": model_name, "object": "model"}]})
+            else:
+                self.send_json({"error": {"message": f"unknown path {self.path}"}}, 404)
+
+        def do_POST(self):
+            chat = self.path.rstrip("/") == "/v1/chat/completions"
+            if not chat and self.path.rstrip("/") != "/v1/completions":
+                self.send_json({"error": {"message": f"unknown path {self.path}"}}, 404)
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if chat:
+                    prompt_ids = tokenizer.apply_chat_template(body["messages"], add_generation_prompt=True)
+                else:
+                    prompt_ids = tokenizer.encode(body["prompt"])
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json({"error": {"message": f"bad request: {e}"}}, 400)
+                return
+
+            request_id = streams.open(lambda: server.put({
+                "prompt_ids": list(prompt_ids),
+                "max_tokens": int(body.get("max_tokens") or default_max_tokens),
+                "temp": float(body.get("temperature", 0.0)),
+            }))
+            try:
+                if body.get("stream"):
+                    self.stream(request_id, chat)
+                else:
+                    self.complete(request_id, chat, len(prompt_ids))
+            except (BrokenPipeError, ConnectionResetError):
+                server.cancel(request_id)  # client went away: stop decoding it
+            finally:
+                streams.pop(request_id)
+
+        def tokens(self, request_id):
+            # Yields (new_text, finish_reason) as token ids arrive
+            events = streams.get(request_id)
+            ids, sent = [], ""
+            while True:
+                token, reason = events.get()
+                if token is not None:
+                    ids.append(token)
+                text = tokenizer.decode(ids)
+                if reason is None and text.endswith("�"):
+                    continue  # wait for the rest of a multi-byte character
+                yield text[len(sent):], reason, len(ids)
+                sent = text
+                if reason is not None:
+                    return
+
+        def chunk(self, request_id, chat, text, reason):
+            if chat:
+                choice = {"index": 0, "delta": {"content": text} if text else {}, "finish_reason": reason}
+                kind = "chat.completion.chunk"
+            else:
+                choice = {"index": 0, "text": text, "finish_reason": reason}
+                kind = "text_completion"
+            return {"id": f"cmpl-{request_id}", "object": kind, "created": int(time.time()),
+                    "model": model_name, "choices": [choice]}
+
+        def stream(self, request_id, chat):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            for text, reason, _ in self.tokens(request_id):
+                if not text and reason is None:
+                    continue
+                self.wfile.write(f"data: {json.dumps(self.chunk(request_id, chat, text, reason))}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def complete(self, request_id, chat, prompt_tokens):
+            parts = []
+            for text, reason, count in self.tokens(request_id):
+                parts.append(text)
+            text = "".join(parts)
+            if chat:
+                choice = {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": reason}
+                kind = "chat.completion"
+            else:
+                choice = {"index": 0, "text": text, "finish_reason": reason}
+                kind = "text_completion"
+            self.send_json({
+                "id": f"cmpl-{request_id}", "object": kind, "created": int(time.time()),
+                "model": model_name, "choices": [choice],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": count,
+                          "total_tokens": prompt_tokens + count},
+            })
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible MLX cluster server")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--http-host", default="0.0.0.0")
+    parser.add_argument("--http-port", type=int, default=8000)
+    parser.add_argument("--max-batch", type=int, default=8,
+                        help="Concurrent sequences per rank")
+    parser.add_argument("--max-tokens", type=int, default=256,
+                        help="Default when a request does not set max_tokens")
+    parser.add_argument("--poll-interval", type=float, default=0.05,
+                        help="Seconds between queue polls while a rank is decoding")
+    parser.add_argument("--max-idle-wait", type=float, default=0.25,
+                        help="Longest pause between queue polls while a rank has nothing to do")
+    args = parser.parse_args()
+
+    world = mx.distributed.init()
+    rank = world.rank()
+    size = world.size()
+    hostname = socket.gethostname()
+
+    mx.set_default_device(mx.gpu)
+
+    print(f"[Rank {rank}@{hostname}] Loading model...")
+    model, tokenizer, load_info = load_host_shared(hostname, rank, repo=args.model)
+    print(f"[Rank {rank}@{hostname}] Model loaded in {load_info['load_time']:.2f}s ({load_info['role']})")
+
+    streams = Streams() if rank == 0 else None
+    server, client = open_work_queue([], rank, on_message=streams)
+    engine = ContinuousBatch(model, stop_token_ids(tokenizer), args.max_batch)
+
+    if rank == 0:
+        http = ThreadingHTTPServer((args.http_host, args.http_port),
+                                   make_handler(server, streams, tokenizer, args.model, args.max_tokens))
+        http.daemon_threads = True
+        threading.Thread(target=http.serve_forever, daemon=True).start()
+        print(f"🌐 Serving {args.model} on http://{args.http_host}:{args.http_port}/v1 "
+              f"with {size} ranks x {args.max_batch} slots (Ctrl-C to stop)", flush=True)
+
+    try:
+        served = run_engine(engine, client, rank, max_idle_sleep=args.max_idle_wait,
+                            poll_interval=args.poll_interval)
+    except KeyboardInterrupt:
+        served = None
+
+    if rank == 0:
+        http.shutdown()
+        server.close()
+        print(f"\n📦 Requests per rank: {dict(sorted(server.assigned.items()))}")
+    elif served is not None:
+        print(f"[Rank {rank}@{hostname}] Stopped after {served} requests")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import mlx.core as mx
+from mlx_lm import load
+from mlx_lm.models.cache import make_prompt_cache, trim_prompt_cache
+import argparse
+import socket
+import time
+
+from dist_utils import barrier, barrier_report, print_barrier_report
+from generation import GenerationMetrics, encode_prompt, generate_tokens, stop_token_ids
+
+# Cross-rank speculative decoding.
+#
+# Rank 1 runs a small draft model and proposes k tokens. Rank 0 runs the
+# target model over the last accepted token plus all k proposals in one
+# forward pass, keeps the longest prefix that matches its own greedy
+# choices, and adds its own next token. Accepted counts go back to the
+# draft with send/recv, and both sides trim their KV caches to the
+# accepted prefix. Verification is greedy, so the output is token for
+# token what the target model alone would produce.
+#
+# k adapts every round. The target estimates the per-token acceptance
+# rate a and the draft/target step-cost ratio r, then picks the k that
+# maximizes expected tokens per round (1 - a^(k+1)) / (1 - a) divided
+# by round cost (k*r + 1).
+#
+#   mlx.launch --hosts mbp.local,mm1.local -n 2 speculative.py --baseline
+#
+# Messages are float32 (token ids are exact below 2^24):
+#   draft -> target: [k, draft_seconds, d1 .. dk, 0 padding to K_MAX]
+#   target -> draft: [accepted, next_token, next_k, done]
+
+K_MAX = 12
+TARGET, DRAFT = 0, 1
+
+
+class AdaptiveK:
+    def __init__(self, k, k_max=K_MAX, decay=0.8):
+        self.k = k
+        self.k_max = k_max
+        self.decay = decay
+        self.accepted = 0.0
+        self.rejected = 0.0
+        self.draft_s = 0.0
+        self.verify_s = 0.0
+
+    def _ema(self, old, new):
+        return new if old == 0 else self.decay * old + (1 - self.decay) * new
+
+    @property
+    def acceptance(self):
+        # Every round ends in one rejection unless all k proposals pass
+        total = self.accepted + self.rejected
+        return self.accepted / total if total else 0.0
+
+    def update(self, k, accepted, draft_s, verify_s):
+        self.accepted = self.decay * self.accepted + accepted
+        self.rejected = self.decay * self.rejected + (accepted < k)
+        self.draft_s = self._ema(self.draft_s, draft_s / k)
+        self.verify_s = self._ema(self.verify_s, verify_s)
+
+        a = min(self.acceptance, 0.99)
+        r = self.draft_s / self.verify_s if self.verify_s else 0.0
+        self.k = max(range(1, self.k_max + 1),
+                     key=lambda k: (1 - a ** (k + 1)) / (1 - a) / (k * r + 1))
+        return self.k
+
+
+def send_floats(values, dst):
+    mx.eval(mx.distributed.send(mx.array(values, dtype=mx.float32), dst))
+
+
+def recv_floats(length, src):
+    message = mx.distributed.recv((length,), mx.float32, src)
+    mx.eval(message)
+    return message.tolist()
+
+
+def run_draft(model, prompt_ids):
+    # Rank 1: propose k tokens per round until the target says done
+    cache = make_prompt_cache(model)
+    mx.eval(model(mx.array(prompt_ids)[None], cache=cache))
+
+    proposals = []
+    while True:
+        accepted, token, k, done = [int(x) for x in recv_floats(4, TARGET)]
+        if done:
+            return
+
+        # The cache holds everything up to the last proposal fed back in
+        if proposals and accepted == len(proposals):
+            pending = [proposals[-1], token]
+        else:
+            if proposals:
+                trim_prompt_cache(cache, len(proposals) - 1 - accepted)
+            pending = [token]
+
+        start = time.perf_counter()
+        proposals = []
+        for _ in range(k):
+            logits = model(mx.array(pending)[None], cache=cache)
+            pending = [mx.argmax(logits[0, -1]).item()]
+            proposals.append(pending[0])
+        draft_s = time.perf_counter() - start
+
+        send_floats([k, draft_s] + proposals + [0] * (K_MAX - k), TARGET)
+
+
+def run_target(model, tokenizer, prompt_ids, max_tokens, k):
+    # Rank 0: verify proposals and own the output
+    stop_tokens = stop_token_ids(tokenizer)
+    output = []
+    stats = {"rounds": 0, "proposed": 0, "accepted": 0, "k_sum": 0, "wait_s": 0.0}
+    adaptive = AdaptiveK(k)
+
+    def emit(token):
+        # Returns True once generation is finished
+        if token in stop_tokens:
+            return True
+        output.append(token)
+        return len(output) >= max_tokens
+
+    start = time.perf_counter()
+    cache = make_prompt_cache(model)
+    logits = model(mx.array(prompt_ids)[None], cache=cache)
+    token = mx.argmax(logits[0, -1]).item()
+    prefill_s = time.perf_counter() - start
+
+    done = emit(token)
+    send_floats([0, token, adaptive.k, done], DRAFT)
+
+    start = time.perf_counter()
+    while not done:
+        wait_start = time.perf_counter()
+        message = recv_floats(2 + K_MAX, DRAFT)
+        stats["wait_s"] += time.perf_counter() - wait_start
+        k, draft_s = int(message[0]), message[1]
+        proposals = [int(x) for x in message[2:2 + k]]
+
+        verify_start = time.perf_counter()
+        logits = model(mx.array([token] + proposals)[None], cache=cache)
+        choices = mx.argmax(logits[0], axis=-1).tolist()
+        verify_s = time.perf_counter() - verify_start
+
+        accepted = 0
+        while accepted < k and proposals[accepted] == choices[accepted]:
+            accepted += 1
+        trim_prompt_cache(cache, k - accepted)
+        token = choices[accepted]
+
+        for t in proposals[:accepted] + [token]:
+            done = emit(t)
+            if done:
+                break
+
+        stats["rounds"] += 1
+        stats["proposed"] += k
+        stats["accepted"] += accepted
+        stats["k_sum"] += k
+        send_floats([accepted, token, adaptive.update(k, accepted, draft_s, verify_s), done], DRAFT)
+    decode_s = time.perf_counter() - start
+
+    metrics = GenerationMetrics(
+        prompt_tokens=len(prompt_ids),
+        generation_tokens=len(output),
+        prefill_s=prefill_s,
+        decode_s=decode_s,
+        ttft_s=prefill_s,
+    )
+    return output, metrics, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-rank speculative decoding")
+    parser.add_argument("--model", default="mlx-community/Llama-3.2-3B-Instruct-4bit",
+                        help="Target model (rank 0)")
+    parser.add_argument("--draft-model", default="mlx-community/Llama-3.2-1B-Instruct-4bit",
+                        help="Draft model (rank 1); must share the target's tokenizer")
+    parser.add_argument("--prompt", default="Write a haiku about distributed computing:")
+    parser.add_argument("--max-tokens", type=int, default=120)
+    parser.add_argument("--k", type=int, default=4, help="Initial number of draft tokens")
+    parser.add_argument("--baseline", action="store_true",
+                        help="Also time the target alone on rank 0 and compare")
+    args = parser.parse_args()
+
+    world = mx.distributed.init()
+    rank = world.rank()
+    size = world.size()
+    hostname = socket.gethostname()
+
+    mx.set_default_device(mx.gpu)
+
+    if size < 2:
+        print("❌ Speculative decoding needs at least 2 ranks (target + draft)")
+        return
+
+    role = {TARGET: "target", DRAFT: "draft"}.get(rank, "idle")
+    repo = args.draft_model if rank == DRAFT else args.model
+    if role != "idle":
+        print(f"[Rank {rank}@{hostname}] Loading {role} model {repo}...")
+        model, tokenizer = load(repo)
+        prompt_ids = encode_prompt(tokenizer, args.prompt)
+    else:
+        print(f"[Rank {rank}@{hostname}] Idle (speculation uses ranks 0 and 1)")
+
+    baseline = None
+    if rank == TARGET and args.baseline:
+        baseline = generate_tokens(model, tokenizer, prompt_ids, max_tokens=args.max_tokens)
+
+    barrier("load")
+
+    if rank == TARGET:
+        output, metrics, stats = run_target(model, tokenizer, prompt_ids, args.max_tokens, args.k)
+    elif rank == DRAFT:
+        run_draft(model, prompt_ids)
+
+    if rank == TARGET:
+        rounds = max(stats["rounds"], 1)
+        acceptance = stats["accepted"] / stats["proposed"] if stats["proposed"] else 0.0
+        effective_tps = metrics.generation_tokens / metrics.decode_s if metrics.decode_s else 0.0
+        print(f"\n❓ Prompt: {args.prompt}")
+        print(f"🤖 Response: {tokenizer.decode(output).strip()}")
+        print(f"\n🎯 Acceptance rate: {acceptance:.0%} ({stats['accepted']}/{stats['proposed']} drafts), "
+              f"mean k {stats['k_sum'] / rounds:.1f}, {metrics.generation_tokens / rounds:.2f} tokens/round")
+        print(f"⚡ Effective: {effective_tps:.1f} tok/s over {stats['rounds']} rounds "
+              f"(waited {stats['wait_s']:.2f}s on the draft)")
+        if baseline is not None:
+            base_ids, base_metrics = baseline
+            speedup = effective_tps / base_metrics.decode_tps if base_metrics.decode_tps else 0.0
+            print(f"📏 Target alone: {base_metrics.summary()}")
+            print(f"🚀 Speedup: {speedup:.2f}x, output {'identical' if base_ids == output else 'DIFFERS'}")
+
+    barrier("exit")
+    sync = barrier_report(hostname)
+    if rank == TARGET:
+        print_barrier_report(sync)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import mlx.core as mx
+from mlx_lm import load
+import socket
+import sys
+import threading
+import time
+
+from dist_utils import barrier, barrier_report, gather_results, print_barrier_report
+from generation import GenerationMetrics, stream_tokens
+from work_queue import open_work_queue
+
+# Live token streaming from every rank.
+#
+# Each rank pulls prompts from the rank-0 queue and forwards token
+# chunks over the same side channel as they are generated. Rank 0 prints
+# them tagged by rank, then a per-rank latency table: time to first
+# token, inter-token latency and decode throughput.
+
+
+class TaggedPrinter:
+    # Buffers each rank's chunks and flushes whole lines so output from
+    # concurrent ranks stays readable.
+    def __init__(self, width=72):
+        self.width = width
+        self.lock = threading.Condition()
+        self.buffers = {}
+        self.finished = 0
+
+    def __call__(self, message):
+        tag = f"[Rank {message['rank']} #{message['index']}]"
+        with self.lock:
+            if message["op"] == "done":
+                self.flush(tag)
+                self.finished += 1
+                self.lock.notify_all()
+                return
+            buffer = self.buffers.get(tag, "") + message["text"]
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                print(f"{tag} {line}")
+            while len(buffer) >= self.width:
+                print(f"{tag} {buffer[:self.width]}")
+                buffer = buffer[self.width:]
+            self.buffers[tag] = buffer
+            sys.stdout.flush()
+
+    def flush(self, tag):
+        buffer = self.buffers.pop(tag, "")
+        if buffer.strip():
+            print(f"{tag} {buffer}")
+        print(f"{tag} ⏹️  done", flush=True)
+
+    def wait(self, total, timeout=30):
+        # Chunks arrive on the server thread; let them drain before the summary
+        with self.lock:
+            self.lock.wait_for(lambda: self.finished >= total, timeout)
+
+
+def main():
+    world = mx.distributed.init()
+    rank = world.rank()
+    size = world.size()
+    hostname = socket.gethostname()
+
+    mx.set_default_device(mx.gpu)
+
+    if rank == 0:
+        print(f"📡 MLX Streaming Inference Across {size} Processes")
+        print("=" * 50)
+
+    print(f"[Rank {rank}@{hostname}] Loading model...")
+    start_time = time.time()
+    model, tokenizer = load("mlx-community/Llama-3.2-1B-Instruct-4bit")
+    load_time = time.time() - start_time
+    print(f"[Rank {rank}@{hostname}] Model loaded in {load_time:.2f}s")
+
+    barrier("load")
+
+    prompts = [
+        "Write a haiku about distributed computing:",
+        "Explain the advantages of Apple Silicon for AI:",
+        "What makes MLX special for machine learning?",
+        "Describe the future of distributed AI:",
+        "How does GPU acceleration improve inference?",
+        "What are the benefits of multi-node computing?"
+    ]
+
+    printer = TaggedPrinter()
+    server, queue = open_work_queue(prompts, rank, on_message=printer)
+
+    # Stream every prompt this rank pulls; chunks go straight to rank 0
+    results = []
+    for index, prompt in queue:
+        def forward(text):
+            queue.notify({"op": "chunk", "rank": rank, "index": index, "text": text})
+
+        _, metrics = stream_tokens(model, tokenizer, prompt, max_tokens=80, on_text=forward)
+        queue.notify({"op": "done", "rank": rank, "index": index})
+        results.append((index, [], metrics.to_list()))
+    queue.close()
+
+    barrier("generate")
+    gathered = gather_results(results, hostname)
+    sync = barrier_report(hostname)
+
+    if rank == 0:
+        printer.wait(len(prompts))
+        server.close()
+        print("\n⏱️  Latency per prompt")
+        print(f"{'rank':>4} {'host':<14} {'#':>2} {'TTFT ms':>8} {'ITL ms':>7} {'p95 ms':>7} {'decode tok/s':>12} {'tokens':>6}")
+        for node, (node_host, node_results) in enumerate(gathered):
+            for index, _, values in node_results:
+                m = GenerationMetrics.from_list(values)
+                print(f"{node:>4} {node_host:<14} {index:>2} {m.ttft_s * 1000:>8.1f} {m.itl_mean_s * 1000:>7.1f} "
+                      f"{m.itl_p95_s * 1000:>7.1f} {m.decode_tps:>12.1f} {m.generation_tokens:>6}")
+        print_barrier_report(sync)
+        print("\n✅ Streaming inference complete!")
+
+if __name__ == "__main__":
+    main()
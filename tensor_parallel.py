@@ -0,0 +1,159 @@
+import mlx.core as mx
+import mlx.nn as nn
+from mlx_lm import load
+import argparse
+import socket
+import time
+
+from dist_utils import barrier, barrier_report, print_barrier_report
+from generation import generate_tokens
+
+# Tensor-parallel Llama inference.
+#
+# Attention heads and MLP columns are split across ranks: q/k/v and
+# gate/up projections keep a contiguous slice of output features
+# (column-parallel), o_proj and down_proj keep the matching slice of
+# input features (row-parallel) and their partial products are summed
+# with mx.distributed.all_sum. Embeddings, norms and lm_head stay
+# replicated, so every rank produces the same logits and the normal
+# load -> generate flow runs unchanged after shard_model().
+#
+#   mlx.launch --hosts localhost -n 2 tensor_parallel.py --cpu --check
+#
+# --check generates once unsharded first and compares token ids.
+
+
+def _slice(x, axis, index, parts):
+    if x.shape[axis] % parts:
+        raise ValueError(f"dimension {x.shape[axis]} is not divisible by {parts} ranks")
+    step = x.shape[axis] // parts
+    bounds = [slice(None)] * x.ndim
+    bounds[axis] = slice(index * step, (index + 1) * step)
+    return x[tuple(bounds)]
+
+
+def _check_groups(layer, parts):
+    # Quantized row splits must land on quantization-group boundaries
+    if isinstance(layer, nn.QuantizedLinear):
+        in_features = layer.scales.shape[1] * layer.group_size
+        if (in_features // parts) % layer.group_size:
+            raise ValueError(f"{in_features} input features do not split into "
+                             f"{parts} whole groups of {layer.group_size}")
+
+
+def column_parallel(layer, index, parts):
+    # Keep this rank's slice of output features; no communication
+    layer.weight = _slice(layer.weight, 0, index, parts)
+    if isinstance(layer, nn.QuantizedLinear):
+        layer.scales = _slice(layer.scales, 0, index, parts)
+        layer.biases = _slice(layer.biases, 0, index, parts)
+    if "bias" in layer:
+        layer.bias = _slice(layer.bias, 0, index, parts)
+    return layer
+
+
+class RowParallel(nn.Module):
+    # Keeps this rank's slice of input features and sums the partial
+    # products across ranks; the layer bias is added once, after the sum.
+    def __init__(self, layer, index, parts, group):
+        super().__init__()
+        _check_groups(layer, parts)
+        layer.weight = _slice(layer.weight, 1, index, parts)
+        if isinstance(layer, nn.QuantizedLinear):
+            layer.scales = _slice(layer.scales, 1, index, parts)
+            layer.biases = _slice(layer.biases, 1, index, parts)
+        self.bias = None
+        if "bias" in layer:
+            self.bias = layer.bias
+            del layer["bias"]
+        self.layer = layer
+        self.group = group
+
+    def __call__(self, x):
+        y = mx.distributed.all_sum(self.layer(x), group=self.group)
+        return y if self.bias is None else y + self.bias
+
+
+def shard_model(model, group):
+    # Split every transformer layer of an mlx_lm Llama-style model across
+    # the ranks of group, in place. Returns the model.
+    index = group.rank()
+    parts = group.size()
+    if parts == 1:
+        return model
+
+    for layer in model.layers:
+        attn = layer.self_attn
+        if attn.n_heads % parts or attn.n_kv_heads % parts:
+            raise ValueError(f"{attn.n_heads} query / {attn.n_kv_heads} kv heads "
+                             f"do not split across {parts} ranks")
+        attn.q_proj = column_parallel(attn.q_proj, index, parts)
+        attn.k_proj = column_parallel(attn.k_proj, index, parts)
+        attn.v_proj = column_parallel(attn.v_proj, index, parts)
+        attn.o_proj = RowParallel(attn.o_proj, index, parts, group)
+        attn.n_heads //= parts
+        attn.n_kv_heads //= parts
+
+        mlp = layer.mlp
+        mlp.gate_proj = column_parallel(mlp.gate_proj, index, parts)
+        mlp.up_proj = column_parallel(mlp.up_proj, index, parts)
+        mlp.down_proj = RowParallel(mlp.down_proj, index, parts, group)
+
+    mx.eval(model.parameters())
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tensor-parallel MLX inference")
+    parser.add_argument("--model", default="mlx-community/Llama-3.2-1B-Instruct-4bit")
+    parser.add_argument("--prompt", default="Write a haiku about distributed computing:")
+    parser.add_argument("--max-tokens", type=int, default=60)
+    parser.add_argument("--cpu", action="store_true", help="Run on CPU (for exactness checks)")
+    parser.add_argument("--check", action="store_true",
+                        help="Compare against unsharded generation on the same machine")
+    args = parser.parse_args()
+
+    world = mx.distributed.init()
+    rank = world.rank()
+    size = world.size()
+    hostname = socket.gethostname()
+
+    mx.set_default_device(mx.cpu if args.cpu else mx.gpu)
+    mx.random.seed(0)
+
+    if rank == 0:
+        print(f"🧩 Tensor-Parallel Inference Across {size} Ranks")
+        print("=" * 50)
+
+    print(f"[Rank {rank}@{hostname}] Loading model...")
+    start_time = time.time()
+    model, tokenizer = load(args.model, lazy=not args.check)
+    load_time = time.time() - start_time
+
+    reference = None
+    if args.check and rank == 0:
+        reference, _ = generate_tokens(model, tokenizer, args.prompt, max_tokens=args.max_tokens)
+
+    shard_model(model, world)
+    print(f"[Rank {rank}@{hostname}] Loaded and sharded in {load_time:.2f}s")
+
+    barrier("load")
+
+    token_ids, metrics = generate_tokens(model, tokenizer, args.prompt, max_tokens=args.max_tokens)
+    sync = barrier_report(hostname)
+
+    if rank == 0:
+        print(f"\n❓ Prompt: {args.prompt}")
+        print(f"🤖 Response: {tokenizer.decode(token_ids).strip()}")
+        print(f"⚡ Performance: {metrics.summary()}")
+        if reference is not None:
+            if reference == token_ids:
+                print(f"✅ Identical to single-node output ({len(token_ids)} tokens)")
+            else:
+                diverged = next((i for i, (a, b) in enumerate(zip(reference, token_ids)) if a != b),
+                                min(len(reference), len(token_ids)))
+                print(f"❌ Output differs from single-node output at token {diverged}")
+        print_barrier_report(sync)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import mlx.core as mx
-from mlx_lm import load, generate
+from mlx_lm import load
 import time
 
+from generation import generate_tokens
+
 def main():
     print("🤖 Testing MLX locally (no distributed)")
     print("=" * 40)
@@ -23,17 +25,12 @@ def main():
     prompt = "Write a haiku about artificial intelligence"
     print(f"📝 Generating response for: {prompt}")
     
-    start_time = time.time()
     try:
-        response = generate(model, tokenizer, prompt, max_tokens=100)
-        gen_time = time.time() - start_time
-        
-        tokens = len(tokenizer.encode(response))
-        speed = tokens / gen_time if gen_time > 0 else 0
+        token_ids, metrics = generate_tokens(model, tokenizer, prompt, max_tokens=100)
         
         print(f"\n🎭 Generated Response:")
-        print(f"📝 {response.strip()}")
-        print(f"⚡ {speed:.1f} tok/s ({gen_time:.2f}s)")
+        print(f"📝 {tokenizer.decode(token_ids).strip()}")
+        print(f"⚡ {metrics.summary()}")
         print("-" * 40)
         print("✅ Local test completed successfully!")
         
@@ -0,0 +1,33 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deploy import MANIFEST, deploy
+from preflight import LocalTransport
+
+
+def push(src, dst):
+    _, results, _ = asyncio.run(deploy([{"ssh": "local"}], transport=LocalTransport(),
+                                       remote_dir=str(dst), root=str(src)))
+    assert results[0]["error"] == ""
+    return sorted(results[0]["changed"])
+
+
+def test_only_changed_files_are_copied(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.mkdir()
+    (src / "a.py").write_text("print('a')\n")
+    (src / "run.sh").write_text("echo run\n")
+
+    assert push(src, dst) == ["a.py", "run.sh"]
+    assert (dst / "a.py").read_text() == "print('a')\n"
+    assert (dst / MANIFEST).exists()
+    assert not (src / MANIFEST).exists()
+
+    assert push(src, dst) == []
+
+    (src / "a.py").write_text("print('b')\n")
+    assert push(src, dst) == ["a.py"]
+    assert (dst / "a.py").read_text() == "print('b')\n"
@@ -0,0 +1,58 @@
+import os
+import random
+import sys
+
+import pytest
+
+mx = pytest.importorskip("mlx.core")
+pytest.importorskip("mlx_lm")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlx_lm.models.cache import KVCache
+
+from prefix_cache import PrefixCache
+
+
+def filled_cache(length, layers=2, heads=2, dim=8):
+    cache = [KVCache() for _ in range(layers)]
+    for c in cache:
+        c.update_and_fetch(mx.zeros((1, heads, length, dim)), mx.zeros((1, heads, length, dim)))
+    return cache
+
+
+def test_eviction_never_orphans_a_block():
+    block_size = 4
+    prefix = PrefixCache(block_size=block_size, budget_mb=0)
+    block_bytes = 2 * 2 * (2 * block_size * 8 * 4)  # layers x (keys + values), float32
+    prefix.budget_bytes = 10 * block_bytes
+
+    random.seed(0)
+    shared = [random.randrange(100) for _ in range(3 * block_size)]
+    chains = []
+    for _ in range(20):
+        # Prompts share a prefix so blocks get reused as well as evicted
+        tokens = shared[:random.randrange(1, 4) * block_size]
+        tokens += [random.randrange(100) for _ in range(random.randrange(1, 5) * block_size)]
+        prefix.insert(tokens, filled_cache(len(tokens)))
+        chains.append(prefix._keys(tokens, len(tokens)))
+        assert prefix.nbytes <= prefix.budget_bytes
+
+        for keys in chains:
+            for parent, child in zip(keys, keys[1:]):
+                if child in prefix.blocks:
+                    assert parent in prefix.blocks
+
+    assert prefix.evictions > 0
+
+
+def test_over_budget_insert_keeps_its_root():
+    block_size = 4
+    prefix = PrefixCache(block_size=block_size, budget_mb=0)
+    block_bytes = 2 * 2 * (2 * block_size * 8 * 4)
+    prefix.budget_bytes = 2 * block_bytes
+
+    tokens = list(range(5 * block_size))
+    prefix.insert(tokens, filled_cache(len(tokens)))
+    keys = prefix._keys(tokens, len(tokens))
+    assert list(prefix.blocks) == [keys[1], keys[0]]
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preflight import PROBE, LocalTransport, preflight, probe_command
+
+READY = {"hostname": "h", "python": "python", "mlx": "0.26.0", "mlx_lm": "0.25.0", "metal": True}
+
+
+class FakeTransport:
+    # Canned probe output per host; records which hosts were contacted
+    def __init__(self, replies, unresolved=()):
+        self.replies = replies
+        self.unresolved = set(unresolved)
+        self.calls = []
+
+    async def resolve(self, host):
+        if host in self.unresolved:
+            raise OSError(f"{host}: nodename nor servname provided")
+
+    async def run(self, target, command, stdin=b"", timeout=10):
+        self.calls.append(target)
+        return self.replies[target]
+
+
+def ok(hostname):
+    return 0, json.dumps({**READY, "hostname": hostname}) + "\n", ""
+
+
+def run(hosts, transport, **kwargs):
+    return asyncio.run(preflight([{"ssh": h} for h in hosts], transport=transport, **kwargs))
+
+
+def test_one_failing_host_does_not_hide_the_others(tmp_path):
+    transport = FakeTransport({"a": ok("a"), "c": (255, "", "Connection refused")}, unresolved={"b"})
+    reports = run(["a", "b", "c"], transport, cache_path=str(tmp_path / "cache.json"))
+
+    assert [r.ready for r in reports] == [True, False, False]
+    assert reports[1].error.startswith("DNS:")
+    assert reports[2].error == "ssh: Connection refused"
+    assert sorted(transport.calls) == ["a", "c"]
+
+
+def test_ready_hosts_come_from_the_cache(tmp_path):
+    cache = str(tmp_path / "cache.json")
+    run(["a", "b"], FakeTransport({"a": ok("a"), "b": (255, "", "down")}), cache_path=cache)
+
+    transport = FakeTransport({"a": ok("a"), "b": ok("b")})
+    reports = run(["a", "b"], transport, cache_path=cache)
+    assert [r.cached for r in reports] == [True, False]  # failures are not cached
+    assert transport.calls == ["b"]
+
+
+def test_stale_cache_entries_are_checked_again(tmp_path):
+    cache = tmp_path / "cache.json"
+    run(["a"], FakeTransport({"a": ok("a")}), cache_path=str(cache))
+    entries = json.loads(cache.read_text())
+    entries["a"]["checked_at"] = time.time() - 120
+    cache.write_text(json.dumps(entries))
+
+    transport = FakeTransport({"a": ok("a")})
+    reports = run(["a"], transport, ttl=60, cache_path=str(cache))
+    assert transport.calls == ["a"]
+    assert not reports[0].cached
+
+
+def test_probe_keeps_every_import_error():
+    # Block both imports in a real interpreter run through LocalTransport
+    probe = "import sys\nsys.modules['mlx'] = sys.modules['mlx_lm'] = None\n" + PROBE
+    code, out, _ = asyncio.run(LocalTransport().run("local", probe_command(sys.executable), probe.encode()))
+    error = json.loads(out)["error"]
+    assert code == 0
+    assert error.startswith("mlx: ") and "; mlx_lm: " in error
@@ -0,0 +1,152 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from work_queue import CANCEL_TTL, HEARTBEAT_MISSES, MAX_ATTEMPTS, WorkQueueClient, WorkQueueServer
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(items, **kwargs):
+        server = WorkQueueServer(items, **kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.close()
+
+
+def get(server, rank, n=1):
+    return server.dispatch({"op": "get", "rank": rank, "n": n})
+
+
+def test_silent_rank_is_lost_and_its_items_requeued(make_server):
+    server = make_server(["a", "b", "c"], heartbeat=1.0)
+    assert get(server, 1)["items"] == [(0, "a")]
+    assert get(server, 2)["items"] == [(1, "b")]
+
+    now = server.last_seen[1] + HEARTBEAT_MISSES * 1.0 + 0.1
+    server.last_seen[2] = now  # rank 2 keeps beating
+    server.reap(now)
+
+    assert server.lost == {1}
+    assert get(server, 2)["items"] == [(0, "a")]  # requeued items go first
+    assert get(server, 1) == {"items": [], "lost": [1]}
+
+
+def test_rank_0_is_never_lost(make_server):
+    server = make_server(["a"], heartbeat=1.0)
+    get(server, 0)
+    server.reap(server.last_seen[0] + 100)
+    server.disconnected(0)
+    assert server.lost == set()
+    assert 0 in server.leases
+
+
+def test_disconnect_with_leases_loses_rank(make_server):
+    server = make_server(["a", "b"], heartbeat=1.0)
+    get(server, 1)
+    server.disconnected(1)
+    assert server.lost == {1}
+    assert [e["event"] for e in server.events] == ["disconnected", "reassigned"]
+
+
+def test_clean_disconnect_is_not_a_loss(make_server):
+    server = make_server(["a"], heartbeat=1.0)
+    get(server, 1)
+    server.complete(1, 0, "done")
+    server.disconnected(1)
+    server.reap(10 ** 9)
+    assert server.lost == set()
+
+
+def test_timed_out_item_is_handed_out_again(make_server):
+    server = make_server(["a"], request_timeout=5.0)
+    get(server, 1)
+    assert get(server, 2) == {"items": [], "wait": True}
+
+    _, deadline = server.leases[0]
+    server.reap(deadline + 0.1)
+    assert get(server, 2)["items"] == [(0, "a")]
+    assert server.lost == set()  # a slow rank is not a dead one
+
+
+def test_gives_up_after_max_attempts(make_server):
+    server = make_server(["a"], request_timeout=5.0)
+    for attempt in range(MAX_ATTEMPTS):
+        assert get(server, 1)["items"] == [(0, "a")]
+        _, deadline = server.leases[0]
+        server.reap(deadline + 0.1)
+    assert 0 in server.failed
+    assert server.done
+    assert get(server, 2) == {"items": [], "lost": []}
+
+
+def test_first_result_wins_including_late_ones(make_server):
+    server = make_server(["a"], request_timeout=5.0)
+    get(server, 1)
+    _, deadline = server.leases[0]
+    server.reap(deadline + 0.1)
+    get(server, 2)
+
+    server.dispatch({"op": "result", "rank": 1, "index": 0, "result": "late"})
+    server.dispatch({"op": "result", "rank": 2, "index": 0, "result": "second"})
+    assert server.results == {0: "late"}
+    assert server.leases == {}
+    assert server.done
+
+
+def test_late_result_skips_requeued_copy(make_server):
+    server = make_server(["a", "b"], heartbeat=1.0)
+    get(server, 1)
+    server.disconnected(1)
+    server.complete(1, 0, "kept")
+    assert get(server, 2, n=2)["items"] == [(1, "b")]
+
+
+def test_results_log_resume(make_server, tmp_path):
+    log = str(tmp_path / "results.jsonl")
+    first = make_server(["a", "b"], heartbeat=1.0, results_log=log)
+    get(first, 1)
+    first.complete(1, 0, "A")
+
+    second = make_server(["a", "b"], heartbeat=1.0, results_log=log)
+    assert second.results == {0: "A"}
+    assert get(second, 1, n=2)["items"] == [(1, "b")]
+
+    changed = make_server(["x", "b"], heartbeat=1.0, results_log=log)
+    assert changed.results == {}
+
+
+def test_cancel_drops_queued_item(make_server):
+    server = make_server(["a", "b"])
+    server.cancel(0)
+    assert get(server, 1, n=2) == {"items": [(1, "b")]}
+
+
+def test_cancel_of_running_item_reaches_every_rank(make_server):
+    server = make_server(["a"])
+    get(server, 1)
+    server.cancel(0)
+    assert get(server, 1, n=0)["cancel"] == [0]
+    assert get(server, 2)["cancel"] == [0]
+
+    server.cancelled[0] -= 2 * CANCEL_TTL
+    assert "cancel" not in get(server, 1, n=0)
+
+
+def test_wait_blocks_until_a_late_result_is_read(make_server):
+    server = make_server(["a"]).start()
+    client = WorkQueueClient("127.0.0.1", server.port, rank=1)
+    assert client.get() == [(0, "a")]
+    assert not server.wait(0.05)
+    client.complete(0, "A")  # fire-and-forget: the server reads it on its own thread
+    assert server.wait(5)
+    assert server.results == {0: "A"}
+    client.close()
@@ -0,0 +1,171 @@
+import mlx.core as mx
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Cross-rank trace timeline (Chrome / Perfetto trace format).
+#
+# Spans are recorded only while tracing is enabled (enable(), or the
+# MLX_TRACE environment variable), so the hooks in dist_utils,
+# model_loader and generation cost one flag check otherwise. Each rank
+# keeps its own events in wall-clock microseconds.
+#
+# Macs' wall clocks drift apart by milliseconds, which is the size of a
+# decode step, so before merging, rank 0 estimates every host's clock
+# offset with a ping-pong over mx.distributed (NTP style: the reply's
+# timestamp against the midpoint of the round trip, keeping the round
+# with the shortest round trip). Ranks on the same host share a clock
+# and an offset. The ring backend only connects neighbouring ranks, so
+# method="barrier" estimates offsets from timestamps taken right after
+# a shared barrier instead (coarser: includes the barrier's skew).
+#
+#   mlx.launch ... distributed_inference.py --trace trace.json
+#   # open trace.json in https://ui.perfetto.dev or chrome://tracing
+
+_enabled = [bool(os.environ.get("MLX_TRACE"))]
+_events = []
+_threads = {}
+_lock = threading.Lock()
+
+
+def enable(on=True):
+    _enabled[0] = on
+
+
+def enabled():
+    return _enabled[0]
+
+
+def _wall_us(perf=None):
+    # perf_counter timestamps are monotonic but per-process; map them onto the wall clock
+    if perf is None:
+        return time.time_ns() // 1000
+    return int((perf - time.perf_counter()) * 1e6) + time.time_ns() // 1000
+
+
+def add_span(name, start, end, cat="phase", **args):
+    # Complete event from two perf_counter timestamps
+    if not _enabled[0]:
+        return
+    begin = _wall_us(start)
+    with _lock:
+        tid = _threads.setdefault(threading.get_ident(), len(_threads))
+        _events.append({"name": name, "cat": cat, "ph": "X", "ts": begin,
+                        "dur": max(int((end - start) * 1e6), 0), "tid": tid, "args": args})
+
+
+@contextmanager
+def span(name, cat="phase", **args):
+    if not _enabled[0]:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_span(name, start, time.perf_counter(), cat, **args)
+
+
+def traced(cat, name=None):
+    # Decorator: record every call of the function as a span
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not _enabled[0]:
+                return fn(*args, **kwargs)
+            with span(name or fn.__name__, cat):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def _ping_pong(rank, peer, rounds):
+    # Rank 0 side returns (rtt_us, offset_us) of the best round; the
+    # peer side answers every ping with its own clock
+    best = None
+    stamp = mx.array([0], dtype=mx.int64)
+    for _ in range(rounds):
+        if rank == 0:
+            t0 = _wall_us()
+            mx.eval(mx.distributed.send(mx.array([t0], dtype=mx.int64), peer))
+            reply = mx.distributed.recv_like(stamp, peer)
+            mx.eval(reply)
+            t3 = _wall_us()
+            sample = (t3 - t0, reply.item() - (t0 + t3) // 2)
+            best = sample if best is None or sample[0] < best[0] else best
+        else:
+            mx.eval(mx.distributed.recv_like(stamp, 0))
+            mx.eval(mx.distributed.send(mx.array([_wall_us()], dtype=mx.int64), 0))
+    return best
+
+
+def estimate_clock_offsets(hostname, rank, rounds=8, method="pingpong"):
+    # Must be called on all ranks together. Returns {"offsets_us": [per
+    # rank], "rtt_us": [per rank], "method": ...}; subtracting a rank's
+    # offset from its timestamps puts them on rank 0's clock.
+    from dist_utils import all_gather_text, barrier, broadcast_text
+
+    hostnames = all_gather_text(hostname)
+    leaders = {h: hostnames.index(h) for h in hostnames}
+
+    per_host = {}
+    if method == "barrier":
+        barrier("clock")
+        stamps = [int(t) for t in all_gather_text(str(_wall_us()))]
+        per_host = {h: (0, stamps[leader] - stamps[0]) for h, leader in leaders.items()}
+    else:
+        for host, leader in leaders.items():
+            if leader == 0:
+                per_host[host] = (0, 0)
+            elif rank in (0, leader):
+                per_host[host] = _ping_pong(rank, leader, rounds)
+    if method != "barrier":
+        per_host = json.loads(broadcast_text(json.dumps(per_host) if rank == 0 else None, rank))
+
+    return {
+        "method": method,
+        "offsets_us": [per_host[h][1] for h in hostnames],
+        "rtt_us": [per_host[h][0] for h in hostnames],
+        "hosts": hostnames,
+    }
+
+
+def gather_trace(hostname, rank, clock):
+    # Must be called on all ranks together. Returns the merged Chrome
+    # trace on rank 0 (None elsewhere), with timestamps on rank 0's clock.
+    from dist_utils import all_gather_text
+
+    with _lock:
+        events = list(_events)
+    per_rank = [json.loads(text) for text in all_gather_text(json.dumps(events))]
+    if rank != 0:
+        return None
+
+    merged = []
+    starts = [e["ts"] - offset for events, offset in zip(per_rank, clock["offsets_us"]) for e in events]
+    base = min(starts, default=0)
+    for r, (events, offset, host) in enumerate(zip(per_rank, clock["offsets_us"], clock["hosts"])):
+        merged.append({"name": "process_name", "ph": "M", "pid": r, "tid": 0,
+                       "args": {"name": f"rank {r} ({host})"}})
+        merged.append({"name": "process_sort_index", "ph": "M", "pid": r, "tid": 0, "args": {"sort_index": r}})
+        for e in events:
+            merged.append({**e, "pid": r, "ts": e["ts"] - offset - base})
+    return {
+        "traceEvents": merged,
+        "displayTimeUnit": "ms",
+        "otherData": {"clock": clock, "base_us": base},
+    }
+
+
+def write_trace(path, trace):
+    with open(path, "w") as f:
+        json.dump(trace, f)
+
+
+def print_clock_report(clock):
+    print(f"\n🕰️  Clock offsets vs rank 0 ({clock['method']})")
+    for r, (host, offset, rtt) in enumerate(zip(clock["hosts"], clock["offsets_us"], clock["rtt_us"])):
+        print(f"   rank {r} ({host}): {offset / 1000:+.3f} ms" + (f" (rtt {rtt / 1000:.3f} ms)" if rtt else ""))
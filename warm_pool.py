@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import re
+import runpy
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+# Pre-warmed interpreter pool.
+#
+# `serve` imports the heavy modules once (mlx.core, mlx_lm and with it
+# transformers) and waits on a Unix socket. `run script.py args...` is a
+# thin client that mlx.launch starts instead of the script: it hands the
+# daemon its argv, environment, working directory and stdin/stdout/stderr
+# (SCM_RIGHTS). The daemon forks, and the child takes over that process
+# identity and runs the script with everything already imported. The
+# client forwards signals and exits with the child's status. Nothing
+# touches Metal or mx.distributed before the fork, so the child
+# initializes both itself from the launcher's environment. Without a
+# daemon, `run` simply execs the script.
+#
+#   python warm_pool.py up                          # start a daemon on every host
+#   mlx.launch ... warm_pool.py run distributed_inference.py
+#   python warm_pool.py profile --save startup.json  # import-time report
+#   python warm_pool.py profile --baseline startup.json
+
+PRELOAD = ["mlx.core", "mlx.nn", "mlx_lm", "mlx_lm.generate", "mlx_lm.models.cache", "transformers"]
+SOCKET_PATH = os.path.join("/tmp", f"mlx-warm-{os.environ.get('USER', 'user')}.sock")
+
+
+def _send_json(conn, message):
+    conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+def _run_child(conn, request, fds):
+    # In the forked child: become the launched process and run the script
+    os.dup2(fds[0], 0)
+    os.dup2(fds[1], 1)
+    os.dup2(fds[2], 2)
+    for fd in fds:
+        os.close(fd)
+    os.environ.clear()
+    os.environ.update(request["env"])
+    os.chdir(request["cwd"])
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    script = request["argv"][0]
+    sys.argv = list(request["argv"])
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    _send_json(conn, {"pid": os.getpid()})
+
+    code = 0
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        if not isinstance(e.code, (int, type(None))):
+            print(e.code, file=sys.stderr)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    try:
+        _send_json(conn, {"exit": code})
+    except OSError:
+        pass
+    os._exit(code)
+
+
+def serve(path=SOCKET_PATH, preload=PRELOAD):
+    start = time.perf_counter()
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print(f"⚠️  Could not preload {module}: {e}", flush=True)
+    print(f"🔥 Warm pool ready on {path} ({time.perf_counter() - start:.2f}s of imports paid once)",
+          flush=True)
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(64)
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # children are reaped automatically
+
+    served = 0
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                header, fds, _, _ = socket.recv_fds(conn, 1 << 20, 3)
+                request = json.loads(header.decode("utf-8"))
+            except (OSError, ValueError):
+                conn.close()
+                continue
+            if len(fds) != 3:
+                conn.close()
+                continue
+            if os.fork() == 0:
+                server.close()
+                _run_child(conn, request, fds)
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+            served += 1
+    except KeyboardInterrupt:
+        print(f"\n🧊 Warm pool stopped after {served} launches")
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def run(argv, path=SOCKET_PATH):
+    # Client: run argv in a forked warm child, or exec it cold
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(path)
+    except OSError:
+        os.execv(sys.executable, [sys.executable] + argv)
+
+    request = {"argv": argv, "env": dict(os.environ), "cwd": os.getcwd()}
+    socket.send_fds(conn, [json.dumps(request).encode("utf-8")], [0, 1, 2])
+    reply = conn.makefile("r", encoding="utf-8")
+    pid = json.loads(reply.readline() or "{}").get("pid")
+    if pid is None:
+        print("❌ Warm pool did not start the job", file=sys.stderr)
+        sys.exit(1)
+
+    def forward(signum, frame):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signum, forward)
+
+    line = reply.readline()
+    sys.exit(json.loads(line)["exit"] if line else 1)
+
+
+def import_profile(modules=("mlx.core", "mlx_lm")):
+    # Returns {module: (self_us, cumulative_us)} from python -X importtime
+    code = "; ".join(f"import {m}" for m in modules)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    profile = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            profile[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return profile
+
+
+def report_profile(profile, modules, top=15, baseline=None, threshold=0.2):
+    # Prints the slowest imports; returns the modules that regressed
+    total = sum(profile[m][1] for m in modules if m in profile)
+    print(f"⏱️  Import time for {', '.join(modules)}: {total / 1e6:.2f}s")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, (own, cumulative) in sorted(profile.items(), key=lambda kv: -kv[1][1])[:top]:
+        print(f"{cumulative / 1e3:>14.1f} {own / 1e3:>9.1f}  {name}")
+
+    regressions = []
+    if baseline:
+        for name in modules:
+            before, after = baseline.get(name, (0, 0))[1], profile.get(name, (0, 0))[1]
+            if before and after > before * (1 + threshold):
+                regressions.append(name)
+                print(f"\n❌ {name}: {before / 1e3:.0f}ms -> {after / 1e3:.0f}ms "
+                      f"(+{(after / before - 1):.0%}, threshold {threshold:.0%})")
+        if not regressions:
+            print(f"\n✅ No import regressions over {threshold:.0%} against baseline")
+    return regressions
+
+
+async def start_everywhere(hosts, python):
+    # Start a detached daemon on every host over the preflight transport
+    from deploy import _remote_path, default_remote_dir
+    from preflight import SSHTransport
+
+    transport = SSHTransport()
+    directory = _remote_path(default_remote_dir())
+    command = (f'cd {directory} && ([ -S "/tmp/mlx-warm-$USER.sock" ] || '
+               f'(nohup {python} warm_pool.py serve > /tmp/mlx-warm.log 2>&1 < /dev/null &))')
+    results = await asyncio.gather(*(transport.run(h["ssh"], command, timeout=15) for h in hosts))
+    for host, (code, _, err) in zip(hosts, results):
+        print(f"{'✅' if code == 0 else '❌'} {host['ssh']} {err.strip()[:120]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warmed interpreter pool for MLX launches")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="Preload modules and fork jobs on demand")
+    p.add_argument("--socket", default=SOCKET_PATH)
+    p.add_argument("--preload", default=",".join(PRELOAD))
+
+    p = sub.add_parser("run", help="Run a script in a warm child (falls back to cold start)")
+    p.add_argument("--socket", default=SOCKET_PATH)
+    p.add_argument("argv", nargs=argparse.REMAINDER)
+
+    p = sub.add_parser("up", help="Start a daemon on every host in hosts.json")
+    p.add_argument("--python", default=sys.executable,
+                   help="Interpreter on the hosts (default: this one; the conda env path matches across nodes)")
+
+    p = sub.add_parser("profile", help="Report import time of the startup modules")
+    p.add_argument("--modules", default="mlx.core,mlx_lm")
+    p.add_argument("--top", type=int, default=15)
+    p.add_argument("--save", default=None, help="Write the profile as a baseline JSON")
+    p.add_argument("--baseline", default=None, help="Fail if imports got slower than this baseline")
+    p.add_argument("--threshold", type=float, default=0.2)
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.socket, [m for m in args.preload.split(",") if m])
+    elif args.command == "run":
+        if not args.argv:
+            parser.error("run needs a script")
+        run(args.argv, args.socket)
+    elif args.command == "up":
+        from preflight import load_hosts
+        asyncio.run(start_everywhere(load_hosts(), args.python))
+    else:
+        modules = args.modules.split(",")
+        profile = import_profile(modules)
+        baseline = None
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        regressions = report_profile(profile, modules, args.top, baseline, args.threshold)
+        if args.save:
+            with open(args.save, "w") as f:
+                json.dump(profile, f, indent=1)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
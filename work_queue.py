@@ -0,0 +1,382 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+
+# Rank-0 work queue served over a small TCP side channel.
+#
+# Collectives are lockstep, so on-demand dispatch goes through a
+# JSON-lines socket instead: rank 0 owns the queue and every rank
+# (including rank 0) asks for the next item when it is idle. Fast
+# nodes simply come back more often.
+#
+# Any other op is a one-way notification (no reply) handed to the
+# server's on_message callback on rank 0, e.g. streamed token chunks.
+#
+# Failure handling (heartbeat= / request_timeout=): a rank that sleeps or
+# drops off the network would otherwise hang every collective until the
+# launcher is killed, losing all finished work. With a heartbeat each
+# client pings the server from a background thread, and ranks report
+# finished items with complete(), so results reach rank 0 as they are
+# produced. The server leases every item it hands out; when a rank misses
+# HEARTBEAT_MISSES heartbeats (or its connection drops) its leased items
+# go back to the front of the queue for the survivors, and an item held
+# longer than request_timeout is handed out again as well. The first
+# result for an item wins, late ones included. A rank declared lost
+# stays lost for the run: it gets no more work, and every client sees
+# the lost ranks once the queue drains (client.lost), so survivors can
+# skip the final collectives. Rank 0 owns the queue and cannot be lost.
+#
+# cancel() drops an item that is still queued; for one already handed
+# out, its index rides along on every get reply for CANCEL_TTL seconds
+# (client.cancelled) so the rank running it can stop.
+
+
+HEARTBEAT_MISSES = 3
+MAX_ATTEMPTS = 3
+CANCEL_TTL = 60.0
+
+
+def advertised_host():
+    # MLX_QUEUE_HOST wins; otherwise use the address of the interface
+    # that routes off-box (no packets are sent by a UDP connect).
+    host = os.environ.get("MLX_QUEUE_HOST")
+    if host:
+        return host
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.connect(("10.255.255.255", 1))
+            return probe.getsockname()[0]
+    except OSError:
+        return socket.gethostname()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        rank = None
+        for line in self.rfile:
+            if self.server.queue.closed:
+                return  # drop the connection so the client sees the queue is gone
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            rank = request.get("rank", rank)
+            reply = self.server.queue.dispatch(request)
+            if reply is None:
+                continue
+            self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+            self.wfile.flush()
+        if rank is not None and not self.server.queue.closed:
+            self.server.queue.disconnected(rank)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class WorkQueueServer:
+    def __init__(self, items, port=0, on_message=None, heartbeat=None, request_timeout=None,
+                 results_log=None):
+        self.on_message = on_message
+        self.pending = deque(enumerate(items))
+        self.total = len(self.pending)
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)  # a result arrived or an item failed
+        self.assigned = {}
+        self.closed = False
+        self.heartbeat = heartbeat
+        self.request_timeout = request_timeout
+        self.tolerant = heartbeat is not None or request_timeout is not None
+        self.items = dict(self.pending)
+        self.leases = {}     # index -> (rank, deadline or None)
+        self.timeouts = {}   # index -> per-item request timeout
+        self.attempts = {}
+        self.last_seen = {}
+        self.lost = set()
+        self.results = {}
+        self.failed = {}
+        self.events = []     # {"t", "event", "rank", "index"} for lost ranks and reassigned items
+        self.cancelled = {}  # index -> time cancelled, for ranks running it
+        self.results_log = results_log
+        if results_log:
+            self._resume(results_log)
+        self._server = _Server(("0.0.0.0", port), _Handler)
+        self._server.queue = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._stop = threading.Event()
+        self._reaper = threading.Thread(target=self._run_reaper, daemon=True)
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def done(self):
+        with self.lock:
+            return self._finished()
+
+    def _finished(self):
+        # Caller holds the lock
+        return len(self.results) + len(self.failed) >= self.total
+
+    def wait(self, timeout=None):
+        # Results arrive fire-and-forget on handler threads, so a rank can
+        # be past its last send before rank 0 has read it. False on timeout.
+        with self.changed:
+            return self.changed.wait_for(self._finished, timeout)
+
+    def start(self):
+        self._thread.start()
+        if self.tolerant:
+            self._reaper.start()
+        return self
+
+    def close(self):
+        self.closed = True
+        self._stop.set()
+        if self._thread.is_alive():
+            self._server.shutdown()  # waits for serve_forever, so only once it runs
+        self._server.server_close()
+
+    def _resume(self, path):
+        # Results of an earlier run for the same items are kept, not redone
+        try:
+            with open(path) as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except OSError:
+            return
+        for record in records:
+            if self.items.get(record["index"]) == record["item"]:
+                self.results[record["index"]] = record["result"]
+        self.pending = deque((i, item) for i, item in self.pending if i not in self.results)
+
+    def dispatch(self, request):
+        op = request.get("op")
+        rank = request.get("rank")
+        if rank is not None:
+            with self.lock:
+                self.last_seen[rank] = time.monotonic()
+        if op == "get":
+            return self.take(rank, request.get("n", 1))
+        if op == "heartbeat":
+            return None
+        if op == "result":
+            self.complete(rank, request["index"], request["result"])
+            return None
+        if self.on_message is not None:
+            self.on_message(request)
+        return None
+
+    def put(self, item, timeout=None):
+        # Add an item while ranks are pulling; returns its index.
+        # timeout overrides request_timeout for this item.
+        with self.lock:
+            index = self.total
+            self.pending.append((index, item))
+            self.items[index] = item
+            if timeout is not None:
+                self.timeouts[index] = timeout
+            self.total += 1
+            return index
+
+    def cancel(self, index):
+        with self.lock:
+            queued = len(self.pending)
+            self.pending = deque((i, item) for i, item in self.pending if i != index)
+            if len(self.pending) == queued:
+                self.cancelled[index] = time.monotonic()
+            if self.tolerant and index not in self.results:
+                self.leases.pop(index, None)
+                self.failed[index] = "cancelled"
+                self.changed.notify_all()
+
+    def take(self, rank, n=1):
+        with self.lock:
+            if rank in self.lost:
+                return {"items": [], "lost": sorted(self.lost)}
+            batch = []
+            while self.pending and len(batch) < n:
+                index, item = self.pending.popleft()
+                if index in self.results or index in self.failed:
+                    continue  # a late result arrived after it was requeued
+                batch.append((index, item))
+                if self.tolerant:
+                    timeout = self.timeouts.get(index, self.request_timeout)
+                    self.leases[index] = (rank, time.monotonic() + timeout if timeout else None)
+                    self.attempts[index] = self.attempts.get(index, 0) + 1
+            self.assigned[rank] = self.assigned.get(rank, 0) + len(batch)
+            reply = {"items": batch}
+            if self.cancelled:
+                expired = time.monotonic() - CANCEL_TTL
+                self.cancelled = {i: t for i, t in self.cancelled.items() if t > expired}
+            if self.cancelled:
+                reply["cancel"] = sorted(self.cancelled)
+            if not batch and self.tolerant and self.leases:
+                reply["wait"] = True  # other ranks' items may still come back
+            elif not batch and self.tolerant:
+                reply["lost"] = sorted(self.lost)
+            return reply
+
+    def complete(self, rank, index, result):
+        # First result wins, even from a rank already declared lost
+        with self.lock:
+            self.leases.pop(index, None)
+            if index in self.results:
+                return
+            self.results[index] = result
+            self.failed.pop(index, None)
+            self.changed.notify_all()
+        if self.results_log:
+            with open(self.results_log, "a") as f:
+                f.write(json.dumps({"index": index, "item": self.items.get(index), "rank": rank,
+                                    "result": result}) + "\n")
+
+    def disconnected(self, rank):
+        # A closed connection with items still leased means the rank died;
+        # without, the rank simply finished and stops heartbeating.
+        # Rank 0 hosts the queue, so it is never declared lost.
+        with self.lock:
+            if rank != 0 and any(owner == rank for owner, _ in self.leases.values()):
+                self._lose(rank, "disconnected")
+            self.last_seen.pop(rank, None)
+
+    def _lose(self, rank, event):
+        # Caller holds the lock
+        if rank in self.lost:
+            return
+        self.lost.add(rank)
+        self.events.append({"t": time.time(), "event": event, "rank": rank, "index": None})
+        for index in [i for i, (owner, _) in self.leases.items() if owner == rank]:
+            self._requeue(index, "reassigned")
+
+    def _requeue(self, index, event):
+        # Caller holds the lock. Requeued items go first; items that keep
+        # timing out are given up after MAX_ATTEMPTS.
+        rank, _ = self.leases.pop(index)
+        self.events.append({"t": time.time(), "event": event, "rank": rank, "index": index})
+        if self.attempts.get(index, 0) >= MAX_ATTEMPTS:
+            self.failed[index] = f"gave up after {self.attempts[index]} attempts"
+            self.changed.notify_all()
+        else:
+            self.pending.appendleft((index, self.items[index]))
+
+    def reap(self, now=None):
+        # One pass: lose silent ranks (never rank 0), requeue expired leases
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.heartbeat is not None:
+                limit = self.heartbeat * HEARTBEAT_MISSES
+                for rank, seen in list(self.last_seen.items()):
+                    if rank != 0 and rank not in self.lost and now - seen > limit:
+                        self._lose(rank, "missed heartbeats")
+            for index, (_, deadline) in list(self.leases.items()):
+                if deadline is not None and now > deadline:
+                    self._requeue(index, "timed out")
+
+    def _run_reaper(self):
+        interval = min(self.heartbeat or 1.0, 1.0)
+        while not self._stop.wait(interval):
+            self.reap()
+
+
+class WorkQueueClient:
+    def __init__(self, host, port, rank, heartbeat=None, poll=0.2):
+        self.rank = rank
+        self.poll = poll
+        self.lost = []
+        self.cancelled = []
+        self._conn = socket.create_connection((host, port), timeout=30)
+        self._conn.settimeout(None)
+        self._conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._conn.makefile("r", encoding="utf-8")
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        if heartbeat:
+            threading.Thread(target=self._beat, args=(heartbeat,), daemon=True).start()
+
+    def _send(self, message):
+        # Heartbeats share the socket, so whole lines go out under a lock
+        with self._send_lock:
+            self._conn.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+    def _beat(self, interval):
+        # Runs beside generation: a busy rank is alive, a sleeping Mac is not
+        while not self._stop.wait(interval):
+            try:
+                self._send({"op": "heartbeat", "rank": self.rank})
+            except OSError:
+                return
+
+    def request(self, message):
+        self._send(message)
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("work queue closed the connection")
+        return json.loads(line)
+
+    def notify(self, message):
+        # Fire-and-forget; the server never replies to notifications
+        self._send(message)
+
+    def complete(self, index, result):
+        # Hand a finished item's result to rank 0 (releases its lease)
+        self._send({"op": "result", "rank": self.rank, "index": index, "result": result})
+
+    def _get(self, n):
+        reply = self.request({"op": "get", "rank": self.rank, "n": n})
+        self.cancelled = reply.get("cancel", [])
+        return reply
+
+    def get(self, n=1):
+        # n=0 takes nothing but still refreshes self.cancelled
+        return [tuple(item) for item in self._get(n)["items"]]
+
+    def _next(self, n):
+        # Waits while other ranks hold items that may still be reassigned
+        while True:
+            reply = self._get(n)
+            if reply["items"] or not reply.get("wait"):
+                self.lost = reply.get("lost", self.lost)
+                return [tuple(item) for item in reply["items"]]
+            time.sleep(self.poll)
+
+    def __iter__(self):
+        while True:
+            batch = self._next(1)
+            if not batch:
+                return
+            yield batch[0]
+
+    def batches(self, n):
+        # Up to n items per request, for batched generation
+        while True:
+            batch = self._next(n)
+            if not batch:
+                return
+            yield batch
+
+    def close(self):
+        self._stop.set()
+        self._reader.close()
+        self._conn.close()
+
+
+def open_work_queue(items, rank, port=0, on_message=None, heartbeat=None, request_timeout=None,
+                    results_log=None):
+    # Rank 0 starts the server and broadcasts its address; every rank
+    # then connects a client. Must be called on all ranks together.
+    from dist_utils import broadcast_text  # pulls in mlx; the queue itself does not need it
+
+    server = None
+    address = None
+    if rank == 0:
+        server = WorkQueueServer(items, port, on_message, heartbeat, request_timeout, results_log).start()
+        address = f"{advertised_host()}:{server.port}"
+    address = broadcast_text(address, rank)
+    host, port = address.rsplit(":", 1)
+    client = WorkQueueClient(host, int(port), rank, heartbeat)
+    return server, client